@@ -0,0 +1,69 @@
+"""Restoring a few values out of many stored ones.
+
+Compares getting a handful of random models from an archive with
+unserializing a JSON Lines dump of all of them to pick the same ones,
+and reports the time spent writing both with a single batch append.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import random
+import shutil
+import tempfile
+
+from serialization import archive, json_
+
+from benchmarks.common import measure, report
+from benchmarks.models import models
+
+SIZE = 20000
+PICKED = 10
+
+
+def main():
+    values = [(u"%d" % i, m) for i, m in enumerate(models(SIZE))]
+    picked = random.Random(42).sample([k for k, _ in values], PICKED)
+    directory = tempfile.mkdtemp()
+    try:
+        dump_path = os.path.join(directory, "dump.jsonl")
+        path = os.path.join(directory, "archive.dat")
+
+        def write_dump():
+            with open(dump_path, "w") as fp:
+                json_.Serializer().dump_lines((m for _, m in values), fp)
+
+        def write_archive():
+            for name in (path, path + archive.INDEX_SUFFIX):
+                if os.path.exists(name):
+                    os.remove(name)
+            with archive.Archive(path) as store:
+                store.put_many(values)
+
+        dump_time = measure(write_dump)
+        report("jsonl write %d" % SIZE, dump_time)
+        report("archive put_many %d" % SIZE, measure(write_archive),
+               dump_time)
+
+        positions = set(int(k) for k in picked)
+
+        def read_dump():
+            with open(dump_path) as fp:
+                return [m for i, m in
+                        enumerate(json_.Unserializer().load_lines(fp))
+                        if i in positions]
+
+        def read_archive():
+            with archive.Archive(path, readonly=True) as store:
+                return [store[k] for k in picked]
+
+        dump_time = measure(read_dump)
+        report("jsonl load %d of %d" % (PICKED, SIZE), dump_time)
+        report("archive get %d of %d" % (PICKED, SIZE),
+               measure(read_archive), dump_time)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
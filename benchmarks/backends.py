@@ -0,0 +1,88 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+"""Comparing the JSON backends installed.
+
+The documents are made of the values the symmetry tests use, see
+tests/utils.py, repeated to get a meaningful size. Serialization and
+unserialization go through the json_ converters so the time spent
+packing and restoring is included, the speedups are relative to the
+standard library backend. Integers too big for 64 bits are left out,
+some backends hand over the documents containing them to the standard
+library backend.
+"""
+
+from __future__ import absolute_import, print_function
+
+from serialization import json_
+from serialization.interface import Capabilities
+
+from tests.utils import ConverterTestHelper
+
+from benchmarks.common import measure, report
+
+REPEAT = 200
+REPEAT_MEASURE = 7
+
+
+def corpus(helper, caps):
+    values = []
+    for _, examples, _ in helper.symmetry_table(caps):
+        values.extend(examples)
+    return values * REPEAT
+
+
+def best(fun):
+    return measure(fun, repeat=REPEAT_MEASURE)
+
+
+def main():
+    helper = ConverterTestHelper()
+    caps = json_.JSON_CONVERTER_CAPS - set([Capabilities.long_values])
+    value = corpus(helper, caps)
+    names = [json_.StdlibBackend.name]
+    names.extend(n for n in json_.available_backends() if n not in names)
+    references = {}
+    for name in names:
+        serializer = json_.Serializer(externalizer=helper.externalizer,
+                                      backend=name)
+        unserializer = json_.Unserializer(externalizer=helper.externalizer,
+                                          backend=name)
+        seconds = best(lambda: serializer.convert(value))
+        references.setdefault("convert", seconds)
+        report("%s convert() values=%d" % (name, len(value)),
+               seconds, references["convert"])
+        data = serializer.convert(value)
+        seconds = best(lambda: unserializer.convert(data))
+        references.setdefault("unserialize", seconds)
+        report("%s unserialize convert() size=%d" % (name, len(data)),
+               seconds, references["unserialize"])
+        packed = unserializer.pre_convertion(data)
+        seconds = best(lambda: serializer.post_convertion(packed))
+        references.setdefault("encode", seconds)
+        report("%s encode only" % (name, ), seconds, references["encode"])
+        seconds = best(lambda: unserializer.pre_convertion(data))
+        references.setdefault("decode", seconds)
+        report("%s decode only" % (name, ), seconds, references["decode"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+"""Converting a lot of small messages with the same configuration.
+
+Compares converting the messages one by one with convert() against
+converting them in batch with convert_many().
+"""
+
+from __future__ import absolute_import, print_function
+
+from serialization import json_
+
+from benchmarks.common import measure, report
+
+COUNT = 20000
+
+
+def messages(count):
+    return [{"id": index, "kind": "event", "tags": ["a", "b"],
+             "payload": {"value": index * 0.5, "ok": True}}
+            for index in range(count)]
+
+
+def tiny_messages(count):
+    return [[index, "ping"] for index in range(count)]
+
+
+def main():
+    serializer = json_.Serializer(sort_keys=True)
+    unserializer = json_.Unserializer()
+    for name, values in (("small", messages(COUNT)),
+                         ("tiny", tiny_messages(COUNT))):
+        single = measure(lambda: [serializer.convert(v) for v in values])
+        report("%s convert() x%d" % (name, COUNT), single)
+        batch = measure(lambda: list(serializer.convert_many(values)))
+        report("%s convert_many() x%d" % (name, COUNT), batch, single)
+
+        data = list(serializer.convert_many(values))
+        single = measure(lambda: [unserializer.convert(d) for d in data])
+        report("%s unserialize convert() x%d" % (name, COUNT), single)
+        batch = measure(lambda: list(unserializer.convert_many(data)))
+        report("%s unserialize convert_many() x%d" % (name, COUNT),
+               batch, single)
+
+
+if __name__ == "__main__":
+    main()
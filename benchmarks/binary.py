@@ -0,0 +1,69 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+"""Comparing the MessagePack and CBOR converters with the JSON converters.
+
+Reports the size of the documents and the time spent converting and
+unserializing primitive values, formatable models, dictionaries and
+binary blobs. Speedups are relative to the JSON converters.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+
+from serialization import cbor, json_, msgpack_
+
+from benchmarks.common import measure, report
+from benchmarks.models import models
+from benchmarks.primitives import primitives
+
+SIZE = 100000
+
+
+def corpus(size):
+    yield "primitives", primitives(size)
+    yield "models", models(size // 10)
+    yield "dicts", [dict((u"k%d" % i, [i * 0.5, i]) for i in range(10))
+                    for _ in range(size // 10)]
+    yield "blobs", [os.urandom(1024) for _ in range(size // 100)]
+
+
+def main():
+    for kind, values in corpus(SIZE):
+        references = {}
+        for module in (json_, msgpack_, cbor):
+            name = module.__name__.split('.')[-1].rstrip('_')
+            serializer = module.Serializer()
+            unserializer = module.Unserializer()
+            data = serializer.convert(values)
+            print("%s %s document: %d bytes" % (name, kind, len(data)))
+            seconds = measure(lambda: serializer.convert(values))
+            references.setdefault("convert", seconds)
+            report("%s %s convert()" % (name, kind),
+                   seconds, references["convert"])
+            seconds = measure(lambda: unserializer.convert(data))
+            references.setdefault("unserialize", seconds)
+            report("%s %s unserialize" % (name, kind),
+                   seconds, references["unserialize"])
+
+
+if __name__ == "__main__":
+    main()
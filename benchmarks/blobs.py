@@ -0,0 +1,85 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+"""Serializing large binary values with the different bytes encodings.
+
+Two kinds of blobs are used: random bytes and text with a single
+invalid byte at the end, the worst case for the UTF8 encoding which
+decodes the whole blob before falling back to base64. The blobs are
+also given as bytearray and memoryview, they should not cost more
+than bytes, and kept out of band. Speedups are relative to the UTF8
+encoding.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+
+from serialization import json_
+
+from benchmarks.common import measure, report
+
+SIZES = [1, 10, 100]  # In megabytes
+ENCODINGS = [json_.BYTES_UTF8, json_.BYTES_BASE64,
+             json_.BYTES_BASE85, json_.BYTES_HEX]
+
+
+def blobs(size):
+    size *= 1024 * 1024
+    yield "random", os.urandom(size)
+    yield "text", b"spam " * (size // 5) + b"\xff"
+
+
+def main():
+    unserializer = json_.Unserializer()
+    for size in SIZES:
+        for kind, blob in blobs(size):
+            references = {}
+            for encoding in ENCODINGS:
+                serializer = json_.Serializer(bytes_encoding=encoding)
+                title = "%s %s %dMB" % (encoding, kind, size)
+                seconds = measure(lambda: serializer.convert(blob))
+                references.setdefault("convert", seconds)
+                report(title + " convert()", seconds, references["convert"])
+                data = serializer.convert(blob)
+                seconds = measure(lambda: unserializer.convert(data))
+                references.setdefault("unserialize", seconds)
+                report(title + " unserialize", seconds,
+                       references["unserialize"])
+                del data
+            serializer = json_.Serializer()
+            seconds = measure(lambda: serializer.convert_buffers(blob))
+            report("out-of-band %s %dMB convert_buffers()" % (kind, size),
+                   seconds, references["convert"])
+            data, buffers = serializer.convert_buffers(blob)
+            seconds = measure(
+                lambda: unserializer.convert_buffers(data, buffers))
+            report("out-of-band %s %dMB unserialize" % (kind, size),
+                   seconds, references["unserialize"])
+            serializer = json_.Serializer(bytes_encoding=json_.BYTES_BASE64)
+            for buffer in (bytearray(blob), memoryview(blob)):
+                seconds = measure(lambda: serializer.convert(buffer))
+                report("%s %s %dMB %s" % (json_.BYTES_BASE64, kind, size,
+                                          type(buffer).__name__),
+                       seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+"""Helpers shared by the benchmark scripts.
+
+The benchmarks are plain scripts to be run from the repository root::
+
+    python -m benchmarks.deep
+"""
+
+from __future__ import absolute_import, print_function
+
+import timeit
+
+
+def measure(fun, repeat=3, number=1):
+    """Returns the best time in seconds of a single call to fun."""
+    return min(timeit.repeat(fun, repeat=repeat, number=number)) / number
+
+
+def report(title, seconds, reference=None):
+    if reference is None:
+        print("%-48s %10.4fs" % (title, seconds))
+    else:
+        print("%-48s %10.4fs %7.2fx" % (title, seconds, reference / seconds))
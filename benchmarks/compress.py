@@ -0,0 +1,94 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+"""Compressing the output of the JSON and s-expression converters.
+
+For every codec and level, reports the compressed size of a list of
+formatable models and the time spent compressing and decompressing it,
+the s-expressions are encoded with banana first. Then reports the size
+of small documents compressed one by one, with and without a preset
+dictionary trained on other documents. Speedups are relative to the
+uncompressed size and to zlib at its default level.
+"""
+
+from __future__ import absolute_import, print_function
+
+from serialization import banana, compression, json_, sexp
+
+from benchmarks.common import measure, report
+from benchmarks.models import models
+
+SIZE = 20000
+SAMPLES = 500
+LEVELS = {compression.ZLIB: [1, 6, 9],
+          compression.LZMA: [0, 6, 9],
+          compression.ZSTD: [1, 3, 9, 19]}
+
+
+def outputs(values):
+    yield "json", json_.Serializer().convert(values).encode("utf-8")
+    encoder = banana.Encoder()
+    yield "sexp", encoder.convert(sexp.Serializer().convert(values))
+
+
+def main():
+    codecs = compression.available_codecs()
+    for kind, data in outputs(models(SIZE)):
+        print("%s document: %d bytes" % (kind, len(data)))
+        reference = compression.get_codec()
+        compressed = reference.compress(data)
+        compress_time = measure(lambda: reference.compress(data))
+        decompress_time = measure(lambda: reference.decompress(compressed))
+        for name in codecs:
+            for level in LEVELS[name]:
+                codec = compression.get_codec(name, level=level)
+                compressed = codec.compress(data)
+                title = "%s %s level=%d" % (kind, name, level)
+                print("%-48s %10d bytes %7.2fx"
+                      % (title, len(compressed),
+                         len(data) / float(len(compressed))))
+                report(title + " compress", measure(
+                    lambda: codec.compress(data)), compress_time)
+                report(title + " decompress", measure(
+                    lambda: codec.decompress(compressed)), decompress_time)
+
+    serializer = json_.Serializer()
+    documents = [serializer.convert(m).encode("utf-8")
+                 for m in models(SAMPLES * 2)]
+    samples, documents = documents[:SAMPLES], documents[SAMPLES:]
+    size = sum(len(d) for d in documents)
+    print("%d small documents: %d bytes" % (len(documents), size))
+    for name in codecs:
+        try:
+            dictionary = compression.train_dictionary(samples, name)
+        except ValueError:
+            dictionary = None
+        options = [None] if dictionary is None else [None, dictionary]
+        for preset in options:
+            codec = compression.get_codec(name, dictionary=preset)
+            compressed = sum(len(codec.compress(d)) for d in documents)
+            title = "small %s%s" % (name, "" if preset is None
+                                    else " dictionary=%d" % len(preset))
+            print("%-48s %10d bytes %7.2fx"
+                  % (title, compressed, size / float(compressed)))
+
+
+if __name__ == "__main__":
+    main()
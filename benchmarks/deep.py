@@ -0,0 +1,76 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+"""Serializing and unserializing deeply nested values.
+
+The recursive engines are limited by the interpreter recursion limit,
+the iterative ones are only limited by memory. The json format is not
+measured because the standard library json module is recursive itself.
+"""
+
+from __future__ import absolute_import, print_function
+
+import sys
+
+from serialization import pytree, sexp
+
+from benchmarks.common import measure, report
+
+DEPTHS = [50, 10000, 50000, 100000]
+
+
+def nested(depth):
+    value = []
+    for index in range(depth):
+        value = [{"index": index, "child": value}]
+    return value
+
+
+def main():
+    limit = sys.getrecursionlimit()
+    for module in (pytree, sexp):
+        name = module.__name__.split('.')[-1]
+        for depth in DEPTHS:
+            value = nested(depth)
+            recursive = None
+            if depth * 10 < limit:
+                serializer = module.Serializer()
+                recursive = measure(lambda: serializer.convert(value))
+                report("%s recursive serialize depth=%d"
+                       % (name, depth), recursive)
+            serializer = module.Serializer(iterative=True)
+            report("%s iterative serialize depth=%d" % (name, depth),
+                   measure(lambda: serializer.convert(value)), recursive)
+
+            data = serializer.convert(value)
+            recursive = None
+            if depth * 10 < limit:
+                unserializer = module.Unserializer()
+                recursive = measure(lambda: unserializer.convert(data))
+                report("%s recursive unserialize depth=%d"
+                       % (name, depth), recursive)
+            unserializer = module.Unserializer(iterative=True)
+            report("%s iterative unserialize depth=%d" % (name, depth),
+                   measure(lambda: unserializer.convert(data)), recursive)
+
+
+if __name__ == "__main__":
+    main()
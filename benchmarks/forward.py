@@ -0,0 +1,57 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+"""Unserializing values referenced before being defined.
+
+When the items of a dictionary are not unpacked in the order they were
+packed, dereferences can come before the reference they point to and
+their unpacking has to be delayed. Reports the time spent restoring
+a chain of such items, it should grow linearly with its length.
+"""
+
+from __future__ import absolute_import, print_function
+
+from serialization import pytree
+
+from benchmarks.common import measure, report
+
+SIZES = [1000, 10000, 100000]
+
+
+def forward_chain(size):
+    # Every item is a tuple containing the value of the next item
+    data = dict((index, pytree.Reference(index,
+                                         (pytree.Dereference(index + 1), )))
+                for index in range(size - 1))
+    data[size - 1] = pytree.Reference(size - 1, ())
+    return data
+
+
+def main():
+    unserializer = pytree.Unserializer()
+    for size in SIZES:
+        data = forward_chain(size)
+        seconds = measure(lambda: unserializer.convert(data))
+        report("forward references size=%d" % size, seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+"""Packing and restoring documents made of many instances.
+
+The instances are plain serializable objects, their snapshot is their
+dictionary. Reports the time and the peak of memory allocated while
+packing them with json_.PreSerializer and while unserializing the JSON
+document, run it before and after a change to the instance handling.
+Short-lived copies show in the time rather than in the peak, which is
+mostly made of the values being converted.
+"""
+
+from __future__ import absolute_import, print_function
+
+import serialization
+from serialization import json_
+
+from benchmarks.common import measure, report
+from benchmarks.shared import peak_memory
+
+SIZES = [10000, 100000]
+
+
+@serialization.register
+class Record(serialization.Serializable):
+
+    type_name = "benchmarks.Record"
+
+    def __init__(self, index):
+        self.index = index
+        self.name = u"record %d" % index
+        self.value = index * 0.5
+        self.flags = [index % 2 == 0, None]
+
+
+def main():
+    preserializer = json_.PreSerializer()
+    serializer = json_.Serializer()
+    unserializer = json_.Unserializer()
+    for size in SIZES:
+        values = [Record(index) for index in range(size)]
+        seconds = measure(lambda: preserializer.convert(values))
+        peak = peak_memory(lambda: preserializer.convert(values))
+        report("pack instances=%d peak=%.1fMB"
+               % (size, peak / 1024.0 / 1024.0), seconds)
+        data = serializer.convert(values)
+        seconds = measure(lambda: unserializer.convert(data))
+        peak = peak_memory(lambda: unserializer.convert(data))
+        report("unserialize instances=%d peak=%.1fMB"
+               % (size, peak / 1024.0 / 1024.0), seconds)
+
+
+if __name__ == "__main__":
+    main()
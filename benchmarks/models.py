@@ -0,0 +1,85 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+"""Serializing lists of formatable models with the JSON converters.
+
+Every model has a few scalar fields, a list and a nested model, like
+the records of a bulk export. Reports the time spent converting and
+unserializing the list, and the same values as plain dictionaries for
+comparison.
+"""
+
+from __future__ import absolute_import, print_function
+
+import serialization
+from serialization import formatable, json_
+
+from benchmarks.common import measure, report
+
+SIZES = [1000, 10000, 100000]
+
+
+@serialization.register
+class Address(formatable.Formatable):
+
+    type_name = "benchmarks.Address"
+
+    formatable.field("street", None)
+    formatable.field("city", u"")
+
+
+@serialization.register
+class OrderLine(formatable.Formatable):
+
+    type_name = "benchmarks.OrderLine"
+
+    formatable.field("product", None)
+    formatable.field("quantity", 1)
+    formatable.field("price", 0.0, "unit_price")
+    formatable.field("tags", None)
+    formatable.field("address", None)
+    formatable.field("note", None)
+
+
+def models(size):
+    return [OrderLine(product=u"product %d" % index, quantity=index,
+                      price=index * 0.5, tags=[u"new", index],
+                      address=Address(street=u"Main St. %d" % index))
+            for index in range(size)]
+
+
+def main():
+    serializer = json_.Serializer()
+    unserializer = json_.Unserializer()
+    for size in SIZES:
+        values = models(size)
+        seconds = measure(lambda: serializer.convert(values))
+        report("models convert() size=%d" % size, seconds)
+        data = serializer.convert(values)
+        seconds = measure(lambda: unserializer.convert(data))
+        report("models unserialize size=%d" % size, seconds)
+        plain = [dict(v.snapshot(), address=v.address.snapshot())
+                 for v in values]
+        seconds = measure(lambda: serializer.convert(plain))
+        report("dictionaries convert() size=%d" % size, seconds)
+
+
+if __name__ == "__main__":
+    main()
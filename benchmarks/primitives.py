@@ -0,0 +1,54 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+"""Unserializing a list of a million primitive values.
+
+Mostly measures the detection of the values passing through unchanged.
+"""
+
+from __future__ import absolute_import, print_function
+
+from serialization import json_, pytree, sexp
+
+from benchmarks.common import measure, report
+
+COUNT = 1000000
+
+
+def primitives(count):
+    values = []
+    for index in range(count // 4):
+        values.extend([index, index * 0.5, "s%d" % (index % 100), True])
+    return values
+
+
+def main():
+    values = primitives(COUNT)
+    for module in (json_, pytree, sexp):
+        name = module.__name__.split('.')[-1].rstrip('_')
+        data = module.Serializer().convert(values)
+        unserializer = module.Unserializer()
+        report("%s unserialize %d primitives" % (name, COUNT),
+               measure(lambda: unserializer.convert(data)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+"""Serializing graphs with a lot of shared values.
+
+Reports the time and the peak of memory allocated while serializing,
+run it before and after a change to the reference handling to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import tracemalloc
+
+from serialization import pytree
+
+from benchmarks.common import measure, report
+
+SIZES = [10000, 100000, 300000]
+
+
+def shared(size):
+    nodes = [[index] for index in range(size)]
+    # Every node is referenced twice, the second time from another node
+    pairs = [(node, nodes[index - 1]) for index, node in enumerate(nodes)]
+    return [nodes, pairs]
+
+
+def peak_memory(fun):
+    tracemalloc.start()
+    try:
+        fun()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    for size in SIZES:
+        value = shared(size)
+        for title, options in (("two-pass", {}),
+                               ("single-pass", {"single_pass": True})):
+            serializer = pytree.Serializer(**options)
+            seconds = measure(lambda: serializer.convert(value))
+            peak = peak_memory(lambda: serializer.convert(value))
+            report("%s serialize size=%d peak=%.1fMB"
+                   % (title, size, peak / 1024.0 / 1024.0), seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,6 @@ from serialization.base import (register, lookup,
                                 ImmutableSerializable,
                                 Serializable, MetaSerializable,
                                 Externalizer, get_registry,
-                                freeze_tag, VersionAdapter)
+                                freeze_tag, VersionAdapter, Pool)
 
 from serialization.interface import *
@@ -22,9 +22,35 @@
 
 from __future__ import absolute_import
 
+import functools
+
 from zope.interface import adapter, interface, declarations
 
-registry = adapter.AdapterRegistry()
+
+class _Changes(object):
+    """Counts the changes of the registry and of the declarations
+    it is subscribed to."""
+
+    def __init__(self):
+        self.count = 0
+
+    def changed(self, originally_changed):
+        self.count += 1
+
+
+_changes = _Changes()
+
+
+class _Registry(adapter.AdapterRegistry):
+    """Adapter registry counting its changes, the adapter lookups
+    cached by type are only valid until it changes."""
+
+    def changed(self, originally_changed):
+        super(_Registry, self).changed(originally_changed)
+        _changes.count += 1
+
+
+registry = _Registry()
 
 
 def _lookup_adapter_hook(iface, ob):
@@ -60,3 +86,45 @@ def register_adapter(registry, adapter_factory, adapted, *interfaces):
         registry.register([adapted_], iface, '', adapter_factory)
 
     return adapter_factory
+
+
+def generation():
+    """Returns a value changing each time adapters get registered
+    or the interfaces implemented by a looked up class change,
+    used to invalidate the adapter lookups cached by type."""
+    return len(interface.adapter_hooks), _changes.count
+
+
+def lookup_factory(cls, iface):
+    """Returns a function adapting any instance of the specified class
+    to the specified interface, or None if it cannot be known without
+    the instance itself. The function returns None for the instances
+    providing interfaces directly, that should be adapted themselves."""
+    spec = declarations.implementedBy(cls)
+    # Declarations made later on the class change the generation
+    spec.subscribe(_changes)
+    if iface.implementedBy(cls):
+        return _itself
+    if getattr(cls, "__conform__", None) is not None:
+        return None
+    if interface.adapter_hooks != [_lookup_adapter_hook]:
+        # Unknown hooks may adapt depending on the instance
+        return None
+    factory = registry.lookup1(spec, iface)
+    if factory is None:
+        return None
+    return functools.partial(_adapt_by_class, factory)
+
+
+def _itself(value):
+    return value
+
+
+def _adapt_by_class(factory, value):
+    # Interfaces provided by the instance itself may select another
+    # adapter than the one of its class
+    provides = getattr(value, "__provides__", None)
+    if provides is not None and \
+            not isinstance(provides, declarations.Implements):
+        return None
+    return factory(value)
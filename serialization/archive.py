@@ -0,0 +1,301 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+
+"""Archive of serialized values read by key from a memory-mapped file.
+
+The values are serialized one by one and appended to a data file, the
+offset and size of each one is appended to an index file along with its
+key. The index is loaded in memory when the archive is opened and the
+data file is memory-mapped, so getting a value only reads and
+unserializes its own data. Putting a key again or deleting it only
+appends to the files, compact() rewrites them without the data no
+longer referenced.
+
+Any converters can be used as long as the serializer converts to bytes
+or text, for example compressed JSON::
+
+    archive = Archive(path, Compressor(converter=json_.Serializer()),
+                      Decompressor(converter=json_.Unserializer()))
+    archive.put_many((user.id, user) for user in users)
+    user = archive[user_id]
+
+Archives are not thread-safe and the files should only be opened by
+a single writer at a time.
+"""
+
+from __future__ import absolute_import
+
+import mmap
+import os
+import struct
+
+from past.types import unicode
+from future.utils import PY3
+
+from serialization import json_
+
+INDEX_SUFFIX = ".idx"
+
+# Size of the deleted values in the index
+DELETED = 0xffffffff
+
+
+class Archive(object):
+    """Archive of values keyed by text stored in the data file path and
+    the index file path + INDEX_SUFFIX, created if they do not exist.
+    By default the values are serialized to JSON."""
+
+    def __init__(self, path, serializer=None, unserializer=None,
+                 readonly=False):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.readonly = readonly
+        self._serializer = serializer or json_.Serializer()
+        self._unserializer = unserializer or json_.Unserializer()
+        self._index = {}  # {KEY: (OFFSET, SIZE)}
+        self._data = None
+        self._index_file = None
+        self._map = None
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(list(self._index))
+
+    def __getitem__(self, key):
+        location = self._index.get(key)
+        if location is None:
+            raise KeyError(key)
+        return self._unserializer.convert(self._read(*location))
+
+    ### Public Methods ###
+
+    def keys(self):
+        return list(self._index)
+
+    def get(self, key, default=None):
+        """Returns the value with the specified key unserialized
+        from its data only, or default if there is none."""
+        location = self._index.get(key)
+        if location is None:
+            return default
+        return self._unserializer.convert(self._read(*location))
+
+    def items(self):
+        """Returns a generator of the keys and values in the order
+        they are stored in the data file."""
+        locations = sorted(self._index.items(), key=lambda i: i[1])
+        for key, location in locations:
+            yield key, self._unserializer.convert(self._read(*location))
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        """Serializes and appends the values of the (KEY, VALUE) pairs,
+        the data and the index records are written in bulk."""
+        self._check_writable()
+        items = list(items)
+        keys = [self._encode_key(k) for k, _ in items]
+        values = [v for _, v in items]
+        convert_many = getattr(self._serializer, "convert_many", None)
+        if convert_many is not None:
+            converted = convert_many(values)
+        else:
+            # Plain converters like compression.Compressor
+            converted = [self._serializer.convert(v) for v in values]
+        # Python 2 files do not return the offset from seek()
+        self._data.seek(0, os.SEEK_END)
+        offset = self._data.tell()
+        blocks = []
+        records = []
+        locations = []
+        for (key, _), encoded, data in zip(items, keys, converted):
+            if isinstance(data, unicode):
+                data = data.encode("utf-8")
+            if not isinstance(data, bytes):
+                raise TypeError("Archives need a serializer converting to "
+                                "bytes or text, got %s"
+                                % type(data).__name__)
+            if len(data) >= DELETED:
+                raise ValueError("Value of key %r too big to be archived"
+                                 % (key, ))
+            blocks.append(data)
+            records.append(_record(encoded, offset, len(data)))
+            locations.append((key, (offset, len(data))))
+            offset += len(data)
+        # The data is written first so the index never refers to missing
+        # data if the process stops in between.
+        self._data.write(b"".join(blocks))
+        self._data.flush()
+        self._index_file.write(b"".join(records))
+        self._index_file.flush()
+        self._index.update(locations)
+
+    def delete(self, key):
+        self._check_writable()
+        if key not in self._index:
+            raise KeyError(key)
+        self._index_file.write(_record(self._encode_key(key), 0, DELETED))
+        self._index_file.flush()
+        del self._index[key]
+
+    def compact(self):
+        """Rewrites the files with only the data of the current values,
+        in the order they are stored. The files are replaced one after
+        the other, they are not consistent if the process stops in
+        between."""
+        self._check_writable()
+        data_path = self.path + ".compact"
+        index_path = self.index_path + ".compact"
+        locations = sorted(self._index.items(), key=lambda i: i[1])
+        with open(data_path, "wb") as data:
+            with open(index_path, "wb") as index_file:
+                offset = 0
+                for key, (start, size) in locations:
+                    data.write(self._read(start, size))
+                    index_file.write(
+                        _record(self._encode_key(key), offset, size))
+                    offset += size
+        self._close()
+        _replace(data_path, self.path)
+        _replace(index_path, self.index_path)
+        self._open()
+
+    def size(self):
+        """Returns the size of the data file in bytes."""
+        return os.path.getsize(self.path)
+
+    def flush(self):
+        if self._data is not None and not self.readonly:
+            self._data.flush()
+            self._index_file.flush()
+
+    def close(self):
+        self._close()
+
+    ### Private Methods ###
+
+    def _open(self):
+        mode = "rb" if self.readonly else "a+b"
+        self._data = open(self.path, mode)
+        self._index_file = open(self.index_path, mode)
+        self._index = self._load_index()
+
+    def _close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._data is not None:
+            self._data.close()
+            self._index_file.close()
+            self._data = None
+            self._index_file = None
+
+    def _load_index(self):
+        self._index_file.seek(0)
+        data = self._index_file.read()
+        index = {}
+        pos = 0
+        while pos + _RECORD.size <= len(data):
+            offset, size, length = _RECORD.unpack_from(data, pos)
+            end = pos + _RECORD.size + length
+            if end > len(data):
+                break
+            key = data[pos + _RECORD.size:end].decode("utf-8")
+            if size == DELETED:
+                index.pop(key, None)
+            else:
+                index[key] = (offset, size)
+            pos = end
+        if pos < len(data) and not self.readonly:
+            # Partial record written by a stopped process
+            self._index_file.truncate(pos)
+        return index
+
+    def _read(self, offset, size):
+        end = offset + size
+        if self._map is None or end > len(self._map):
+            self._remap()
+            if self._map is None or end > len(self._map):
+                raise ValueError("Archive data file %s is truncated"
+                                 % self.path)
+        return self._map[offset:end]
+
+    def _remap(self):
+        # Maps the data appended since the last time
+        if self._data is None:
+            raise ValueError("Archive %s is closed" % self.path)
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if os.fstat(self._data.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            return
+        self._map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _check_writable(self):
+        if self._data is None:
+            raise ValueError("Archive %s is closed" % self.path)
+        if self.readonly:
+            raise ValueError("Archive %s is read-only" % self.path)
+
+    def _encode_key(self, key):
+        if not isinstance(key, unicode):
+            raise TypeError("Archive keys should be text, got %s"
+                            % type(key).__name__)
+        encoded = key.encode("utf-8")
+        if len(encoded) > 0xffff:
+            raise ValueError("Archive key too long: %r" % (key[:50], ))
+        return encoded
+
+
+### private ###
+
+# Index records: OFFSET, SIZE, KEY_LENGTH followed by the UTF-8 key
+_RECORD = struct.Struct(">QIH")
+
+
+def _record(key, offset, size):
+    return _RECORD.pack(offset, size, len(key)) + key
+
+
+def _replace(source, destination):
+    if PY3:
+        os.replace(source, destination)
+        return
+    # Python 2 has no os.replace() and os.rename() only overwrites
+    # the destination on POSIX systems
+    if os.name == "nt" and os.path.exists(destination):
+        os.remove(destination)
+    os.rename(source, destination)
@@ -0,0 +1,333 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+
+"""Banana binary encoding of the s-expressions built by L{sexp}.
+
+Wire compatible with twisted.spread.banana, without importing Twisted.
+Lists and tuples are banana lists, byte strings are banana strings, and
+integers and floats are banana numbers. Text strings are written as
+their UTF-8 bytes so the atoms of L{sexp} can be written as they are;
+L{Decoder} gives them back as text when created with native_strings.
+
+Usage with the s-expression converters::
+
+    serializer = sexp.Serializer(post_converter=banana.Encoder())
+    unserializer = sexp.Unserializer(
+        pre_converter=banana.Decoder(native_strings=PY3))
+
+The L{Decoder} can also be fed with chunks of data as they are
+received from a socket, complete expressions are returned as soon as
+their last byte is received.
+"""
+
+from __future__ import absolute_import
+
+import struct
+
+from past.types import unicode, long
+from zope.interface import implementer
+
+from serialization.interface import IConverter
+
+LIST = 0x80
+INT = 0x81
+STRING = 0x82
+NEG = 0x83
+FLOAT = 0x84
+LONGINT = 0x85
+LONGNEG = 0x86
+VOCAB = 0x87
+
+# Same limits as twisted.spread.banana
+SIZE_LIMIT = 640 * 1024
+PREFIX_LIMIT = 64
+
+# Symbols abbreviated by the Perspective Broker dialect
+VOCABULARY = {b"None": 1,
+              b"class": 2,
+              b"dereference": 3,
+              b"reference": 4,
+              b"dictionary": 5,
+              b"function": 6,
+              b"instance": 7,
+              b"list": 8,
+              b"module": 9,
+              b"persistent": 10,
+              b"tuple": 11,
+              b"unpersistable": 12,
+              b"copy": 13,
+              b"cache": 14,
+              b"cached": 15,
+              b"remote": 16,
+              b"local": 17,
+              b"lcache": 18,
+              b"version": 19,
+              b"login": 20,
+              b"password": 21,
+              b"challenge": 22,
+              b"logged_in": 23,
+              b"not_logged_in": 24,
+              b"cachemessage": 25,
+              b"message": 26,
+              b"answer": 27,
+              b"error": 28,
+              b"decref": 29,
+              b"decache": 30,
+              b"uncache": 31}
+
+
+def encode(data, buf=None, vocabulary=False):
+    """Appends the banana encoding of an expression to a bytearray
+    and returns it."""
+    encoder = Encoder(buf, vocabulary=vocabulary)
+    encoder.write(data)
+    return encoder.buf
+
+
+def decode(data, native_strings=False):
+    """Returns the expression encoded in the given data."""
+    decoder = Decoder(native_strings=native_strings)
+    expressions = decoder.feed(data)
+    if len(expressions) != 1 or decoder.pending:
+        raise ValueError("Data does not contain a single banana expression")
+    return expressions[0]
+
+
+@implementer(IConverter)
+class Encoder(object):
+    """Writes banana expressions at the end of a bytearray.
+    If vocabulary is true the symbols of the Perspective Broker
+    dialect are abbreviated."""
+
+    def __init__(self, buf=None, vocabulary=False, prefix_limit=PREFIX_LIMIT):
+        self.buf = bytearray() if buf is None else buf
+        self._vocabulary = VOCABULARY if vocabulary else {}
+        self._largest_long = 2 ** (prefix_limit * 7) - 1
+        self._smallest_long = -self._largest_long
+
+    ### IConverter ###
+
+    def convert(self, data):
+        buf = self.buf
+        self.buf = bytearray()
+        try:
+            self.write(data)
+            return bytes(self.buf)
+        finally:
+            self.buf = buf
+
+    ### Public Methods ###
+
+    def write(self, value):
+        try:
+            writer = self._writers[type(value)]
+        except KeyError:
+            raise TypeError("Object of type %s cannot be banana encoded"
+                            % type(value).__name__)
+        writer(self, value)
+
+    ### Private Methods ###
+
+    def _write_prefix(self, value):
+        # Base 128 digits, least significant first
+        if value < 0x80:
+            self.buf.append(value)
+            return
+        digits = bytearray()
+        while value:
+            digits.append(value & 0x7f)
+            value >>= 7
+        self.buf += digits
+
+    def _write_list(self, value):
+        if len(value) > SIZE_LIMIT:
+            raise ValueError("Banana lists are limited to %d items"
+                             % SIZE_LIMIT)
+        self._write_prefix(len(value))
+        self.buf.append(LIST)
+        write = self.write
+        for item in value:
+            write(item)
+
+    def _write_int(self, value):
+        if value < self._smallest_long or value > self._largest_long:
+            raise ValueError("Integer too large for banana: %d" % value)
+        if value < -0x80000000:
+            self._write_prefix(-value)
+            self.buf.append(LONGNEG)
+        elif value < 0:
+            self._write_prefix(-value)
+            self.buf.append(NEG)
+        elif value <= 0x7fffffff:
+            self._write_prefix(value)
+            self.buf.append(INT)
+        else:
+            self._write_prefix(value)
+            self.buf.append(LONGINT)
+
+    def _write_float(self, value):
+        self.buf += _FLOAT(FLOAT, value)
+
+    def _write_bytes(self, value):
+        symbol = self._vocabulary.get(value)
+        if symbol is not None:
+            self._write_prefix(symbol)
+            self.buf.append(VOCAB)
+            return
+        if len(value) > SIZE_LIMIT:
+            raise ValueError("Banana strings are limited to %d bytes"
+                             % SIZE_LIMIT)
+        self._write_prefix(len(value))
+        self.buf.append(STRING)
+        self.buf += value
+
+    def _write_unicode(self, value):
+        self._write_bytes(value.encode("utf-8"))
+
+    ### lookup tables ###
+
+    _writers = {list: _write_list,
+                tuple: _write_list,
+                bool: _write_int,
+                int: _write_int,
+                long: _write_int,
+                float: _write_float,
+                bytes: _write_bytes,
+                unicode: _write_unicode}
+
+
+@implementer(IConverter)
+class Decoder(object):
+    """Incrementally decodes banana expressions. Strings are bytes
+    unless native_strings is true, then they are decoded from UTF-8."""
+
+    def __init__(self, native_strings=False, prefix_limit=PREFIX_LIMIT):
+        self._native_strings = native_strings
+        self._prefix_limit = prefix_limit
+        self._buffer = bytearray()
+        self._stack = []  # [[SIZE, ITEMS]]
+        self._vocabulary = dict((v, self._string(k))
+                                for k, v in VOCABULARY.items())
+
+    @property
+    def pending(self):
+        """If some data has been fed without completing an expression."""
+        return bool(self._buffer or self._stack)
+
+    ### IConverter ###
+
+    def convert(self, data):
+        decoder = Decoder(self._native_strings, self._prefix_limit)
+        expressions = decoder.feed(data)
+        if len(expressions) != 1 or decoder.pending:
+            raise ValueError("Data does not contain a single "
+                             "banana expression")
+        return expressions[0]
+
+    ### Public Methods ###
+
+    def feed(self, data):
+        """Decodes a chunk of data and returns the list of expressions
+        completed by it, the rest is kept for the next chunks."""
+        buf = self._buffer
+        buf += data
+        stack = self._stack
+        size = len(buf)
+        expressions = []
+        pos = 0
+        while pos < size:
+            start = pos
+            while pos < size and buf[pos] < 0x80:
+                pos += 1
+            if pos - start > self._prefix_limit:
+                raise ValueError("Security precaution: more than %d bytes "
+                                 "of prefix" % self._prefix_limit)
+            if pos == size:
+                pos = start
+                break
+            if pos - start == 1:
+                number = buf[start]
+            else:
+                number = 0
+                for index in range(pos - 1, start - 1, -1):
+                    number = (number << 7) | buf[index]
+            kind = buf[pos]
+            pos += 1
+            if kind == STRING:
+                if number > SIZE_LIMIT:
+                    raise ValueError("Security precaution: string "
+                                     "of %d bytes" % number)
+                end = pos + number
+                if end > size:
+                    pos = start
+                    break
+                value = self._string(bytes(buf[pos:end]))
+                pos = end
+            elif kind == LIST:
+                if number > SIZE_LIMIT:
+                    raise ValueError("Security precaution: list "
+                                     "of %d items" % number)
+                if number:
+                    stack.append([number, []])
+                    continue
+                value = []
+            elif kind == INT or kind == LONGINT:
+                value = number
+            elif kind == NEG or kind == LONGNEG:
+                value = -number
+            elif kind == FLOAT:
+                if pos + 8 > size:
+                    pos = start
+                    break
+                value, = _UNPACK_FLOAT(buf, pos)
+                pos += 8
+            elif kind == VOCAB:
+                value = self._vocabulary.get(number)
+                if value is None:
+                    raise ValueError("Invalid banana symbol %d" % number)
+            else:
+                raise ValueError("Invalid banana type 0x%02x" % kind)
+            while stack:
+                top = stack[-1]
+                items = top[1]
+                items.append(value)
+                if len(items) < top[0]:
+                    break
+                stack.pop()
+                value = items
+            else:
+                expressions.append(value)
+        del buf[:pos]
+        return expressions
+
+    ### Private Methods ###
+
+    def _string(self, value):
+        if self._native_strings:
+            return value.decode("utf-8")
+        return value
+
+
+### private ###
+
+_FLOAT = struct.Struct(">Bd").pack
+_UNPACK_FLOAT = struct.Struct(">d").unpack_from
@@ -22,9 +22,11 @@
 
 from __future__ import absolute_import
 
+import collections
 import copy
 import enum
 import sys
+import threading
 import types
 
 from zope.interface.declarations import implementer
@@ -348,8 +350,52 @@ class Serializer(object):
       [pack_list, [[pack_reference, [1, [pack_list, [pack_int, 1]]]],
       [pack_dereference, 1]]]
 
+    Referenceable values are flattened to a slot remembering them by
+    identity, their first dereference only gives the slot a reference
+    identifier so it gets packed as a reference in the second pass.
+
     Sub classes can override the packing functions used for each types.
 
+    Serializers are reentrant and thread-safe, a conversion started while
+    another one is running, from another thread or from a snapshot()
+    method, is done by a copy of the serializer with a state of its own.
+
+    If created with single_pass set to True, the serializer do not build
+    the flattened structure at all. Values are packed as soon as they are
+    flattened, containers get packed as soon as all there values are.
+    Because a value is only known to be shared when it gets dereferenced,
+    the packed value of its first occurrence is then wrapped in a reference
+    and the containers already packed around it are packed again when
+    the nearest container still being flattened get packed. Only the
+    containers with shared values pay this price, the output is the same
+    than the one of the default two-pass mode. In this mode flatten_value()
+    and flatten_item() return packed values, flatten_key() and all the
+    other flatten_* methods still return a packer and its data.
+
+    If created with iterative set to True, the serializer packs values
+    in single-pass mode without recursion, keeping the containers being
+    flattened in an explicit stack. This allows serializing structures
+    deeper than the Python recursion limit. Only the pack_* functions,
+    flatten_key() and the flatten_* methods of values that are not
+    containers are used in this mode, dictionary keys are still
+    flattened recursively.
+
+    If created with tree set to True, the values to serialize are
+    expected to be a tree: no value is shared or circularly referenced.
+    References are not tracked at all, a shared value is serialized
+    as many times as it is found and a circular reference never ends,
+    unless check_cycles is set to True too. Then the containers being
+    flattened are remembered and a ValueError is raised if one of them
+    is found again in its own values.
+
+    Values of bytes, bytearray and memoryview can be kept out of band
+    by converting with convert_buffers(), like pickle protocol 5 does:
+    the conversion only contains their index packed with pack_buffer
+    and they are returned as a list of memoryview to be written aside,
+    for example with vectored I/O, without being copied. Formats that
+    cannot restore bytearray and memoryview values in band only accept
+    them out of band, the ones able to set buffers_in_band to True.
+
     NOTE: because the flatten methods lookup table is done at class
     declaration time, overriding most of flatten_* method will not work.
     Only flatten_value, flatten_key, flatten_item, flatten_unknown,
@@ -358,12 +404,17 @@ class Serializer(object):
     would be needed in the future, the lookup table initialization
     should be moved to the constructor and self should not be passed anymore
     as the first parameter because the function would be then bound.
+    The capabilities are compiled into per-instance copies of the lookup
+    tables at construction time, so the flatten_* methods of the lookup
+    tables do not check them.
 
     #FIXME: Add datetime types datetime, date, time and timedelta
 
     """
 
     pack_bytes = None
+    pack_buffer = None
+    buffers_in_band = False
     pack_unicode = None
     pack_int = None
     pack_enum = None
@@ -390,7 +441,9 @@ class Serializer(object):
 
     def __init__(self, converter_caps=None, freezer_caps=None,
                  post_converter=None, externalizer=None, registry=None,
-                 source_ver=None, target_ver=None, version_atom='.version'):
+                 source_ver=None, target_ver=None, version_atom='.version',
+                 single_pass=False, iterative=False, tree=False,
+                 check_cycles=False):
         global _global_registry
         assert ((source_ver is None) and (target_ver is None)) \
             or ((source_ver is not None) and (target_ver is not None))
@@ -402,6 +455,24 @@ class Serializer(object):
         self._source_ver = source_ver
         self._target_ver = target_ver
         self._version_atom = version_atom
+        self._single_pass = single_pass or iterative
+        self._iterative = iterative
+        self._tree = tree
+        self._check_cycles = check_cycles
+        # Lookup tables with the capabilities compiled in, indexed
+        # by the freezing flag so unsupported types are just dispatched
+        # to a flattener raising an error.
+        caps = self.converter_capabilities, self.freezer_capabilities
+        self._value_tables = tuple(
+            self._compile_lookup(self._value_lookup, self._value_caps, c)
+            for c in caps)
+        self._key_tables = tuple(
+            self._compile_lookup(self._key_lookup, self._key_caps, c)
+            for c in caps)
+        self._opener_tables = tuple(
+            self._compile_lookup(self._opener_lookup, self._value_caps, c)
+            for c in caps)
+        self._lock = threading.Lock()  # Held while converting
         self.reset()
 
     ### IFreezer ###
@@ -414,17 +485,43 @@ class Serializer(object):
     def convert(self, data):
         return self._convert(data, self.converter_capabilities, False)
 
+    ### public ###
+
+    def freeze_many(self, values):
+        """Returns a generator freezing the specified values one by one,
+        see convert_many()."""
+        return self._convert_many(values, self.freezer_capabilities, True)
+
+    def convert_many(self, values):
+        """Returns a generator converting the specified values one by one.
+        Each value has its own references like if converted separately,
+        but the state of the serializer is only setup once."""
+        return self._convert_many(values, self.converter_capabilities, False)
+
+    def convert_buffers(self, data, threshold=0):
+        """Returns the conversion of the specified value and the list of
+        memoryview of its bytes, bytearray and memoryview values of at
+        least threshold bytes. These values are only referenced by their
+        index in the list and should be given back with the conversion
+        to L{Unserializer.convert_buffers}."""
+        if self.pack_buffer is None:
+            raise TypeError("Serializer %s does not support out-of-band "
+                            "buffers" % reflect.canonical_name(self))
+        buffers = _Buffers(threshold)
+        converted = self._convert(data, self.converter_capabilities, False,
+                                  buffers=buffers)
+        return converted, buffers.views
+
     ### protected ###
 
     def check_capabilities(self, cap, value, caps, freezing):
         if cap not in caps:
-            kind = "Freezer" if freezing else "Serializer"
-            raise ValueError("%s %s do not support %s: %r"
-                             % (kind, reflect.canonical_name(self),
-                                cap.name, value))
+            raise _unsupported_error(self, cap, value, freezing)
 
     def pack_value(self, data):
         if not isinstance(data, (list, tuple)):
+            if isinstance(data, _Slot):
+                return self._pack_slot(data)
             return data
         packer, value = data
         if isinstance(value, list):
@@ -436,13 +533,16 @@ class Serializer(object):
     def flatten_value(self, value, caps, freezing):
         vtype = type(value)
         default = Serializer.flatten_unknown_value
-        flattener = self._value_lookup.get(vtype, default)
+        flattener = self._value_tables[freezing].get(vtype, default)
+        if self._single_pass:
+            packer, data = flattener(self, value, caps, freezing)
+            return data if packer is None else packer(data)
         return flattener(self, value, caps, freezing)
 
     def flatten_key(self, key, caps, freezing):
         vtype = type(key)
         default = Serializer.flatten_unknown_key
-        flattener = self._key_lookup.get(vtype, default)
+        flattener = self._key_tables[freezing].get(vtype, default)
         return flattener(self, key, caps, freezing)
 
     def post_convertion(self, data):
@@ -450,34 +550,73 @@ class Serializer(object):
             return self._post_converter.convert(data)
         return data
 
+    def convert_flattened(self, flattened):
+        """Returns the conversion of a value flattened in two-pass mode.
+        By default the value is packed and then post-converted,
+        sub-classes can override it to skip the packed structure."""
+        return self.post_convertion(self.pack_value(flattened))
+
     def reset(self):
         self._freezing = False  # If we are freezing or serializing
-        self._preserved = {}  # {OBJ_ID: FLATTENED_STRUCTURE}
-        self._refids = {}  # {OBJ_ID: REFERENCE_ID}
-        self._references = {}  # {OBJ_ID: REFERENCE_CONTAINER}
-        self._memory = []
+        self._memo = {}  # {OBJ_ID: _Slot} for the two-pass mode
+        self._memory = []  # Values referenced by _frames
         self._refid = 0
+        self._buffers = None  # Only set by convert_buffers()
+        self._frames = {}  # {OBJ_ID: _Frame} for the single-pass mode
+        self._path = []  # [_Frame] of the containers being flattened
+        # {OBJ_ID: VALUE} of the containers being flattened in tree mode
+        self._ancestors = {} if self._tree and self._check_cycles else None
+        # {(TYPE, FREEZING): (FLATTENER, FACTORY)}, see resolve_unknown()
+        self._unknown_lookup = {}
 
     def flatten_unknown_value(self, value, caps, freezing):
-        # Flatten enums
-        if isinstance(value, enum.Enum):
-            return self.flatten_enum_value(value, caps, freezing)
-
-        # Flatten types and interfaces
-        if isinstance(value, (type, InterfaceClass)):
-            return self.flatten_type_value(value, caps, freezing)
+        # Enums, types and interfaces are resolved by type
+        flattener, factory = self.resolve_unknown(type(value), freezing)
+        if flattener is not None:
+            return flattener(self, value, caps, freezing)
 
         if self._externalizer is not None:
             extid = self._externalizer.identify(value)
             if extid is not None:
                 return self.flatten_external(extid, caps, freezing)
 
+        instance = self.adapt_instance(value, freezing, factory)
+        return self.flatten_instance(instance, caps, freezing)
+
+    def resolve_unknown(self, vtype, freezing):
+        """Returns a tuple with the unbound method flattening values
+        of the specified type or None if they are instances, and the
+        function adapting instances or None if it depends on the value.
+        Results are cached by serializer class until adapters change
+        or interfaces are declared on the class."""
+        key = vtype, freezing
+        resolved = self._unknown_lookup.get(key)
+        if resolved is None:
+            cls = type(self)
+            if issubclass(vtype, enum.Enum):
+                # Flatten enums
+                resolved = cls.flatten_enum_value, None
+            elif issubclass(vtype, (type, InterfaceClass)):
+                # Flatten types and interfaces
+                resolved = cls.flatten_type_value, None
+            else:
+                iface = ISnapshotable if freezing else ISerializable
+                resolved = None, adapter.lookup_factory(vtype, iface)
+            self._unknown_lookup[key] = resolved
+        return resolved
+
+    def adapt_instance(self, value, freezing, factory=None):
         # Checks if value support the current required protocol
         # Could be ISnapshotable or ISerializable
+        if factory is not None:
+            instance = factory(value)
+            if instance is not None:
+                return instance
+
         if freezing:
 
             try:
-                snapshotable = ISnapshotable(value)
+                return ISnapshotable(value)
             except TypeError:
                 raise_(
                     TypeError,
@@ -488,12 +627,10 @@ class Serializer(object):
                     sys.exc_info()[2]
                 )
 
-            return self.flatten_instance(snapshotable, caps, freezing)
-
         else:
 
             try:
-                serializable = ISerializable(value)
+                return ISerializable(value)
             except TypeError:
                 raise_(
                     TypeError,
@@ -504,8 +641,6 @@ class Serializer(object):
                     sys.exc_info()[2]
                 )
 
-            return self.flatten_instance(serializable, caps, freezing)
-
     def flatten_unknown_key(self, value, caps, freezing):
         # Flatten enums
         if isinstance(value, enum.Enum):
@@ -522,42 +657,49 @@ class Serializer(object):
 
     def flatten_item(self, value, caps, freezing):
         key, value = value
+        if self._single_pass:
+            self._enter()
+            key_packer, key_data = self.flatten_key(key, caps, freezing)
+            key = _pack(key_packer, key_data)
+            value = self.flatten_value(value, caps, freezing)
+            return self._leave(self.pack_item, [key, value])
         return self.pack_item, [self.flatten_key(key, caps, freezing),
                                 self.flatten_value(value, caps, freezing)]
 
     def flatten_bytes_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.bytes_values, value,
-                                caps, freezing)
+        if self._buffers is not None:
+            index = self._buffers.add(value)
+            if index is not None:
+                return self.pack_buffer, index
+        return self.pack_bytes, value
+
+    def flatten_buffer_value(self, value, caps, freezing):
+        if self._buffers is not None:
+            index = self._buffers.add(value)
+            if index is not None:
+                return self.pack_buffer, index
+        if not self.buffers_in_band:
+            raise TypeError("Type %s values only supported out of band by "
+                            "serializer %s" % (type(value).__name__,
+                                               reflect.canonical_name(self)))
         return self.pack_bytes, value
 
     def flatten_unicode_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.unicode_values, value,
-                                caps, freezing)
         return self.pack_unicode, value
 
     def flatten_int_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.int_values, value,
-                                caps, freezing, )
         return self.pack_int, value
 
     def flatten_long_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.long_values, value,
-                                caps, freezing)
         return self.pack_long, value
 
     def flatten_float_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.float_values, value,
-                                caps, freezing)
         return self.pack_float, value
 
     def flatten_none_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.none_values, value,
-                                caps, freezing)
         return self.pack_none, value
 
     def flatten_bool_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.bool_values, value,
-                                caps, freezing)
         return self.pack_bool, value
 
     def flatten_enum_value(self, value, caps, freezing):
@@ -571,54 +713,42 @@ class Serializer(object):
         return self.pack_type, value
 
     def flatten_builtin_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.builtin_values, value,
-                                caps, freezing)
         if freezing:
             return self.pack_frozen_builtin, value
         return self.pack_function, value
 
     def flatten_function_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.function_values, value,
-                                caps, freezing)
         if freezing:
             return self.pack_frozen_function, value
         return self.pack_function, value
 
     def flatten_method_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.method_values, value,
-                                caps, freezing)
         if freezing:
             if hasattr(value.__func__, FREEZING_TAG_ATTRIBUTE):
                 tag = getattr(value.__func__, FREEZING_TAG_ATTRIBUTE)
+                if self._single_pass:
+                    return None, self.flatten_value(tag, caps, freezing)
                 return self.flatten_value(tag, caps, freezing)
             return self.pack_frozen_method, value
         return self.pack_method, value
 
     @referenceable
     def flatten_tuple_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.tuple_values, value,
-                                caps, freezing)
         return self.pack_tuple, [self.flatten_value(v, caps, freezing)
                                  for v in value]
 
     @referenceable
     def flatten_list_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.list_values, value,
-                                caps, freezing)
         return self.pack_list, [self.flatten_value(v, caps, freezing)
                                 for v in value]
 
     @referenceable
     def flatten_set_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.set_values, value,
-                                caps, freezing)
         return self.pack_set, [self.flatten_value(v, caps, freezing)
                                for v in value]
 
     @referenceable
     def flatten_dict_value(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.dict_values, value,
-                                caps, freezing)
         items = value.items()
         if freezing:
             # int(1) > str(2) rase error on PY3
@@ -627,38 +757,24 @@ class Serializer(object):
                                 for i in items]
 
     def flatten_bytes_key(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.str_keys, value,
-                                caps, freezing)
         return self.pack_bytes, value
 
     def flatten_unicode_key(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.unicode_keys, value,
-                                caps, freezing)
         return self.pack_unicode, value
 
     def flatten_int_key(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.int_keys, value,
-                                caps, freezing)
         return self.pack_int, value
 
     def flatten_long_key(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.long_keys, value,
-                                caps, freezing)
         return self.pack_long, value
 
     def flatten_float_key(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.float_keys, value,
-                                caps, freezing)
         return self.pack_float, value
 
     def flatten_none_key(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.none_keys, value,
-                                caps, freezing)
         return self.pack_none, value
 
     def flatten_bool_key(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.bool_keys, value,
-                                caps, freezing)
         return self.pack_bool, value
 
     def flatten_enum_key(self, value, caps, freezing):
@@ -673,8 +789,6 @@ class Serializer(object):
 
     @referenceable
     def flatten_tuple_key(self, value, caps, freezing):
-        self.check_capabilities(Capabilities.tuple_keys, value,
-                                caps, freezing)
         return self.pack_tuple, [self.flatten_value(v, caps, freezing)
                                  for v in value]
 
@@ -688,37 +802,51 @@ class Serializer(object):
             deref = self._prepare(value)
             if deref is not None:
                 return deref
+        elif self._single_pass:
+            self._enter()
 
-        snapshot = value.snapshot()
-
-        if IVersionAdapter.providedBy(value):
-            source = self.get_source_ver(value, snapshot)
-            target = self.get_target_ver(value, snapshot)
-            if target is not None:
-                if target != source:
-                    snapshot = value.adapt_version(snapshot, source, target)
-                value.store_version(snapshot, target, self._version_atom)
-
+        snapshot = self.snapshot_instance(value)
         dump = self.flatten_value(snapshot, caps, freezing)
 
         if freezing:
             packer, data = self.pack_frozen_instance, [dump]
+        elif self._single_pass:
+            type_name = _pack(self.pack_type_name, value.type_name)
+            packer, data = self.pack_instance, [type_name, dump]
         else:
             packer, data = (self.pack_instance,
                             [[self.pack_type_name, value.type_name], dump])
 
         if referenceable:
             return self._preserve(value, packer, data)
+        elif self._single_pass:
+            return None, self._leave(packer, data)
         else:
             return packer, data
 
+    def snapshot_instance(self, value):
+        snapshot = value.snapshot()
+
+        if IVersionAdapter.providedBy(value):
+            source = self.get_source_ver(value, snapshot)
+            target = self.get_target_ver(value, snapshot)
+            if target is not None:
+                if target != source:
+                    snapshot = value.adapt_version(snapshot, source, target)
+                value.store_version(snapshot, target, self._version_atom)
+
+        return snapshot
+
     def flatten_external(self, value, caps, freezing):
         self.check_capabilities(Capabilities.external_values, value,
                                 caps, freezing)
+        if self._single_pass:
+            self._enter()
         flatened = [self.flatten_value(value, caps, freezing)]
-        if not freezing:
-            return self.pack_external, flatened
-        return self.pack_frozen_external, flatened
+        packer = self.pack_frozen_external if freezing else self.pack_external
+        if self._single_pass:
+            return None, self._leave(packer, flatened)
+        return packer, flatened
 
     ### lookup tables ###
 
@@ -727,6 +855,8 @@ class Serializer(object):
                      set: flatten_set_value,
                      dict: flatten_dict_value,
                      bytes: flatten_bytes_value,
+                     bytearray: flatten_buffer_value,
+                     memoryview: flatten_buffer_value,
                      unicode: flatten_unicode_value,
                      int: flatten_int_value,
                      long: flatten_long_value,
@@ -746,19 +876,120 @@ class Serializer(object):
                    bool: flatten_bool_key,
                    type(None): flatten_none_key}
 
+    # Capabilities required by the flatteners of the lookup tables,
+    # checked once for all when compiling them at construction time
+    _value_caps = {tuple: Capabilities.tuple_values,
+                   list: Capabilities.list_values,
+                   set: Capabilities.set_values,
+                   dict: Capabilities.dict_values,
+                   bytes: Capabilities.bytes_values,
+                   bytearray: Capabilities.bytes_values,
+                   memoryview: Capabilities.bytes_values,
+                   unicode: Capabilities.unicode_values,
+                   int: Capabilities.int_values,
+                   long: Capabilities.long_values,
+                   float: Capabilities.float_values,
+                   bool: Capabilities.bool_values,
+                   type(None): Capabilities.none_values,
+                   types.FunctionType: Capabilities.function_values,
+                   types.BuiltinFunctionType: Capabilities.builtin_values,
+                   types.MethodType: Capabilities.method_values}
+
+    _key_caps = {tuple: Capabilities.tuple_keys,
+                 bytes: Capabilities.str_keys,
+                 unicode: Capabilities.unicode_keys,
+                 int: Capabilities.int_keys,
+                 long: Capabilities.long_keys,
+                 float: Capabilities.float_keys,
+                 bool: Capabilities.bool_keys,
+                 type(None): Capabilities.none_keys}
+
     ### private ###
 
-    def _convert(self, data, caps, freezing):
+    def _compile_lookup(self, lookup, required, caps):
+        # Replace the flatteners of unsupported types by a stub
+        compiled = dict(lookup)
+        for vtype in lookup:
+            cap = required.get(vtype)
+            if cap is not None and cap not in caps:
+                compiled[vtype] = _unsupported(cap)
+        return compiled
+
+    def _convert(self, data, caps, freezing, post_convertion=None,
+                 buffers=None, convert_flattened=None):
+        if not self._lock.acquire(False):
+            # Already converting in another thread or from a snapshot()
+            context = self._new_context()
+            return context._convert(data, caps, freezing, post_convertion,
+                                    buffers, convert_flattened)
         try:
-            # Flatten the value to the list-only format with packer function
-            flattened = self.flatten_value(data, caps, freezing)
-            # Pack all the value with there own packer functions
-            packed = self.pack_value(flattened)
-            # Post-convert the data if a convert was specified
-            return self.post_convertion(packed)
+            self._unknown_lookup = _unknown_lookup(type(self))
+            self._buffers = buffers
+            return self._convert_value(data, caps, freezing, post_convertion,
+                                       convert_flattened)
         finally:
             # Reset the state to cleanup all references
             self.reset()
+            self._lock.release()
+
+    def _convert_many(self, values, caps, freezing):
+        if not self._lock.acquire(False):
+            # Already converting in another thread or from a snapshot()
+            context = self._new_context()
+            for converted in context._convert_many(values, caps, freezing):
+                yield converted
+            return
+        try:
+            self._unknown_lookup = _unknown_lookup(type(self))
+            for value in values:
+                try:
+                    yield self._convert_value(value, caps, freezing)
+                finally:
+                    # Forget the references before the next value
+                    self._clear()
+        finally:
+            self.reset()
+            self._lock.release()
+
+    def _convert_value(self, data, caps, freezing, post_convertion=None,
+                       convert_flattened=None):
+        if self._iterative:
+            packed = self._flatten_iteratively(data, caps, freezing)
+            return (post_convertion or self.post_convertion)(packed)
+        if self._single_pass:
+            # Values are packed while being flattened
+            packed = self.flatten_value(data, caps, freezing)
+            return (post_convertion or self.post_convertion)(packed)
+        # Flatten the value to the list-only format with packer function
+        flattened = self.flatten_value(data, caps, freezing)
+        if convert_flattened is not None:
+            return convert_flattened(flattened)
+        if post_convertion is None:
+            return self.convert_flattened(flattened)
+        # Pack all the value with there own packer functions
+        packed = self.pack_value(flattened)
+        # Post-convert the data if a convert was specified
+        return post_convertion(packed)
+
+    def _clear(self):
+        # Cleanup the state between values, reusing the containers
+        if self._memo:
+            self._memo.clear()
+        if self._memory:
+            del self._memory[:]
+            self._frames.clear()
+        if self._path:
+            del self._path[:]
+        if self._ancestors:
+            self._ancestors.clear()
+        self._refid = 0
+
+    def _new_context(self):
+        # Returns a serializer sharing the configuration but not the state
+        context = copy.copy(self)
+        context._lock = threading.Lock()
+        context.reset()
+        return context
 
     def _next_refid(self):
         self._refid += 1
@@ -766,53 +997,260 @@ class Serializer(object):
 
     def _prepare(self, value):
         ident = id(value)
-        # Check if already preserved
-        if ident in self._preserved:
-            # Already preserved so we should return a dereference
-            if ident in self._refids:
-                # Already referenced, just use the reference identifier
-                refid = self._refids[ident]
-            else:
-                # First dereference, we should mutate the original value
-                # to a reference using the preserved list
-                reference = self._preserved[ident]
-                # Copy the original value before mutating
-                new_value = copy.copy(reference)
-                # Get a new reference identifier
-                refid = self._next_refid()
-                # Mutate the preserved list
-                reference[:] = self.pack_reference, [refid, new_value]
-                # Remember the reference identifier for this value
-                self._refids[ident] = refid
-                # Keep the reference to be able to return it from _preserv()
-                # in case of cycle references
-                self._references[ident] = reference
-                # Update the original to be able to update
-                # the reference value in-place
-                self._preserved[ident] = new_value
-
-            # Return a dereference
-            return [self.pack_dereference, refid]
-
-        # Preserve the value container to be able to mutate it to a reference
-        self._preserved[ident] = []
-        return None
+        if self._tree:
+            # Values are neither shared nor circular, nothing to remember
+            if self._ancestors is not None:
+                if ident in self._ancestors:
+                    raise ValueError("Circular reference to a %s value "
+                                     "found by serializer %s in tree mode"
+                                     % (type(value).__name__,
+                                        reflect.canonical_name(self)))
+                self._ancestors[ident] = value
+            if self._single_pass:
+                frame = self._enter()
+                if self._ancestors is not None:
+                    frame.ident = ident
+            return None
+        if self._single_pass:
+            frame = self._frames.get(ident)
+            if frame is None:
+                # First occurrence, start packing it
+                self._frames[ident] = self._enter()
+                # Keep a reference to the value to prevent it to be
+                # garbage-collected, see _Slot
+                self._memory.append(value)
+                return None
+            return None, self._dereference(frame)
+        slot = self._memo.get(ident)
+        if slot is None:
+            # First occurrence, the slot will be filled by _preserve()
+            # and takes the place of the value in the flattened structure
+            self._memo[ident] = _Slot(value)
+            return None
+        if slot.refid is None:
+            # First dereference, the slot will be packed as a reference
+            slot.refid = self._next_refid()
+        return [self.pack_dereference, slot.refid]
 
     def _preserve(self, value, packer, data):
+        if self._single_pass:
+            return None, self._leave(packer, data)
         ident = id(value)
-        # Keep a reference to the value to prevent it to be garbage-collected.
-        # If it was, a different value with the same id could appear
-        # and the reference system would be corrupted.
-        self._memory.append(value)
-        # Retrieve the value container
-        container = self._preserved[ident]
-        # Set the value in place, even if it has been referenced
-        container[:] = packer, data
-        # If the value has been referenced, return the reference
-        if ident in self._references:
-            return self._references[ident]
-        # Otherwise return the value itself
-        return container
+        if self._tree:
+            if self._ancestors is not None:
+                del self._ancestors[ident]
+            return packer, data
+        # Fill the slot, even if it has already been dereferenced
+        slot = self._memo[ident]
+        slot.packer = packer
+        slot.data = data
+        return slot
+
+    def _pack_slot(self, slot):
+        value = slot.data
+        if isinstance(value, list):
+            value = [self.pack_value(d) for d in value]
+        if slot.packer is not None:
+            value = slot.packer(value)
+        if slot.refid is not None:
+            value = self.pack_reference([slot.refid, value])
+        return value
+
+    def _flatten_iteratively(self, value, caps, freezing):
+        path = self._path
+        depth = len(path)
+        packed = self._open_value(value, caps, freezing)
+        while True:
+            if packed is not _OPENED:
+                if len(path) == depth:
+                    return packed
+                path[-1].values.append(packed)
+            frame = path[-1]
+            child = next(frame.todo, _OPENED)
+            if child is _OPENED:
+                # All the values are packed, we can pack the container
+                values = frame.values
+                frame.todo = frame.values = None
+                packed = self._leave(frame.packer, values)
+            elif frame.kind == _VALUES:
+                packed = self._open_value(child, caps, freezing)
+            elif frame.kind == _ITEMS:
+                packed = self._open_item(child)
+            elif not frame.values:
+                # Keys are flattened recursively
+                packer, data = self.flatten_key(child, caps, freezing)
+                packed = _pack(packer, data)
+            else:
+                packed = self._open_value(child, caps, freezing)
+
+    def _open_value(self, value, caps, freezing):
+        # Returns the packed value or _OPENED if a container got pushed
+        vtype = type(value)
+        opener = self._opener_tables[freezing].get(vtype)
+        if opener is not None:
+            return opener(self, value, caps, freezing)
+        flattener = self._value_tables[freezing].get(vtype)
+        if flattener is None:
+            return self._open_unknown(value, caps, freezing)
+        packer, data = flattener(self, value, caps, freezing)
+        return _pack(packer, data)
+
+    def _open_unknown(self, value, caps, freezing):
+        flattener, factory = self.resolve_unknown(type(value), freezing)
+        if flattener is not None:
+            packer, data = flattener(self, value, caps, freezing)
+            return _pack(packer, data)
+
+        if self._externalizer is not None:
+            extid = self._externalizer.identify(value)
+            if extid is not None:
+                return self._open_external(extid, caps, freezing)
+
+        instance = self.adapt_instance(value, freezing, factory)
+        return self._open_instance(instance, caps, freezing)
+
+    def _open_instance(self, value, caps, freezing):
+        self.check_capabilities(Capabilities.instance_values, value,
+                                caps, freezing)
+
+        if getattr(value, "referenceable", True):
+            deref = self._prepare(value)
+            if deref is not None:
+                return deref[1]
+        else:
+            self._enter()
+
+        snapshot = self.snapshot_instance(value)
+
+        if freezing:
+            return self._opened(self.pack_frozen_instance,
+                                [snapshot], _VALUES)
+        type_name = _pack(self.pack_type_name, value.type_name)
+        return self._opened(self.pack_instance, [snapshot], _VALUES,
+                            [type_name])
+
+    def _open_external(self, value, caps, freezing):
+        self.check_capabilities(Capabilities.external_values, value,
+                                caps, freezing)
+        self._enter()
+        if freezing:
+            return self._opened(self.pack_frozen_external, [value], _VALUES)
+        return self._opened(self.pack_external, [value], _VALUES)
+
+    def _open_item(self, value):
+        self._enter()
+        return self._opened(self.pack_item, value, _PAIR)
+
+    def _open_tuple(self, value, caps, freezing):
+        deref = self._prepare(value)
+        if deref is not None:
+            return deref[1]
+        return self._opened(self.pack_tuple, value, _VALUES)
+
+    def _open_list(self, value, caps, freezing):
+        deref = self._prepare(value)
+        if deref is not None:
+            return deref[1]
+        return self._opened(self.pack_list, value, _VALUES)
+
+    def _open_set(self, value, caps, freezing):
+        deref = self._prepare(value)
+        if deref is not None:
+            return deref[1]
+        return self._opened(self.pack_set, value, _VALUES)
+
+    def _open_dict(self, value, caps, freezing):
+        deref = self._prepare(value)
+        if deref is not None:
+            return deref[1]
+        items = value.items()
+        if freezing:
+            # int(1) > str(2) rase error on PY3
+            items = sorted(items, key=lambda i: str(i[0]))
+        return self._opened(self.pack_dict, items, _ITEMS)
+
+    def _opened(self, packer, children, kind, values=None):
+        # Setup the container just pushed to iterate over its children
+        frame = self._path[-1]
+        frame.packer = packer
+        frame.todo = iter(children)
+        frame.kind = kind
+        frame.values = [] if values is None else values
+        return _OPENED
+
+    # Containers flattened iteratively
+    _opener_lookup = {tuple: _open_tuple,
+                      list: _open_list,
+                      set: _open_set,
+                      dict: _open_dict}
+
+    def _enter(self):
+        # Start packing a container in single-pass mode
+        frame = _Frame()
+        self._path.append(frame)
+        return frame
+
+    def _leave(self, packer, data):
+        # Finish packing the current container in single-pass mode
+        frame = self._path.pop()
+        if frame.ident is not None:
+            # Not an ancestor of the values left to flatten anymore
+            del self._ancestors[frame.ident]
+        if frame.patches is not None:
+            # Some already packed values changed to references
+            self._refresh(data, frame.patches)
+            frame.patches = None
+        frame.packer = packer
+        frame.data = data
+        frame.parent = self._path[-1] if self._path else None
+        frame.packed = frame.embedded = self._repack(frame)
+        return frame.packed
+
+    def _dereference(self, frame):
+        if frame.refid is None:
+            # First dereference, the value should become a reference
+            frame.refid = self._next_refid()
+            if frame.data is not None:
+                # Already packed, the containers packed since
+                # have to be packed again when possible
+                self._invalidate(frame)
+        return _pack(self.pack_dereference, frame.refid)
+
+    def _invalidate(self, frame):
+        # Queue the frame and the packed containers holding it for being
+        # packed again when the enclosing container being flattened is done
+        while not frame.dirty:
+            frame.dirty = True
+            parent = frame.parent
+            if parent.patches is None:
+                parent.patches = []
+            parent.patches.append(frame)
+            if parent.data is None:
+                # Still being flattened
+                return
+            frame = parent
+
+    def _refresh(self, data, patches):
+        for frame in patches:
+            if frame.patches is not None:
+                self._refresh(frame.data, frame.patches)
+                frame.patches = None
+            frame.packed = self._repack(frame)
+            frame.dirty = False
+        # Replace the outdated values in a single pass
+        outdated = dict((id(f.embedded), f) for f in patches)
+        for index, item in enumerate(data):
+            frame = outdated.pop(id(item), None)
+            if frame is not None:
+                data[index] = frame.embedded = frame.packed
+                if not outdated:
+                    break
+
+    def _repack(self, frame):
+        packed = _pack(frame.packer, frame.data)
+        if frame.refid is not None:
+            packed = _pack(self.pack_reference, [frame.refid, packed])
+        return packed
 
     def get_target_ver(self, instance, snapshot):
         return self._target_ver
@@ -821,10 +1259,145 @@ class Serializer(object):
         return self._source_ver
 
 
+class _Slot(object):
+    """Referenceable value flattened by a serializer in two-pass mode."""
+
+    __slots__ = ("value", "packer", "data", "refid")
+
+    def __init__(self, value):
+        # Keep a reference to the value to prevent it to be garbage-collected.
+        # If it was, a different value with the same id could appear
+        # and the reference system would be corrupted.
+        self.value = value
+        self.packer = None
+        self.data = None
+        self.refid = None  # Only set if the value got dereferenced
+
+
+class _Buffers(object):
+    """Values kept out of band by a serializer."""
+
+    __slots__ = ("threshold", "views", "indexes", "copied")
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.views = []
+        self.indexes = {}  # {OBJ_ID: INDEX}
+        self.copied = []  # Values of the views that had to be copied
+
+    def add(self, value):
+        # Returns the index of the value or None to keep it in band
+        index = self.indexes.get(id(value))
+        if index is not None:
+            return index
+        view = memoryview(value)
+        if view.nbytes < self.threshold:
+            return None
+        index = self.indexes[id(value)] = len(self.views)
+        if not view.c_contiguous:
+            # Only contiguous bytes can be written aside
+            self.copied.append(value)
+            view = memoryview(view.tobytes())
+        # The view keeps the value alive so its identifier is not reused
+        self.views.append(view)
+        return index
+
+
+class _Frame(object):
+    """Container being packed by a serializer in single-pass mode."""
+
+    __slots__ = ("packer", "data", "parent", "packed", "embedded",
+                 "refid", "patches", "dirty", "todo", "kind", "values",
+                 "ident")
+
+    def __init__(self):
+        self.packer = None
+        self.data = None  # None until packed
+        self.parent = None
+        self.packed = None
+        self.embedded = None  # Packed value as found in parent's data
+        self.refid = None
+        self.patches = None  # Frames to pack again
+        self.dirty = False
+        # Only used while flattening iteratively
+        self.todo = None  # Iterator on the values left to flatten
+        self.kind = None
+        self.values = None  # Values already packed
+        # Only set while checking for cycles in tree mode
+        self.ident = None
+
+
+class _Unpacking(object):
+    """Data being unpacked by an unserializer in iterative mode."""
+
+    __slots__ = ("data", "unpacker", "args", "todo", "mutable", "value",
+                 "blob", "mark", "refid", "refdata")
+
+    def __init__(self, data, unpacker, args, children, mark):
+        self.data = data
+        self.unpacker = unpacker
+        self.args = args
+        self.todo = iter(children)  # Iterator on the data left to unpack
+        self.mutable = False
+        self.value = None  # Mutable value created before unpacking
+        self.blob = None
+        self.mark = mark  # Size of the log of values unpacked ahead
+        # Only set when unpacking a reference
+        self.refid = None
+        self.refdata = None
+
+
+# Kind of values iterated over by the iterative serializer
+_VALUES, _ITEMS, _PAIR = range(3)
+
+# Marker for a container that got pushed on the stack
+_OPENED = object()
+
+
+# {SERIALIZER_CLASS: (GENERATION, {(TYPE, FREEZING): (FLATTENER, FACTORY)})}
+_unknown_lookups = {}
+
+
+def _unknown_lookup(cls):
+    # Returns the cache of resolved unknown types for a serializer class
+    generation = adapter.generation()
+    cached = _unknown_lookups.get(cls)
+    if cached is None or cached[0] != generation:
+        cached = _unknown_lookups[cls] = (generation, {})
+    return cached[1]
+
+
+def _unsupported(cap):
+    # Flattener of the values requiring an unsupported capability
+
+    def flatten_unsupported(self, value, caps, freezing):
+        raise _unsupported_error(self, cap, value, freezing)
+
+    return flatten_unsupported
+
+
+def _unsupported_error(serializer, cap, value, freezing):
+    kind = "Freezer" if freezing else "Serializer"
+    return ValueError("%s %s do not support %s: %r"
+                      % (kind, reflect.canonical_name(serializer),
+                         cap.name, value))
+
+
+def _pack(packer, data):
+    if packer is None:
+        return data
+    return packer(data)
+
+
 class DelayPacking(Exception):
     """Exception raised when unpacking a dereference to an unknown
     reference. This allows to delay unpacking of mutable object
-    containing dereferences."""
+    containing dereferences until the reference with the identifier
+    C{refid} is restored."""
+
+    def __init__(self, refid=None):
+        Exception.__init__(self, refid)
+        self.refid = refid
 
 
 @implementer(IConverter)
@@ -838,13 +1411,31 @@ class Unserializer(object):
     data will be first converted by the given converter and then
     the result will be unserialized. Used to parse data before
     unserializing.
+
+    In iterative mode the data is walked with an explicit stack
+    instead of recursively, the values composing a data are unpacked
+    first and handed over to the unpacker of the data when it is done.
+    The depth of the data to unpack is then only limited by memory.
+
+    Unserializers are reentrant and thread-safe the same way serializers
+    are, see L{Serializer}.
     """
 
     pass_through_types = ()
 
+    # Used by the iterative mode to walk the data to unpack,
+    # sub-classes map their unpackers of composite data to functions
+    # returning the data of the values composing it:
+    # {UNPACKER: FUNCTION(DATA) -> ITERABLE}
+    _children_lookup = {}
+    # and their reference unpackers to functions returning
+    # the reference identifier and the data of the referenced value:
+    # {UNPACKER: FUNCTION(DATA) -> (REFID, DATA)}
+    _reference_lookup = {}
+
     def __init__(self, converter_caps=None, pre_converter=None,
                  registry=None, externalizer=None,
-                 source_ver=None, target_ver=None):
+                 source_ver=None, target_ver=None, iterative=False):
         global _global_registry
         assert ((source_ver is None) and (target_ver is None)) \
             or ((source_ver is not None) and (target_ver is not None))
@@ -854,28 +1445,60 @@ class Unserializer(object):
         self._externalizer = externalizer and IExternalizer(externalizer)
         self._source_ver = source_ver
         self._target_ver = target_ver
+        self._iterative = iterative
+        self._lock = threading.Lock()  # Held while converting
+        # {TYPE: IS_PASS_THROUGH}, see _pass_through()
+        self._pass_through_lookup = {}
         self.reset()
 
     ### IConverter ###
 
     def convert(self, data):
+        if not self._lock.acquire(False):
+            # Already converting in another thread or from a recover()
+            return self._new_context().convert(data)
         try:
-            # Pre-convert the data if a convertor was specified
-            converted = self.pre_convertion(data)
-            # Unpack the first level of values
-            unpacked = self.unpack_data(converted)
-            # Continue unpacking level by level
-            self.finish_unpacking()
-            # Inform object that it has migrated if this is a case
-            if (IVersionAdapter.providedBy(unpacked) and
-                    self._migrated):
-                unpacked.set_migrated()
-
-            # Should be finished by now
-            return unpacked
+            return self._convert_data(data)
         finally:
             # Reset the state to cleanup all references
             self.reset()
+            self._lock.release()
+
+    ### public ###
+
+    def convert_buffers(self, data, buffers):
+        """Unserializes data converted by L{Serializer.convert_buffers}
+        with the buffers it returned. The values kept out of band are
+        restored as the given buffers, without copying them."""
+        if not self._lock.acquire(False):
+            # Already converting in another thread or from a recover()
+            return self._new_context().convert_buffers(data, buffers)
+        try:
+            self._buffers = buffers
+            return self._convert_data(data)
+        finally:
+            self.reset()
+            self._lock.release()
+
+    def convert_many(self, values):
+        """Returns a generator unserializing the specified data one by one.
+        Each data has its own references like if unserialized separately,
+        but the state of the unserializer is only setup once."""
+        if not self._lock.acquire(False):
+            # Already converting in another thread or from a recover()
+            for unpacked in self._new_context().convert_many(values):
+                yield unpacked
+            return
+        try:
+            for data in values:
+                try:
+                    yield self._convert_data(data)
+                finally:
+                    # Forget the references before the next data
+                    self._clear()
+        finally:
+            self.reset()
+            self._lock.release()
 
     ### protected ###
 
@@ -886,37 +1509,41 @@ class Unserializer(object):
 
     def reset(self):
         self._references = {}  # {REFERENCE_ID: (DATA_ID, OBJECT)}
-        self._pending = []  # Pendings unpacking
+        # Pending unpackings waiting for a reference to be restored:
+        # {REFERENCE_ID: [(FUNCTION, ARGS, KWARGS)]}
+        self._waiting = {}
+        # Pending unpackings that can be resumed
+        self._ready = collections.deque()
         self._instances = []  # [(RESTORATOR, INSTANCE, SNAPSHOT, REFID)]
         self._delayed = 0  # If we are in a delayable unpacking
         # If some snapshot has been migrated between versions
         self._migrated = False
+        self._unpacked = {}  # {DATA_ID: VALUE} unpacked ahead of time
+        self._unpacked_log = []  # [DATA_ID] in unpacking order
+        self._buffers = None  # Only set by convert_buffers()
 
     def unpack_data(self, data):
         return self._unpack_data(data, None, None)
 
     def delayed_unpacking(self, container, fun, *args, **kwargs):
         """Should be used when unpacking mutable values.
-        This allows circular references resolution by pausing serialization."""
-        try:
-            self._delayed += 1
-            blob = self._begin()
-            try:
-                fun(*args, **kwargs)
-                self._commit(blob)
-                return container
-            except DelayPacking:
-                self._rollback(blob)
-                continuation = (fun, args, kwargs)
-                self._pending.append(continuation)
-                return container
-        finally:
-            self._delayed -= 1
+        This allows circular references resolution by pausing serialization,
+        the unpacking is resumed when the missing reference is restored."""
+        self._resume(fun, args, kwargs)
+        return container
 
     def finish_unpacking(self):
-        while self._pending:
-            fun, args, kwargs = self._pending.pop(0)
-            fun(*args, **kwargs)
+        # Every pending unpacking is resumed once, when the reference
+        # it is waiting for get restored, and only then.
+        ready = self._ready
+        while ready:
+            fun, args, kwargs = ready.popleft()
+            self._resume(fun, args, kwargs)
+
+        if self._waiting:
+            refid = next(iter(self._waiting))
+            raise ValueError("Dereferencing of yet unknown reference: %s"
+                             % refid)
 
         # Initialize delayed mutable instances in creation order
         for restorator, instance, snapshot, _refid in self._instances:
@@ -941,6 +1568,15 @@ class Unserializer(object):
                              "isn't a type: %r" % (type_name, value))
         return value
 
+    def restore_buffer(self, index):
+        if self._buffers is None:
+            raise ValueError("Got out-of-band buffer %r but no buffers "
+                             "were given to the unserializer" % (index, ))
+        if not isinstance(index, int) or not 0 <= index < len(self._buffers):
+            raise ValueError("No out-of-band buffer found with index %r"
+                             % (index, ))
+        return self._buffers[index]
+
     def restore_external(self, data):
         if self._externalizer is None:
             raise ValueError("Got external reference %r but unserializer "
@@ -994,7 +1630,7 @@ class Unserializer(object):
         value = self._unpack_data(data, refid, data)
         if refid not in self._references:
             # If not yet referenced
-            self._references[refid] = (id(data), value)
+            self._register(refid, id(data), value)
         return value
 
     def restore_dereference(self, refid):
@@ -1003,98 +1639,105 @@ class Unserializer(object):
             if self._delayed > 0:
                 # If we unpacking can be delayed because we are unpacking
                 # a mutable object just delay the unpacking for later
-                raise DelayPacking()
+                raise DelayPacking(refid)
             raise ValueError("Dereferencing of yet unknown reference: %s"
                              % refid)
         _data_id, value = self._references[refid]
         return value
 
+    def extend_unpacked(self, container, values):
+        """Unpack the values appending them to the specified list.
+        If a value depends on a yet unknown reference, the values
+        already unpacked are kept and the remaining ones are appended
+        when the reference get restored."""
+        if not isinstance(values, (list, tuple)):
+            values = list(values)  # To support iterators
+        self._extend_unpacked(container, values, 0)
+
+    def add_unpacked(self, container, values):
+        """Unpack the values adding them to the specified set.
+        Values depending on yet unknown references are added
+        one by one when the references they need get restored."""
+        unpack = self.unpack_data
+        for value_data in values:
+            mark = len(self._instances)
+            try:
+                value = unpack(value_data)
+            except DelayPacking as e:
+                self._discard(mark)
+                continuation = (self.add_unpacked,
+                                (container, (value_data, )), {})
+                self._wait(e.refid, continuation)
+                continue
+            container.add(value)
+
+    def update_unpacked(self, container, pairs):
+        """Unpack the value pairs updating the specified dictionary.
+        When item order change between packing and unpacking, references
+        are not guaranteed to appear before dereferences anymore.
+        Items depending on yet unknown references are set one by one
+        when the references they need get restored."""
+        unpack = self.unpack_data
+        for key_data, value_data in pairs:
+            mark = len(self._instances)
+            try:
+                key = unpack(key_data)
+            except DelayPacking as e:
+                self._discard(mark)
+                continuation = (self.update_unpacked,
+                                (container, ((key_data, value_data), )), {})
+                self._wait(e.refid, continuation)
+                continue
+            mark = len(self._instances)
+            try:
+                container[key] = unpack(value_data)
+            except DelayPacking as e:
+                self._discard(mark)
+                continuation = (self._set_unpacked,
+                                (container, key, value_data), {})
+                self._wait(e.refid, continuation)
+
     def unpack_unordered_values(self, values):
         """Unpack an unordered list of values taking DelayPacking
-        exceptions into account to resolve circular references .
-        Used to unpack set values when order is not guaranteed by
-        the serializer. See unpack_unordered_pairs()."""
-
-        values = list(values)  # To support iterators
+        exceptions into account to resolve circular references.
+        If some values depend on yet unknown references, DelayPacking
+        is raised once all the other values have been tried.
+        See add_unpacked() to keep the values already unpacked."""
         result = []
-
-        # Try to unpack values more than one time to resolve cross references
-        max_loop = 2
-        while values and max_loop:
-            next_values = []
-            for value_data in values:
-                blob = self._begin()
-                try:
-                    # try unpacking the value
-                    value = self.unpack_data(value_data)
-                    self._commit(blob)
-                except DelayPacking:
-                    self._rollback(blob)
-                    # If it is delayed keep it for later
-                    next_values.append(value_data)
-                    continue
-                result.append(value)
-            values = next_values
-            max_loop -= 1
-
-        if values:
+        delayed = None
+        for value_data in values:
+            mark = len(self._instances)
+            try:
+                result.append(self.unpack_data(value_data))
+            except DelayPacking as e:
+                self._discard(mark)
+                if delayed is None:
+                    delayed = e
+        if delayed is not None:
             # Not all items were resolved
-            raise DelayPacking()
-
+            raise delayed
         return result
 
     def unpack_unordered_pairs(self, pairs):
         """Unpack an unordered list of value pairs taking DelayPacking
-        exceptions into account to resolve circular references .
-        Used to unpack dictionary items when the order is not guarennteed
-        by the serializer. When item order change between packing
-        and unpacking, references are not guaranteed to appear before
-        dereferences anymore. So if unpacking an item fail because
-        of unknown dereference, we must keep it aside, continue unpacking
-        the other items and continue later."""
-
-        items = [(False, k, v) for k, v in pairs]
+        exceptions into account to resolve circular references.
+        If some items depend on yet unknown references, DelayPacking
+        is raised once all the other items have been tried.
+        See update_unpacked() to keep the items already unpacked."""
         result = []
-
-        # Try to unpack items more than one time to resolve cross references
-        max_loop = 2
-        while items and max_loop:
-            next_items = []
-            for key_unpacked, key_data, value_data in items:
-                if key_unpacked:
-                    key = key_data
-                else:
-                    blob = self._begin()
-                    try:
-                        # Try unpacking the key
-                        key = self.unpack_data(key_data)
-                        self._commit(blob)
-                    except DelayPacking:
-                        self._rollback(blob)
-                        # If it is delayed keep it for later
-                        next_items.append((False, key_data, value_data))
-                        continue
-
-                blob = self._begin()
-                try:
-                    # try unpacking the value
-                    value = self.unpack_data(value_data)
-                    self._commit(blob)
-                except DelayPacking:
-                    self._rollback(blob)
-                    # If it is delayed keep it for later
-                    next_items.append((True, key, value_data))
-                    continue
-
-                # Update the container with the unpacked value and key
-                result.append((key, value))
-            items = next_items
-            max_loop -= 1
-
-        if items:
+        delayed = None
+        for key_data, value_data in pairs:
+            mark = len(self._instances)
+            try:
+                key = self.unpack_data(key_data)
+                result.append((key, self.unpack_data(value_data)))
+            except DelayPacking as e:
+                self._discard(mark)
+                if delayed is None:
+                    delayed = e
+        if delayed is not None:
             # Not all items were resolved
-            raise DelayPacking()
-
+            raise delayed
         return result
 
     ### virtual ###
@@ -1128,6 +1771,65 @@ class Unserializer(object):
         blob.extend(self._instances)
         self._instances = blob
 
+    def _discard(self, mark):
+        # Rollback the instances added after the specified mark,
+        # like _rollback() we keep the ones that has been referenced
+        instances = self._instances
+        if len(instances) > mark:
+            kept = [i for i in instances[mark:] if i[3] is not None]
+            del instances[mark:]
+            instances.extend(kept)
+
+    def _resume(self, fun, args, kwargs):
+        # Unpack in a DelayPacking protected section
+        try:
+            self._delayed += 1
+            blob = self._begin()
+            try:
+                fun(*args, **kwargs)
+                self._commit(blob)
+            except DelayPacking as e:
+                self._rollback(blob)
+                self._wait(e.refid, (fun, args, kwargs))
+        finally:
+            self._delayed -= 1
+
+    def _wait(self, refid, continuation):
+        # Keep the continuation until the reference get restored
+        if refid in self._references:
+            self._ready.append(continuation)
+            return
+        waiting = self._waiting.get(refid)
+        if waiting is None:
+            self._waiting[refid] = [continuation]
+        else:
+            waiting.append(continuation)
+
+    def _register(self, refid, data_id, value):
+        # Register a reference and schedule the unpackings waiting for it
+        self._references[refid] = (data_id, value)
+        if self._waiting:
+            waiting = self._waiting.pop(refid, None)
+            if waiting is not None:
+                self._ready.extend(waiting)
+
+    def _extend_unpacked(self, container, values, index):
+        unpack = self.unpack_data
+        append = container.append
+        try:
+            for index in range(index, len(values)):
+                mark = len(self._instances)
+                append(unpack(values[index]))
+        except DelayPacking as e:
+            # Keep the values unpacked so far, continue when possible
+            self._discard(mark)
+            continuation = (self._extend_unpacked,
+                            (container, values, index), {})
+            self._wait(e.refid, continuation)
+
+    def _set_unpacked(self, container, key, value_data):
+        container[key] = self.unpack_data(value_data)
+
     def _lookup_restorator(self, type_name):
         # Lookup the registry for a IRestorator
         restorator = self._registry.lookup(type_name)
@@ -1136,12 +1838,27 @@ class Unserializer(object):
                             % (type_name, reflect.canonical_name(self)))
         return restorator
 
+    def _pass_through(self, vtype):
+        # Support sub-classed base types and metaclasses
+        passing = bool(set(vtype.__mro__) & self.pass_through_types)
+        self._pass_through_lookup[vtype] = passing
+        return passing
+
     def _unpack_data(self, data, refid, refdata):
-        # Just return pass-through types,
-        # support sub-classed base types and metaclasses
-        if set(type(data).__mro__) & self.pass_through_types:
+        # Just return pass-through types
+        vtype = type(data)
+        passing = self._pass_through_lookup.get(vtype)
+        if passing is None:
+            passing = self._pass_through(vtype)
+        if passing:
             return data
 
+        if self._unpacked:
+            # Values already unpacked by the iterative mode
+            value = self._unpacked.pop(id(data), _OPENED)
+            if value is not _OPENED:
+                return value
+
         analysis = self.analyse_data(data)
 
         if analysis is not None:
@@ -1157,7 +1874,7 @@ class Unserializer(object):
                 container = constructor()
                 if container is not None:
                     if refid is not None:
-                        self._references[refid] = (id(refdata), container)
+                        self._register(refid, id(refdata), container)
                     return self.delayed_unpacking(container, unpacker,
                                                   self, container, data)
 
@@ -1171,7 +1888,7 @@ class Unserializer(object):
                 restorator, instance = prepared
 
                 if refid is not None:
-                    self._references[refid] = (id(refdata), instance)
+                    self._register(refid, id(refdata), instance)
                 return self.delayed_unpacking(instance, unpacker, self, data,
                                               refid, restorator, instance)
 
@@ -1179,6 +1896,169 @@ class Unserializer(object):
                         % (type(data).__name__,
                            reflect.canonical_name(self)))
 
+    def _convert_data(self, data):
+        # Pre-convert the data if a convertor was specified
+        converted = self.pre_convertion(data)
+        if self._iterative:
+            # Unpack the values bottom-up without recursion
+            unpacked = self._unpack_iteratively(converted)
+        else:
+            # Unpack the first level of values
+            unpacked = self.unpack_data(converted)
+        return self._finish_data(unpacked)
+
+    def _finish_data(self, unpacked):
+        # Continue unpacking level by level
+        self.finish_unpacking()
+        # Inform object that it has migrated if this is a case
+        if (IVersionAdapter.providedBy(unpacked) and
+                self._migrated):
+            unpacked.set_migrated()
+
+        # Should be finished by now
+        return unpacked
+
+    def _clear(self):
+        # Cleanup the state between data, reusing the containers
+        if self._references:
+            self._references.clear()
+        if self._waiting:
+            self._waiting.clear()
+        if self._ready:
+            self._ready.clear()
+        if self._instances:
+            del self._instances[:]
+        if self._unpacked_log:
+            self._unpacked.clear()
+            del self._unpacked_log[:]
+        self._delayed = 0
+        self._migrated = False
+
+    def _new_context(self):
+        # Returns an unserializer sharing the configuration but not the state
+        context = copy.copy(self)
+        context._lock = threading.Lock()
+        context.reset()
+        return context
+
+    def _unpack_iteratively(self, data):
+        stack = []
+        if not self._open_data(stack, data, None, None):
+            return self._unpack_data(data, None, None)
+        while True:
+            frame = stack[-1]
+            child = next(frame.todo, _OPENED)
+            if child is not _OPENED:
+                # Values composing the data are unpacked first
+                self._open_data(stack, child, frame.refid, frame.refdata)
+                continue
+            stack.pop()
+            try:
+                value = self._close_data(frame)
+            except DelayPacking:
+                # Give up on the values depending on unknown references,
+                # the mutable value containing them will be retried later
+                while stack and not stack[-1].mutable:
+                    stack.pop()
+                if not stack:
+                    raise
+                continue
+            if not stack:
+                return value
+            # Keep the value for when its parent will be unpacked
+            ident = id(frame.data)
+            self._unpacked[ident] = value
+            self._unpacked_log.append(ident)
+
+    def _open_data(self, stack, data, refid, refdata):
+        # Push the data on the stack if it is composed of other values,
+        # returns False if it can be unpacked right away.
+        vtype = type(data)
+        passing = self._pass_through_lookup.get(vtype)
+        if passing is None:
+            passing = self._pass_through(vtype)
+        if passing:
+            return False
+
+        analysis = self.analyse_data(data)
+        if analysis is None:
+            return False
+
+        constructor, unpacker = analysis
+
+        reference = self._reference_lookup.get(unpacker)
+        if reference is not None:
+            # The referenced value is unpacked knowing its identifier
+            child_refid, child_data = reference(data)
+            frame = _Unpacking(data, unpacker, (self, data), [child_data],
+                               len(self._unpacked_log))
+            frame.refid, frame.refdata = child_refid, child_data
+            stack.append(frame)
+            return True
+
+        children = self._children_lookup.get(unpacker)
+        if children is None:
+            return False
+
+        if constructor is None:
+            # Immutable types
+            args = (self, data)
+            value = None
+        elif callable(constructor):
+            value = constructor()
+            if value is None:
+                return False
+            args = (self, value, data)
+        else:
+            prepared = self.prepare_instance(constructor)
+            if prepared is None:
+                # Immutable instance
+                args = (self, data, None, None, None)
+                value = None
+            else:
+                restorator, value = prepared
+                args = (self, data, refid, restorator, value)
+
+        frame = _Unpacking(data, unpacker, args, children(data),
+                           len(self._unpacked_log))
+        if value is not None:
+            # Mutable values are registered before unpacking the values
+            # they are composed of to resolve circular references
+            if refid is not None:
+                self._register(refid, id(refdata), value)
+            frame.mutable = True
+            frame.value = value
+            self._delayed += 1
+            frame.blob = self._begin()
+        stack.append(frame)
+        return True
+
+    def _close_data(self, frame):
+        # Unpack the data, the values composing it should be unpacked
+        try:
+            if not frame.mutable:
+                return frame.unpacker(*frame.args)
+            try:
+                frame.unpacker(*frame.args)
+                self._commit(frame.blob)
+            except DelayPacking as e:
+                self._rollback(frame.blob)
+                continuation = (frame.unpacker, frame.args, {})
+                self._wait(e.refid, continuation)
+            finally:
+                self._delayed -= 1
+            return frame.value
+        finally:
+            self._forget(frame.mark)
+
+    def _forget(self, mark):
+        # Discard the values unpacked ahead that did not get used
+        log = self._unpacked_log
+        if len(log) > mark:
+            for ident in log[mark:]:
+                self._unpacked.pop(ident, None)
+            del log[mark:]
+
     def _continue_restoring_instance(self, restorator, instance, data, refid):
         snapshot = self.unpack_data(data)
         # Delay instance initialization to the end to be sure
@@ -1205,6 +2085,54 @@ class Unserializer(object):
         return self._source_ver
 
 
+@implementer(IFreezer, IConverter)
+class Pool(object):
+    """Thread-safe pool of converters created by a factory when needed.
+
+    Serializers and unserializers can be shared between threads, but
+    a conversion started while another one is running uses a context
+    of its own. A pool keeps warmed-up converters to be used by only
+    one conversion at a time instead. At most size idle converters
+    are kept, without limit if size is None::
+
+      > pool = Pool(functools.partial(json_.Serializer, indent=2))
+      > pool.convert([1, 2, 3])
+    """
+
+    def __init__(self, factory, size=None):
+        self._factory = factory
+        self._size = size
+        self._idle = collections.deque()
+
+    def acquire(self):
+        try:
+            return self._idle.pop()
+        except IndexError:
+            return self._factory()
+
+    def release(self, converter):
+        if self._size is None or len(self._idle) < self._size:
+            self._idle.append(converter)
+
+    ### IFreezer ###
+
+    def freeze(self, data):
+        converter = self.acquire()
+        try:
+            return converter.freeze(data)
+        finally:
+            self.release(converter)
+
+    ### IConverter ###
+
+    def convert(self, data):
+        converter = self.acquire()
+        try:
+            return converter.convert(data)
+        finally:
+            self.release(converter)
+
+
 ### private ###
 
 _global_registry = Registry()
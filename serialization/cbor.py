@@ -0,0 +1,456 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+
+"""Binary converters using the CBOR format, see RFC 8949.
+
+References use the shared value tags of the IANA registry: the first
+occurrence of a referenced value is tagged 28 and the others are
+tag 29 with the index of the tagged value, in document order. Sets use
+the registered tag 258 and instances the tag 27 with the type name and
+the snapshot. Integers too big for 64 bits are bignums. Other values
+without CBOR counterpart have tags of the first come first served range:
+
+    tuple     TAG_TUPLE     [VALUE, ...]
+    enum      TAG_ENUM      "module.Enum.NAME"
+    type      TAG_TYPE      "module.Type"
+    external  TAG_EXTERNAL  IDENTIFIER
+    function  TAG_FUNCTION  "module.function"
+    buffer    TAG_BUFFER    INDEX
+
+Dictionaries are maps, their keys can be any of the values above.
+"""
+
+from __future__ import absolute_import
+
+import binascii
+import codecs
+import struct
+
+from past.types import unicode, long
+
+from serialization import tagged
+
+
+TAG_BIGNUM = 2
+TAG_NEGATIVE_BIGNUM = 3
+TAG_INSTANCE = 27
+TAG_SHAREABLE = 28
+TAG_SHARED = 29
+TAG_SET = 258
+TAG_TUPLE = 0xf3a0
+TAG_ENUM = 0xf3a1
+TAG_TYPE = 0xf3a2
+TAG_EXTERNAL = 0xf3a3
+TAG_FUNCTION = 0xf3a4
+TAG_BUFFER = 0xf3a5
+
+CBOR_CONVERTER_CAPS = tagged.TAGGED_CONVERTER_CAPS
+
+CBOR_FREEZER_CAPS = tagged.TAGGED_FREEZER_CAPS
+
+Map = tagged.Map
+
+
+class Tag(tagged.Tagged):
+    """CBOR tagged value. The value of shareable tags is a list with
+    the identifier of the reference and the shared value, the value of
+    shared tags is the identifier."""
+
+    __slots__ = ()
+
+
+def encode(data, buf=None):
+    """Appends the CBOR document of a value made of basic types, Map
+    and Tag instances to a bytearray and returns it. The identifiers
+    of the references are replaced by their index in the document."""
+    encoder = Encoder(buf)
+    encoder.write(data)
+    return encoder.buf
+
+
+def decode(data):
+    """Returns the value of a CBOR document given as any object
+    supporting the buffer protocol, the references are identified
+    by their index in the document."""
+    decoder = Decoder(data)
+    value, pos = decoder.read(0)
+    if pos != len(decoder.data):
+        raise ValueError("Extra data after the CBOR document "
+                         "at offset %d" % pos)
+    return value
+
+
+class Serializer(tagged.Serializer):
+    """Serializes to CBOR documents given as bytes."""
+
+    tagged_class = Tag
+    tuple_tag = TAG_TUPLE
+    set_tag = TAG_SET
+    instance_tag = TAG_INSTANCE
+    reference_tag = TAG_SHAREABLE
+    dereference_tag = TAG_SHARED
+    enum_tag = TAG_ENUM
+    type_tag = TAG_TYPE
+    external_tag = TAG_EXTERNAL
+    function_tag = TAG_FUNCTION
+    buffer_tag = TAG_BUFFER
+
+    ### Overridden Methods ###
+
+    def post_convertion(self, data):
+        return bytes(encode(data))
+
+
+class Unserializer(tagged.Unserializer):
+    """Unserializes CBOR documents given as any object supporting
+    the buffer protocol."""
+
+    tagged_class = Tag
+    instance_tag = TAG_INSTANCE
+
+    ### Overridden Methods ###
+
+    def pre_convertion(self, data):
+        return decode(data)
+
+    ### lookup tables ###
+
+    _tag_unpackers = tagged.tag_unpackers(tuple=TAG_TUPLE,
+                                          set=TAG_SET,
+                                          reference=TAG_SHAREABLE,
+                                          dereference=TAG_SHARED,
+                                          enum=TAG_ENUM,
+                                          type=TAG_TYPE,
+                                          external=TAG_EXTERNAL,
+                                          function=TAG_FUNCTION,
+                                          buffer=TAG_BUFFER)
+
+
+class Encoder(object):
+    """Writes CBOR documents at the end of a bytearray."""
+
+    def __init__(self, buf=None):
+        self.buf = bytearray() if buf is None else buf
+        self._shared = {}  # {REFID: INDEX}
+
+    ### Public Methods ###
+
+    def write(self, value):
+        try:
+            writer = self._writers[type(value)]
+        except KeyError:
+            raise TypeError("Object of type %s is not CBOR serializable"
+                            % type(value).__name__)
+        writer(self, value)
+
+    ### Private Methods ###
+
+    def _write_head(self, major, argument):
+        if argument < 24:
+            self.buf.append(major | argument)
+        elif argument < 0x100:
+            self.buf += _HEAD8(major | 24, argument)
+        elif argument < 0x10000:
+            self.buf += _HEAD16(major | 25, argument)
+        elif argument < 0x100000000:
+            self.buf += _HEAD32(major | 26, argument)
+        else:
+            self.buf += _HEAD64(major | 27, argument)
+
+    def _write_none(self, value):
+        self.buf.append(0xf6)
+
+    def _write_bool(self, value):
+        self.buf.append(0xf5 if value else 0xf4)
+
+    def _write_int(self, value):
+        if value >= 0:
+            if value < 0x10000000000000000:
+                self._write_head(0x00, value)
+            else:
+                self._write_bignum(TAG_BIGNUM, value)
+        else:
+            value = -1 - value
+            if value < 0x10000000000000000:
+                self._write_head(0x20, value)
+            else:
+                self._write_bignum(TAG_NEGATIVE_BIGNUM, value)
+
+    def _write_bignum(self, tag, value):
+        size = (value.bit_length() + 7) // 8
+        self._write_head(0xc0, tag)
+        self._write_bytes(binascii.unhexlify("%0*x" % (size * 2, value)))
+
+    def _write_float(self, value):
+        self.buf += _FLOAT64(0xfb, value)
+
+    def _write_unicode(self, value):
+        data = value.encode("utf-8")
+        self._write_head(0x60, len(data))
+        self.buf += data
+
+    def _write_bytes(self, value):
+        self._write_head(0x40, len(value))
+        self.buf += value
+
+    def _write_memoryview(self, value):
+        # The size is given in bytes whatever the format of the items,
+        # only contiguous views can be cast to bytes
+        if not value.c_contiguous:
+            self._write_bytes(value.tobytes())
+        else:
+            self._write_bytes(value.cast("B"))
+
+    def _write_list(self, value):
+        self._write_head(0x80, len(value))
+        write = self.write
+        for item in value:
+            write(item)
+
+    def _write_map(self, value):
+        pairs = value.pairs
+        self._write_head(0xa0, len(pairs))
+        write = self.write
+        for key, item in pairs:
+            write(key)
+            write(item)
+
+    def _write_tag(self, value):
+        tag = value.tag
+        if tag == TAG_SHAREABLE:
+            refid, value = value.value
+            self._shared[refid] = len(self._shared)
+        elif tag == TAG_SHARED:
+            refid = value.value
+            if refid not in self._shared:
+                raise ValueError("Shared value %s referenced before "
+                                 "being written" % (refid, ))
+            value = self._shared[refid]
+        else:
+            value = value.value
+        self._write_head(0xc0, tag)
+        self.write(value)
+
+    ### lookup tables ###
+
+    _writers = {type(None): _write_none,
+                bool: _write_bool,
+                int: _write_int,
+                long: _write_int,
+                float: _write_float,
+                unicode: _write_unicode,
+                bytes: _write_bytes,
+                bytearray: _write_bytes,
+                memoryview: _write_memoryview,
+                list: _write_list,
+                tuple: _write_list,
+                Map: _write_map,
+                Tag: _write_tag}
+
+
+class Decoder(object):
+    """Reads CBOR documents from a buffer, strings are decoded
+    from slices of the buffer without copying them first."""
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self._shared = 0
+
+    ### Public Methods ###
+
+    def read(self, pos):
+        """Returns the value starting at the given offset and the
+        offset of the following value."""
+        data = self.data
+        try:
+            initial = data[pos]
+        except IndexError:
+            raise ValueError("Unexpected end of CBOR document")
+        if not isinstance(initial, int):
+            initial = ord(initial)
+        pos += 1
+        major = initial >> 5
+        info = initial & 0x1f
+        if major == 7:
+            return self._read_simple(pos, info)
+        if info < 24:
+            argument = info
+        elif info == 31:
+            if major < 2 or major == 6:
+                raise ValueError("Invalid indefinite length at offset %d"
+                                 % (pos - 1))
+            return self._indefinite_readers[major](self, pos)
+        else:
+            unpack = _ARGUMENTS.get(info)
+            if unpack is None:
+                raise ValueError("Invalid CBOR value 0x%02x at offset %d"
+                                 % (initial, pos - 1))
+            argument, = unpack(data, pos)
+            pos += _ARGUMENT_SIZES[info]
+        return self._readers[major](self, pos, argument)
+
+    ### Private Methods ###
+
+    def _slice(self, pos, size):
+        end = pos + size
+        if end > len(self.data):
+            raise ValueError("Unexpected end of CBOR document")
+        return self.data[pos:end], end
+
+    def _read_uint(self, pos, argument):
+        return argument, pos
+
+    def _read_negint(self, pos, argument):
+        return -1 - argument, pos
+
+    def _read_bytes(self, pos, argument):
+        value, pos = self._slice(pos, argument)
+        return value.tobytes(), pos
+
+    def _read_unicode(self, pos, argument):
+        value, pos = self._slice(pos, argument)
+        return _decode_utf8(value, "strict", True)[0], pos
+
+    def _read_list(self, pos, argument):
+        result = []
+        append = result.append
+        read = self.read
+        for _ in range(argument):
+            value, pos = read(pos)
+            append(value)
+        return result, pos
+
+    def _read_map(self, pos, argument):
+        pairs = []
+        append = pairs.append
+        read = self.read
+        for _ in range(argument):
+            key, pos = read(pos)
+            value, pos = read(pos)
+            append((key, value))
+        return Map(pairs), pos
+
+    def _read_tag(self, pos, tag):
+        if tag == TAG_SHAREABLE:
+            # The index is taken before reading the shared value
+            # for the value to be able to reference itself
+            index = self._shared
+            self._shared += 1
+            value, pos = self.read(pos)
+            return Tag(tag, [index, value]), pos
+        if tag in (TAG_BIGNUM, TAG_NEGATIVE_BIGNUM):
+            value, pos = self.read(pos)
+            if not isinstance(value, bytes):
+                raise ValueError("Invalid CBOR bignum")
+            value = int(binascii.hexlify(value), 16) if value else 0
+            return (value if tag == TAG_BIGNUM else -1 - value), pos
+        if tag not in _TAGS:
+            raise ValueError("Unknown CBOR tag %d" % tag)
+        value, pos = self.read(pos)
+        return Tag(tag, value), pos
+
+    def _read_simple(self, pos, info):
+        if info < 24:
+            value = _SIMPLE_VALUES.get(info)
+            if info not in _SIMPLE_VALUES:
+                raise ValueError("Unknown CBOR simple value %d" % info)
+            return value, pos
+        unpack = _FLOATS.get(info)
+        if unpack is None:
+            raise ValueError("Invalid CBOR value 0x%02x at offset %d"
+                             % (0xe0 | info, pos - 1))
+        value, = unpack(self.data, pos)
+        return value, pos + _ARGUMENT_SIZES[info]
+
+    def _read_chunks(self, pos, major):
+        chunks = []
+        while not self._at_break(pos):
+            chunk, pos = self.read(pos)
+            if type(chunk) is not type(major):
+                raise ValueError("Invalid chunk of indefinite length "
+                                 "CBOR string")
+            chunks.append(chunk)
+        return type(major)().join(chunks), pos + 1
+
+    def _read_indefinite_bytes(self, pos):
+        return self._read_chunks(pos, b"")
+
+    def _read_indefinite_unicode(self, pos):
+        return self._read_chunks(pos, u"")
+
+    def _read_indefinite_list(self, pos):
+        result = []
+        while not self._at_break(pos):
+            value, pos = self.read(pos)
+            result.append(value)
+        return result, pos + 1
+
+    def _read_indefinite_map(self, pos):
+        pairs = []
+        while not self._at_break(pos):
+            key, pos = self.read(pos)
+            value, pos = self.read(pos)
+            pairs.append((key, value))
+        return Map(pairs), pos + 1
+
+    def _at_break(self, pos):
+        if pos >= len(self.data):
+            raise ValueError("Unexpected end of CBOR document")
+        return self.data[pos:pos + 1] == b"\xff"
+
+    ### lookup tables ###
+
+    _readers = [_read_uint, _read_negint, _read_bytes, _read_unicode,
+                _read_list, _read_map, _read_tag]
+
+    _indefinite_readers = {2: _read_indefinite_bytes,
+                           3: _read_indefinite_unicode,
+                           4: _read_indefinite_list,
+                           5: _read_indefinite_map}
+
+
+### private ###
+
+_decode_utf8 = codecs.utf_8_decode
+
+_HEAD8 = struct.Struct(">BB").pack
+_HEAD16 = struct.Struct(">BH").pack
+_HEAD32 = struct.Struct(">BI").pack
+_HEAD64 = struct.Struct(">BQ").pack
+_FLOAT64 = struct.Struct(">Bd").pack
+
+_ARGUMENTS = {24: struct.Struct(">B").unpack_from,
+              25: struct.Struct(">H").unpack_from,
+              26: struct.Struct(">I").unpack_from,
+              27: struct.Struct(">Q").unpack_from}
+
+_FLOATS = {25: struct.Struct(">e").unpack_from,
+           26: struct.Struct(">f").unpack_from,
+           27: struct.Struct(">d").unpack_from}
+
+_ARGUMENT_SIZES = {24: 1, 25: 2, 26: 4, 27: 8}
+
+# Undefined is restored as None
+_SIMPLE_VALUES = {20: False, 21: True, 22: None, 23: None}
+
+_TAGS = set([TAG_INSTANCE, TAG_SHARED, TAG_SET, TAG_TUPLE, TAG_ENUM,
+             TAG_TYPE, TAG_EXTERNAL, TAG_FUNCTION, TAG_BUFFER])
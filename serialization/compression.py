@@ -0,0 +1,441 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+
+"""Compression of the output of the serializers.
+
+L{Compressor} and L{Decompressor} are converters compressing the output
+of a serializer and decompressing the input of an unserializer, either
+wrapping them or chained as their post/pre-converters. L{Writer} and
+L{Reader} are file-like objects compressing the documents streamed by
+the dump() methods of the serializers and decompressing the ones read
+by the load() methods of the unserializers. Text is compressed as UTF-8.
+
+The codecs are zlib and lzma from the standard library and zstd when
+the zstandard package is installed. Small documents compress better
+with a preset dictionary, built from sample documents by
+L{train_dictionary}, only supported by zlib and zstd::
+
+    dictionary = train_dictionary(samples)
+    serializer = Compressor(ZLIB, dictionary=dictionary,
+                            converter=json_.Serializer())
+    unserializer = Decompressor(ZLIB, dictionary=dictionary,
+                                converter=json_.Unserializer())
+
+Data found after the end of the compressed data is rejected like
+truncated data, with a ValueError. The module needs Python 3.3 or
+later: the end of the compressed data is given by the eof attribute
+of the decompressors and zlib only supports preset dictionaries
+since that version.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import heapq
+import zlib
+
+from past.types import unicode
+from future.utils import PY3
+from zope.interface import implementer
+
+from serialization.interface import IConverter
+
+ZLIB = "zlib"
+LZMA = "lzma"
+ZSTD = "zstd"
+
+# Size of the dictionaries by default, the window of zlib
+DICTIONARY_SIZE = 32 * 1024
+READ_BUFFER_SIZE = 64 * 1024
+
+
+class Codec(object):
+    """Compresses and decompresses bytes. Sub-classes relying on
+    an optional library raise ImportError when created if it is not
+    installed, and ValueError if they cannot honour the options."""
+
+    name = None
+
+    def __init__(self, level=None, dictionary=None):
+        self.level = level
+        self.dictionary = dictionary
+
+    def compress(self, data):
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = self.decompressor()
+        result = decompressor.decompress(data)
+        if not decompressor.eof:
+            raise ValueError("Truncated %s data" % self.name)
+        if decompressor.unused_data:
+            raise ValueError("Extra data after the end of the %s data"
+                             % self.name)
+        return result
+
+    def train(self, samples, size=DICTIONARY_SIZE):
+        """Returns a dictionary of at most size bytes for data
+        looking like the given samples."""
+        return _cover_dictionary(samples, size)
+
+    ### virtual ###
+
+    def compressor(self):
+        """Returns an object with a compress(data) method returning
+        the compressed data available so far and a flush() method
+        returning the rest of it."""
+
+    def decompressor(self):
+        """Returns an object with a decompress(data) method returning
+        the decompressed data available so far, an eof attribute
+        telling if the end of the compressed data was reached and
+        an unused_data attribute with the data found after it."""
+
+    def sync(self, compressor):
+        """Returns the data pending in the compressor, making all
+        the data compressed so far available to a decompressor."""
+        return b""
+
+
+class ZlibCodec(Codec):
+    """Codec using the standard library zlib module, levels
+    are from 0 to 9."""
+
+    name = ZLIB
+
+    def __init__(self, level=None, dictionary=None):
+        if dictionary is not None and not PY3:
+            raise ValueError("zlib only supports preset dictionaries "
+                             "on Python 3")
+        Codec.__init__(self, level=level, dictionary=dictionary)
+        self._level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        self._options = {} if dictionary is None else {"zdict": dictionary}
+
+    def compress(self, data):
+        if not self._options:
+            return zlib.compress(data, self._level)
+        return Codec.compress(self, data)
+
+    def compressor(self):
+        return zlib.compressobj(self._level, zlib.DEFLATED, zlib.MAX_WBITS,
+                                zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY,
+                                **self._options)
+
+    def decompressor(self):
+        return zlib.decompressobj(zlib.MAX_WBITS, **self._options)
+
+    def sync(self, compressor):
+        return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class LzmaCodec(Codec):
+    """Codec using the standard library lzma module with the xz format,
+    levels are the presets from 0 to 9. Dictionaries are not supported."""
+
+    name = LZMA
+
+    def __init__(self, level=None, dictionary=None):
+        import lzma
+        if dictionary is not None:
+            raise ValueError("lzma do not support preset dictionaries")
+        Codec.__init__(self, level=level)
+        self._lzma = lzma
+
+    def compress(self, data):
+        return self._lzma.compress(data, preset=self.level)
+
+    def compressor(self):
+        return self._lzma.LZMACompressor(preset=self.level)
+
+    def decompressor(self):
+        return self._lzma.LZMADecompressor()
+
+    def train(self, samples, size=DICTIONARY_SIZE):
+        raise ValueError("lzma do not support preset dictionaries")
+
+
+class ZstdCodec(Codec):
+    """Codec using the zstandard package, levels are from 1 to 22."""
+
+    name = ZSTD
+
+    def __init__(self, level=None, dictionary=None):
+        import zstandard
+        Codec.__init__(self, level=level, dictionary=dictionary)
+        options = {}
+        if dictionary is not None:
+            options["dict_data"] = zstandard.ZstdCompressionDict(dictionary)
+        self._compressor = zstandard.ZstdCompressor(
+            level=3 if level is None else level, **options)
+        self._decompressor = zstandard.ZstdDecompressor(**options)
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._train = zstandard.train_dictionary
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def decompress(self, data):
+        try:
+            return Codec.decompress(self, data)
+        except ValueError:
+            raise
+        except Exception as e:
+            # zstandard.ZstdError is not a ValueError
+            raise ValueError(str(e))
+
+    def compressor(self):
+        return self._compressor.compressobj()
+
+    def decompressor(self):
+        return self._decompressor.decompressobj()
+
+    def sync(self, compressor):
+        return compressor.flush(self._flush_block)
+
+    def train(self, samples, size=DICTIONARY_SIZE):
+        return self._train(size, [_bytes(s) for s in samples]).as_bytes()
+
+
+def register_codec(codec):
+    """Registers a L{Codec} sub-class under its name."""
+    _codecs[codec.name] = codec
+    return codec
+
+
+def available_codecs():
+    """Returns the names of the registered codecs
+    whose library is installed."""
+    names = []
+    for name, codec in _codecs.items():
+        try:
+            codec()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_codec(name=ZLIB, level=None, dictionary=None):
+    """Returns the codec registered with the specified name created
+    with the specified options, a L{Codec} instance is returned as is."""
+    if isinstance(name, Codec):
+        return name
+    codec = _codecs.get(name)
+    if codec is None:
+        raise ValueError("Unknown compression codec: %r" % (name, ))
+    return codec(level=level, dictionary=dictionary)
+
+
+def train_dictionary(samples, codec=ZLIB, size=DICTIONARY_SIZE):
+    """Returns a preset dictionary of at most size bytes for the codec
+    built from sample documents given as bytes or text."""
+    return get_codec(codec).train(samples, size)
+
+
+@implementer(IConverter)
+class Compressor(object):
+    """Converter compressing its input. If a converter is specified
+    the input is first converted by it, for example a serializer or the
+    L{banana.Encoder} of a L{sexp} serializer post-converter."""
+
+    def __init__(self, codec=ZLIB, level=None, dictionary=None,
+                 converter=None):
+        self._codec = get_codec(codec, level=level, dictionary=dictionary)
+        self._converter = converter and IConverter(converter)
+
+    ### IConverter ###
+
+    def convert(self, data):
+        if self._converter is not None:
+            data = self._converter.convert(data)
+        return self._codec.compress(_bytes(data))
+
+
+@implementer(IConverter)
+class Decompressor(object):
+    """Converter decompressing its input. If a converter is specified
+    the decompressed data is then converted by it, for example an
+    unserializer or the L{banana.Decoder} of a L{sexp} unserializer
+    pre-converter."""
+
+    def __init__(self, codec=ZLIB, dictionary=None, converter=None):
+        self._codec = get_codec(codec, dictionary=dictionary)
+        self._converter = converter and IConverter(converter)
+
+    ### IConverter ###
+
+    def convert(self, data):
+        data = self._codec.decompress(_bytes(data))
+        if self._converter is not None:
+            data = self._converter.convert(data)
+        return data
+
+
+class Writer(object):
+    """File-like object compressing the bytes or text written to it
+    to another file-like object. Closing it ends the compressed data
+    but does not close the underlying file."""
+
+    def __init__(self, fp, codec=ZLIB, level=None, dictionary=None):
+        self._fp = fp
+        self._codec = get_codec(codec, level=level, dictionary=dictionary)
+        self._compressor = self._codec.compressor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    ### Public Methods ###
+
+    def write(self, data):
+        if self._compressor is None:
+            raise ValueError("Write to a closed compressed file")
+        compressed = self._compressor.compress(_bytes(data))
+        if compressed:
+            self._fp.write(compressed)
+        return len(data)
+
+    def flush(self):
+        """Writes the data compressed so far, it can then be
+        decompressed without waiting for the writer to be closed.
+        The lzma codec only writes it when closed."""
+        if self._compressor is not None:
+            self._fp.write(self._codec.sync(self._compressor))
+        getattr(self._fp, "flush", lambda: None)()
+
+    def close(self):
+        if self._compressor is not None:
+            self._fp.write(self._compressor.flush())
+            self._compressor = None
+            getattr(self._fp, "flush", lambda: None)()
+
+
+class Reader(object):
+    """File-like object reading the decompressed bytes of the data read
+    from another file-like object, until the end of the compressed data.
+    The compressed data is read by blocks, a ValueError is raised if
+    the block it ends in has more data after it."""
+
+    def __init__(self, fp, codec=ZLIB, dictionary=None):
+        self._fp = fp
+        self._codec = get_codec(codec, dictionary=dictionary)
+        self._decompressor = self._codec.decompressor()
+        self._buffer = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    ### Public Methods ###
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        available = len(self._buffer)
+        while size < 0 or available < size:
+            if self._decompressor.eof:
+                break
+            data = self._fp.read(READ_BUFFER_SIZE)
+            if not data:
+                raise ValueError("Truncated %s data" % self._codec.name)
+            chunk = self._decompressor.decompress(data)
+            if self._decompressor.unused_data:
+                raise ValueError("Extra data after the end of the %s data"
+                                 % self._codec.name)
+            chunks.append(chunk)
+            available += len(chunk)
+        data = b"".join(chunks)
+        if size < 0:
+            self._buffer = b""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def close(self):
+        self._buffer = b""
+
+
+_codecs = {}  # {NAME: CODEC}
+
+register_codec(ZlibCodec)
+register_codec(LzmaCodec)
+register_codec(ZstdCodec)
+
+
+### private ###
+
+def _bytes(data):
+    if isinstance(data, unicode):
+        return data.encode("utf-8")
+    return data
+
+
+def _cover_dictionary(samples, size, segment_size=64, dmer_size=8):
+    # Simplified COVER algorithm used by zstd: the dictionary is made of
+    # the segments of the samples covering the most d-mers found in
+    # several samples, the best segments last so they are the closest.
+    samples = [_bytes(s) for s in samples]
+    frequencies = collections.Counter()
+    for sample in samples:
+        frequencies.update(set(sample[i:i + dmer_size]
+                               for i in range(len(sample) - dmer_size + 1)))
+
+    def dmers(segment):
+        return set(segment[i:i + dmer_size]
+                   for i in range(len(segment) - dmer_size + 1))
+
+    def score(segment):
+        return sum(frequencies[d] for d in dmers(segment)
+                   if frequencies[d] > 1)
+
+    step = segment_size // 4
+    segments = set()
+    for sample in samples:
+        last = max(len(sample) - segment_size, 0)
+        for start in range(0, last + step, step):
+            segments.add(sample[start:start + segment_size])
+    heap = [(-score(s), s) for s in segments]
+    heapq.heapify(heap)
+
+    chosen = []
+    total = 0
+    while heap and total < size:
+        _, segment = heapq.heappop(heap)
+        current = score(segment)
+        if current <= 0:
+            break
+        if heap and current < -heap[0][0]:
+            # Lazy greedy: the score only decreases, try again later
+            heapq.heappush(heap, (-current, segment))
+            continue
+        chosen.append(segment)
+        total += len(segment)
+        for dmer in dmers(segment):
+            # Already covered
+            frequencies[dmer] = 0
+
+    chosen.reverse()
+    return b"".join(chosen)[-size:] if chosen else b""
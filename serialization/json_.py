@@ -26,18 +26,33 @@ from past.types import unicode, long
 from future.utils import PY3
 
 import base64
+import binascii
+import codecs
+import copy
+import functools
+import itertools
+import math
+import re
 
 import json
 
 from serialization import reflect
-from serialization.interface import Capabilities
-from serialization import base
+from serialization.interface import (Capabilities, ISerializable,
+                                     IVersionAdapter)
+from serialization import base, formatable
 
 
 TUPLE_ATOM = u".tuple"
 BYTES_ATOM = u".bytes"
 BYTES_ENCODING = "BASE64"
+# Encodings of the bytes values, UTF8 means the bytes are stored
+# as text when they can be decoded and in BASE64 otherwise
+BYTES_UTF8 = "UTF8"
+BYTES_BASE64 = "BASE64"
+BYTES_BASE85 = "BASE85"
+BYTES_HEX = "HEX"
 ENCODED_ATOM = u".enc"
+BUFFER_ATOM = u".buffer"
 SET_ATOM = u".set"
 ENUM_ATOM = u".enum"
 TYPE_ATOM = u".type"
@@ -47,8 +62,13 @@ DEREFERENCE_ATOM = u".deref"
 FUNCTION_ATOM = u".function"
 INSTANCE_TYPE_ATOM = u".type"
 INSTANCE_STATE_ATOM = u".state"
+TYPES_ATOM = u".types"
 
 DEFAULT_ENCODING = "UTF8"
+# Size of the text written at once by Serializer.dump()
+DUMP_BUFFER_SIZE = 64 * 1024
+# Size of the chunks read at once by Unserializer.load()
+LOAD_BUFFER_SIZE = 64 * 1024
 ALLOWED_CODECS = set(["UTF8", "UTF-8", "utf8"])
 
 JSON_CONVERTER_CAPS = set([Capabilities.int_values,
@@ -77,21 +97,583 @@ JSON_FREEZER_CAPS = JSON_CONVERTER_CAPS \
            Capabilities.method_values])
 
 
+class Backend(object):
+    """Encodes and decodes JSON documents for the serializer and the
+    unserializer. Sub-classes relying on an optional library raise
+    ImportError when created if it is not installed, and ValueError
+    if they cannot honour the requested formatting options.
+    Documents they fail to encode or decode are handled by the standard
+    library json module, which is the only one encoding documents
+    incrementally."""
+
+    name = None
+
+    def __init__(self, indent=None, separators=None, sort_keys=False,
+                 encoding=None):
+        self._fallback = StdlibBackend(indent=indent, separators=separators,
+                                       sort_keys=sort_keys, encoding=encoding)
+
+    def encode(self, data):
+        try:
+            return self.encode_document(data)
+        except (TypeError, ValueError, OverflowError):
+            return self._fallback.encode(data)
+
+    def iterencode(self, data):
+        yield self.encode(data)
+
+    def decode(self, data):
+        if isinstance(data, bytes):
+            data = data.decode(DEFAULT_ENCODING)
+        try:
+            return self.decode_document(data)
+        except (ValueError, OverflowError):
+            return self._fallback.decode(data)
+
+    ### virtual ###
+
+    def encode_document(self, data):
+        """Returns the JSON document of the packed data as text."""
+
+    def decode_document(self, text):
+        """Returns the data parsed from the JSON document text."""
+
+
+class StdlibBackend(Backend):
+    """Backend using the standard library json module."""
+
+    name = "json"
+
+    def __init__(self, indent=None, separators=None, sort_keys=False,
+                 encoding=None):
+        # Same encoder json.dumps() would create for each conversion
+        options = dict(indent=indent, separators=separators,
+                       sort_keys=sort_keys)
+        if encoding is not None:
+            options["encoding"] = encoding
+        self._encoder = json.JSONEncoder(**options)
+        self._encoding = encoding
+
+    def encode(self, data):
+        return self._encoder.encode(data)
+
+    def iterencode(self, data):
+        return self._encoder.iterencode(data)
+
+    def decode(self, data):
+        if isinstance(data, bytes):
+            if self._encoding is None:
+                return json.loads(data.decode(DEFAULT_ENCODING))
+            return json.loads(data, encoding=self._encoding)
+        return json.loads(data)
+
+
+class OrjsonBackend(Backend):
+    """Backend using orjson. Only indentation of 2 spaces and compact
+    separators are supported and non-ASCII characters are not escaped.
+    Documents with non-finite floats, that orjson writes as null,
+    are encoded by the standard library."""
+
+    name = "orjson"
+
+    # orjson decodes integers not fitting in 64 bits as floats
+    _long_integer = re.compile(r"[0-9]{19}")
+
+    def __init__(self, indent=None, separators=None, sort_keys=False,
+                 encoding=None):
+        import orjson
+        if encoding is not None:
+            raise ValueError("orjson only supports UTF-8")
+        option = orjson.OPT_SORT_KEYS if sort_keys else 0
+        if indent is not None:
+            if indent != 2 or separators not in (None, (",", ": ")):
+                raise ValueError("orjson only indents with 2 spaces")
+            option |= orjson.OPT_INDENT_2
+        elif separators not in (None, (",", ":")):
+            raise ValueError("orjson only supports compact separators")
+        Backend.__init__(self, indent=indent, separators=separators,
+                         sort_keys=sort_keys)
+        self._dumps = orjson.dumps
+        self._loads = orjson.loads
+        self._option = option
+
+    def encode_document(self, data):
+        document = self._dumps(data, option=self._option)
+        # Only look for the floats written as null if there is any
+        if b"null" in document and _has_non_finite(data):
+            raise ValueError("Non-finite floats not supported by orjson")
+        return document.decode("utf-8")
+
+    def decode_document(self, text):
+        if self._long_integer.search(text) is not None:
+            raise ValueError("Integer may not fit in 64 bits")
+        return self._loads(text)
+
+
+class UjsonBackend(Backend):
+    """Backend using ujson, custom separators are not supported."""
+
+    name = "ujson"
+
+    def __init__(self, indent=None, separators=None, sort_keys=False,
+                 encoding=None):
+        import ujson
+        if encoding is not None:
+            raise ValueError("ujson only supports UTF-8")
+        if separators is not None:
+            raise ValueError("ujson do not support custom separators")
+        Backend.__init__(self, indent=indent, sort_keys=sort_keys)
+        self._dumps = ujson.dumps
+        self._loads = ujson.loads
+        self._options = dict(indent=indent or 0, sort_keys=sort_keys,
+                             ensure_ascii=True, escape_forward_slashes=False)
+
+    def encode_document(self, data):
+        return self._dumps(data, **self._options)
+
+    def decode_document(self, text):
+        return self._loads(text)
+
+
+class RapidjsonBackend(Backend):
+    """Backend using python-rapidjson, custom separators
+    are not supported."""
+
+    name = "rapidjson"
+
+    def __init__(self, indent=None, separators=None, sort_keys=False,
+                 encoding=None):
+        import rapidjson
+        if encoding is not None:
+            raise ValueError("rapidjson only supports UTF-8")
+        if separators is not None:
+            raise ValueError("rapidjson do not support custom separators")
+        Backend.__init__(self, indent=indent, sort_keys=sort_keys)
+        self._dumps = rapidjson.dumps
+        self._loads = rapidjson.loads
+        self._options = dict(sort_keys=sort_keys, ensure_ascii=True)
+        if indent is not None:
+            self._options.update(write_mode=rapidjson.WM_PRETTY,
+                                 indent=indent)
+
+    def encode_document(self, data):
+        return self._dumps(data, **self._options)
+
+    def decode_document(self, text):
+        return self._loads(text)
+
+
+def register_backend(backend):
+    """Registers a L{Backend} sub-class under its name."""
+    _backends[backend.name] = backend
+    return backend
+
+
+def available_backends():
+    """Returns the names of the registered backends
+    whose library is installed."""
+    names = []
+    for name, backend in _backends.items():
+        try:
+            backend()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_backend(names=None, **options):
+    """Returns the first backend created with the specified formatting
+    options from a name or a sequence of names in order of preference.
+    The standard library backend is returned if none of them are
+    installed or support the options."""
+    if isinstance(names, (str, unicode)):
+        names = [names]
+    for name in names or ():
+        backend = _backends.get(name)
+        if backend is None:
+            raise ValueError("Unknown JSON backend: %r" % (name, ))
+        try:
+            return backend(**options)
+        except (ImportError, ValueError):
+            continue
+    return StdlibBackend(**options)
+
+
+_backends = {}  # {NAME: BACKEND}
+
+register_backend(StdlibBackend)
+register_backend(OrjsonBackend)
+register_backend(UjsonBackend)
+register_backend(RapidjsonBackend)
+
+# Faster backends in order of preference
+FAST_BACKENDS = (OrjsonBackend.name, RapidjsonBackend.name,
+                 UjsonBackend.name)
+
+
+def _has_non_finite(data):
+    # Returns if the packed data contains NaN or infinite floats
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, float):
+            if math.isnan(value) or math.isinf(value):
+                return True
+        elif isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+    return False
+
+
+def _make_emitter(indent=None, separators=None, sort_keys=False):
+    # Returns a function writing the JSON document of a value flattened
+    # by a serializer in two-pass mode without packing it first.
+    # The document is the one JSONEncoder would create with the same
+    # options from the packed value, see PreSerializer for the atoms.
+    if indent is not None and not isinstance(indent, (str, unicode)):
+        indent = u" " * indent
+    if separators is not None:
+        item_separator, key_separator = separators
+    elif indent is not None:
+        item_separator, key_separator = u",", u": "
+    else:
+        item_separator, key_separator = u", ", u": "
+
+    encode_string = json.encoder.encode_basestring_ascii
+    int_repr = int.__repr__
+    float_repr = float.__repr__
+    infinity = float("inf")
+    constants = {True: u"true", False: u"false", None: u"null"}
+    slot_type = base._Slot
+
+    def encode_float(value):
+        if value != value:
+            return u"NaN"
+        if value == infinity:
+            return u"Infinity"
+        if value == -infinity:
+            return u"-Infinity"
+        return float_repr(value)
+
+    def encode_key(key):
+        if isinstance(key, (str, unicode)):
+            return encode_string(key)
+        if key is True or key is False or key is None:
+            return u'"%s"' % constants[key]
+        if isinstance(key, float):
+            return u'"%s"' % encode_float(key)
+        if isinstance(key, (int, long)):
+            return u'"%s"' % int_repr(key)
+        raise TypeError("keys must be str, int, float, bool or None, "
+                        "not %s" % type(key).__name__)
+
+    scalars = {unicode: encode_string,
+               int: int_repr,
+               long: int_repr,
+               float: encode_float,
+               bool: constants.__getitem__,
+               type(None): constants.__getitem__}
+    if str is not unicode:
+        scalars[str] = encode_string
+
+    def emit(serializer, flattened, output=None):
+        # Returns the document or writes it by blocks with output
+        emitters = _EMITTERS
+        atoms = _ATOMS
+        chunks = []
+        write = chunks.append
+        blocks = []  # Joined chunks, strings take less memory in blocks
+        if output is None or serializer._type_table:
+            store = blocks.append
+        else:
+            store = output
+
+        def compact():
+            store(u"".join(chunks))
+            del chunks[:]
+
+        def emit_scalar(value):
+            # Values not composed of other values
+            encode = scalars.get(type(value))
+            if encode is not None:
+                write(encode(value))
+            elif isinstance(value, (str, unicode)):
+                write(encode_string(value))
+            elif value is None or value is True or value is False:
+                write(constants[value])
+            elif isinstance(value, (int, long)):
+                write(int_repr(value))
+            elif isinstance(value, float):
+                write(encode_float(value))
+            elif isinstance(value, (list, tuple, dict)):
+                emit_packed(value, 0)
+            else:
+                raise TypeError("Object of type %s is not JSON serializable"
+                                % type(value).__name__)
+
+        def emit_array(atom, values, level, emit_value):
+            if atom is None and not values:
+                write(u"[]")
+                return
+            write(u"[")
+            separator = item_separator
+            if indent is not None:
+                level += 1
+                separator = item_separator + u"\n" + indent * level
+                write(u"\n" + indent * level)
+            if atom is not None:
+                write(encode_string(atom))
+                if values:
+                    write(separator)
+            first = True
+            for value in values:
+                if first:
+                    first = False
+                else:
+                    write(separator)
+                emit_value(value, level)
+                if len(chunks) > _EMITTER_BLOCK_SIZE:
+                    compact()
+            if indent is not None:
+                write(u"\n" + indent * (level - 1))
+            write(u"]")
+
+        def emit_object(items, level, emit_value):
+            if not items:
+                write(u"{}")
+                return
+            write(u"{")
+            separator = item_separator
+            if indent is not None:
+                level += 1
+                separator = item_separator + u"\n" + indent * level
+                write(u"\n" + indent * level)
+            items = items.items()
+            if sort_keys:
+                items = sorted(items)
+            first = True
+            for key, value in items:
+                if first:
+                    first = False
+                else:
+                    write(separator)
+                if type(key) is unicode:
+                    write(encode_string(key))
+                else:
+                    write(encode_key(key))
+                write(key_separator)
+                emit_value(value, level)
+                if len(chunks) > _EMITTER_BLOCK_SIZE:
+                    compact()
+            if indent is not None:
+                write(u"\n" + indent * (level - 1))
+            write(u"}")
+
+        def emit_packed(data, level):
+            # Values already packed
+            if isinstance(data, (list, tuple)):
+                emit_array(None, data, level, emit_packed)
+            elif isinstance(data, dict):
+                emit_object(data, level, emit_packed)
+            else:
+                emit_scalar(data)
+
+        def emit_items(items):
+            # Items are flattened as [PACK_ITEM, [KEY, VALUE]]
+            result = {}
+            for _, (key, value) in items:
+                packer, key = key
+                if packer is not None:
+                    key = serializer.pack_value((packer, key))
+                result[key] = value
+            return result
+
+        def emit_reference(slot, level):
+            write(u"[")
+            separator = item_separator
+            if indent is not None:
+                level += 1
+                separator = item_separator + u"\n" + indent * level
+                write(u"\n" + indent * level)
+            write(encode_string(REFERENCE_ATOM))
+            write(separator)
+            write(int_repr(slot.refid))
+            write(separator)
+            emit_node(slot.packer, slot.data, level)
+            if indent is not None:
+                write(u"\n" + indent * (level - 1))
+            write(u"]")
+
+        def emit_flattened(node, level):
+            if type(node) is slot_type:
+                if node.refid is None:
+                    emit_node(node.packer, node.data, level)
+                else:
+                    emit_reference(node, level)
+                return
+            packer, data = node
+            if packer is not None:
+                emit_node(packer, data, level)
+            elif type(data) is list:
+                emit_array(None, data, level, emit_flattened)
+            else:
+                encode = scalars.get(type(data))
+                if encode is None:
+                    emit_scalar(data)
+                else:
+                    write(encode(data))
+
+        def emit_node(packer, data, level):
+            kind = emitters.get(getattr(packer, "__func__", packer), _OTHER)
+            if kind is _PLAIN:
+                if type(data) is list:
+                    emit_array(None, data, level, emit_flattened)
+                else:
+                    emit_scalar(data)
+            elif kind is _DICT:
+                emit_object(emit_items(data), level, emit_flattened)
+            elif kind is _ATOM_LIST:
+                emit_array(atoms[packer.__func__], data, level,
+                           emit_flattened)
+            elif kind is _PACKED:
+                emit_packed(packer(data), level)
+            elif kind is _INSTANCE:
+                type_name = serializer.pack_value(data[0])
+                snapshot = data[1]
+                items = None
+                if type(snapshot) is slot_type:
+                    if snapshot.refid is None and snapshot.packer is dict:
+                        items = emit_items(snapshot.data)
+                elif snapshot[0] is dict:
+                    items = emit_items(snapshot[1])
+                if items is not None:
+                    assert INSTANCE_TYPE_ATOM not in items
+                    assert INSTANCE_STATE_ATOM not in items
+                    items[INSTANCE_TYPE_ATOM] = (None, type_name)
+                else:
+                    items = {INSTANCE_TYPE_ATOM: (None, type_name),
+                             INSTANCE_STATE_ATOM: snapshot}
+                emit_object(items, level, emit_flattened)
+            elif kind is _DEREFERENCE:
+                emit_packed([DEREFERENCE_ATOM, data], level)
+            elif kind is _EMBEDDED:
+                emit_flattened(data[0], level)
+            else:
+                # Packer overridden by a sub-class
+                emit_packed(serializer.pack_value((packer, data)), level)
+
+        if not serializer._type_table:
+            emit_flattened(flattened, 0)
+            compact()
+            if output is None:
+                return u"".join(blocks)
+            return
+
+        # The type table is only known once the value emitted
+        emit_flattened(flattened, 1)
+        compact()
+        body = blocks[:]
+        del blocks[:]
+        write(u"[")
+        separator = item_separator
+        if indent is not None:
+            separator = item_separator + u"\n" + indent
+            write(u"\n" + indent)
+        write(encode_string(TYPES_ATOM))
+        write(separator)
+        emit_packed(serializer._pop_type_names(), 1)
+        write(separator)
+        compact()
+        blocks.extend(body)
+        if indent is not None:
+            write(u"\n")
+        write(u"]")
+        compact()
+        if output is None:
+            return u"".join(blocks)
+        for block in blocks:
+            output(block)
+
+    return emit
+
+
+# Number of chunks of text the emitter joins at once
+_EMITTER_BLOCK_SIZE = 4096
+
+# How the emitter handles the values flattened with each packer
+_PLAIN, _DICT, _ATOM_LIST, _PACKED, _INSTANCE, _DEREFERENCE, _EMBEDDED, \
+    _OTHER = range(8)
+
+
 class PreSerializer(base.Serializer):
 
     pack_dict = dict
+    # bytearray and memoryview are encoded like bytes
+    buffers_in_band = True
 
     def __init__(self, force_unicode=False, externalizer=None,
-                 source_ver=None, target_ver=None):
+                 source_ver=None, target_ver=None,
+                 single_pass=False, iterative=False, tree=False,
+                 check_cycles=False, bytes_encoding=BYTES_UTF8,
+                 type_table=False):
+        if bytes_encoding not in self._bytes_encoders:
+            raise ValueError("Unsupported bytes encoding: %r"
+                             % (bytes_encoding, ))
+        # The type names are written once in a table at the beginning
+        # of the document and referenced by there index in it
+        self._type_table = type_table
         base.Serializer.__init__(self, converter_caps=JSON_CONVERTER_CAPS,
                                  freezer_caps=JSON_FREEZER_CAPS,
                                  externalizer=externalizer,
                                  source_ver=source_ver,
-                                 target_ver=target_ver)
+                                 target_ver=target_ver,
+                                 single_pass=single_pass,
+                                 iterative=iterative,
+                                 tree=tree,
+                                 check_cycles=check_cycles)
         self._force_unicode = force_unicode
+        self._bytes_encoder = self._bytes_encoders[bytes_encoding]
+        # Formatable instances are flattened by functions specialized
+        # for there class, when they would be flattened the same way
+        self._specialized = not self._single_pass and _inherited(
+            type(self), PreSerializer, self._specialized_methods)
+        # Types flattened as themselves without packer
+        self._plain_types = tuple(
+            frozenset(t for t, packer in self._plain_packers.items()
+                      if table.get(t) is self._value_lookup[t]
+                      and getattr(self, packer) is None)
+            for table in self._value_tables)
+
+    ### Public Methods ###
+
+    def pack_document(self, data):
+        """Returns the document of a packed value, when using a type
+        table it is [".types", [TYPE_NAME, ...], VALUE]."""
+        names = self._pop_type_names()
+        if names is None:
+            return data
+        return [TYPES_ATOM, names, data]
 
     ### Overridden Methods ###
 
+    def reset(self):
+        base.Serializer.reset(self)
+        self._pop_type_names()
+
+    def post_convertion(self, data):
+        return base.Serializer.post_convertion(self,
+                                               self.pack_document(data))
+
+    def resolve_unknown(self, vtype, freezing):
+        resolved = base.Serializer.resolve_unknown(self, vtype, freezing)
+        if resolved[0] is None and self._specialized and not freezing:
+            flattener = _formatable_flattener(vtype)
+            if flattener is not None:
+                return flattener, None
+        return resolved
+
     def flatten_key(self, key, caps, freezing):
         if not isinstance(key, bytes):
             if isinstance(key, unicode) and (self._force_unicode or PY3):
@@ -108,26 +690,28 @@ class PreSerializer(base.Serializer):
         return [TUPLE_ATOM] + data
 
     def pack_bytes(self, data):
-        # we try to decode the string from default encoding
-        try:
-            value = data.decode(DEFAULT_ENCODING)
-            if self._force_unicode:
-                return value
-            return [ENCODED_ATOM, DEFAULT_ENCODING, value]
-        except UnicodeDecodeError:
-            value = base64.b64encode(data).strip()
-            if PY3:
-                value = value.decode(DEFAULT_ENCODING)
-            # if it fail store it as base64 encoded bytes
-            return [BYTES_ATOM, value]
+        # bytearray and memoryview are encoded without being copied,
+        # but the encoders only accept contiguous views
+        if type(data) is memoryview and not data.c_contiguous:
+            data = data.tobytes()
+        return self._bytes_encoder(self, data)
+
+    def pack_buffer(self, data):
+        return [BUFFER_ATOM, data]
 
     def pack_set(self, data):
         return [SET_ATOM] + data
 
     def pack_enum(self, data):
+        if self._type_index is not None:
+            type_name = self.pack_type_name(reflect.canonical_name(data))
+            return [ENUM_ATOM, type_name, data.name]
         return [ENUM_ATOM, reflect.canonical_name(data) + "." + data.name]
 
     def pack_type(self, data):
+        if self._type_index is not None:
+            return [TYPE_ATOM, self.pack_type_name(
+                reflect.canonical_name(data))]
         return [TYPE_ATOM, reflect.canonical_name(data)]
 
     def pack_external(self, data):
@@ -137,11 +721,15 @@ class PreSerializer(base.Serializer):
         type_name, snapshot = data
 
         if isinstance(snapshot, dict):
-            result = dict(snapshot)  # Copy the dict to not modify the original
-            assert INSTANCE_TYPE_ATOM not in result
-            assert INSTANCE_STATE_ATOM not in result
-            result[INSTANCE_TYPE_ATOM] = type_name
-            return result
+            if self._single_pass or self.pack_dict is not dict:
+                # Copy the dict to not modify the original, in single-pass
+                # mode the containers could be packed again
+                snapshot = dict(snapshot)
+            # Otherwise it has just been created by pack_dict()
+            assert INSTANCE_TYPE_ATOM not in snapshot
+            assert INSTANCE_STATE_ATOM not in snapshot
+            snapshot[INSTANCE_TYPE_ATOM] = type_name
+            return snapshot
 
         return {INSTANCE_TYPE_ATOM: type_name,
                 INSTANCE_STATE_ATOM: snapshot}
@@ -169,33 +757,483 @@ class PreSerializer(base.Serializer):
     pack_frozen_builtin = pack_frozen_function
     pack_frozen_method = pack_frozen_function
 
+    ### private ###
+
+    def _index_type_name(self, type_name):
+        index = self._type_index.get(type_name)
+        if index is None:
+            index = len(self._type_names)
+            self._type_index[type_name] = index
+            self._type_names.append(type_name)
+        return index
+
+    def _pop_type_names(self):
+        # Returns the type names of the table and start a new one
+        if not self._type_table:
+            self._type_index = None
+            return None
+        names = getattr(self, "_type_names", None)
+        self._type_index = {}  # {TYPE_NAME: INDEX}
+        self._type_names = []  # [TYPE_NAME] in index order
+        self.pack_type_name = self._index_type_name
+        return names
+
+    def _encode_utf8(self, data):
+        # we try to decode the string from default encoding
+        try:
+            value = unicode(data, DEFAULT_ENCODING)
+            if self._force_unicode:
+                return value
+            return [ENCODED_ATOM, DEFAULT_ENCODING, value]
+        except UnicodeDecodeError:
+            # if it fail store it as base64 encoded bytes
+            return self._encode_base64(data)
+
+    def _encode_base64(self, data):
+        value = binascii.b2a_base64(data)[:-1]
+        if PY3:
+            value = value.decode("ascii")
+        return [BYTES_ATOM, value]
+
+    def _encode_base85(self, data):
+        return [BYTES_ATOM, base64.b85encode(data).decode("ascii"),
+                BYTES_BASE85]
+
+    def _encode_hex(self, data):
+        value = binascii.hexlify(data)
+        if PY3:
+            value = value.decode("ascii")
+        return [BYTES_ATOM, value, BYTES_HEX]
+
+    ### lookup tables ###
+
+    # Methods Formatable instances are flattened with
+    _specialized_methods = ("flatten_instance", "snapshot_instance",
+                            "pack_instance", "flatten_key",
+                            "flatten_item", "flatten_dict_value")
+
+    _plain_packers = {unicode: "pack_unicode",
+                      int: "pack_int",
+                      long: "pack_long",
+                      float: "pack_float",
+                      bool: "pack_bool",
+                      type(None): "pack_none"}
+
+    _bytes_encoders = {BYTES_UTF8: _encode_utf8,
+                       BYTES_BASE64: _encode_base64,
+                       BYTES_HEX: _encode_hex}
+    if PY3:
+        _bytes_encoders[BYTES_BASE85] = _encode_base85
+
+
+def _packer(name):
+    return PreSerializer.__dict__[name]
+
+
+_EMITTERS = {None: _PLAIN,
+             dict: _DICT,
+             _packer("pack_tuple"): _ATOM_LIST,
+             _packer("pack_set"): _ATOM_LIST,
+             _packer("pack_external"): _ATOM_LIST,
+             _packer("pack_bytes"): _PACKED,
+             _packer("pack_buffer"): _PACKED,
+             _packer("pack_enum"): _PACKED,
+             _packer("pack_type"): _PACKED,
+             _packer("pack_function"): _PACKED,
+             _packer("pack_frozen_function"): _PACKED,
+             _packer("pack_instance"): _INSTANCE,
+             _packer("pack_dereference"): _DEREFERENCE,
+             _packer("pack_frozen_external"): _EMBEDDED,
+             _packer("pack_frozen_instance"): _EMBEDDED}
+
+_ATOMS = {_packer("pack_tuple"): TUPLE_ATOM,
+          _packer("pack_set"): SET_ATOM,
+          _packer("pack_external"): EXTERNAL_ATOM}
+
 
 class Serializer(PreSerializer):
 
     def __init__(self, indent=None, separators=None,
                  force_unicode=False, encoding=None,
                  externalizer=None, source_ver=None, target_ver=None,
-                 sort_keys=False):
+                 sort_keys=False, single_pass=False, iterative=False,
+                 tree=False, check_cycles=False, backend=None,
+                 bytes_encoding=BYTES_UTF8, type_table=False):
         PreSerializer.__init__(self, force_unicode=force_unicode,
                                externalizer=externalizer,
                                source_ver=source_ver,
-                               target_ver=target_ver)
+                               target_ver=target_ver,
+                               single_pass=single_pass,
+                               iterative=iterative,
+                               tree=tree,
+                               check_cycles=check_cycles,
+                               bytes_encoding=bytes_encoding,
+                               type_table=type_table)
         self._indent = indent
         self._separators = separators
         self._encoding = encoding
         self._sort_keys = sort_keys
+        self._backend = get_backend(backend, indent=indent,
+                                    separators=separators,
+                                    sort_keys=sort_keys, encoding=encoding)
+        # Values flattened in two-pass mode are directly written as text
+        # when the document would be the one of the standard library
+        self._emitter = None
+        if (isinstance(self._backend, StdlibBackend) and encoding is None
+                and _inherited(type(self), Serializer,
+                               self._emitted_methods)):
+            self._emitter = _make_emitter(indent, separators, sort_keys)
+
+    ### Public Methods ###
+
+    def dump(self, data, fp):
+        """Serializes the data writing the resulting JSON document
+        to the file-like object fp, the document is encoded and written
+        chunk by chunk instead of being built in memory first.
+        In two-pass mode the flattened value is written as it is emitted
+        without being packed, unless a type table is used, the document
+        body is then kept in memory until the table is written.
+        The document is the same convert() would have returned."""
+        write = functools.partial(self._write_document, fp)
+        emit = None
+        if self._emitter is not None:
+            emit = functools.partial(self._emit_document, fp)
+        self._convert(data, self.converter_capabilities, False, write,
+                      convert_flattened=emit)
+
+    def dump_lines(self, values, fp):
+        """Writes the values to the file-like object fp as JSON Lines,
+        one document by line. Each value has its own references like
+        if serialized separately, the lines are written in bulk."""
+        writer = LinesWriter(fp, self)
+        for line in self.convert_many(values):
+            writer.write_line(line)
+        writer.flush()
 
     ### Overridden Methods ###
 
     def post_convertion(self, data):
-        if self._encoding is not None:
-            return json.dumps(data, indent=self._indent,
-                              separators=self._separators,
-                              encoding=self._encoding,
-                              sort_keys=self._sort_keys)
-        return json.dumps(data, indent=self._indent,
-                          separators=self._separators,
-                          sort_keys=self._sort_keys)
+        return self._backend.encode(self.pack_document(data))
+
+    def convert_flattened(self, flattened):
+        if self._emitter is None:
+            return PreSerializer.convert_flattened(self, flattened)
+        return self._emitter(self, flattened)
+
+    ### Private Methods ###
+
+    def _emit_document(self, fp, flattened):
+        self._emitter(self, flattened, fp.write)
+
+    def _write_document(self, fp, data):
+        chunks = []
+        size = 0
+        for chunk in self._backend.iterencode(self.pack_document(data)):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= DUMP_BUFFER_SIZE:
+                fp.write(u"".join(chunks))
+                del chunks[:]
+                size = 0
+        if chunks:
+            fp.write(u"".join(chunks))
+
+    ### lookup tables ###
+
+    # Methods the emitter writes the result of without calling them,
+    # it is not used if a sub-class overrides one of them
+    _emitted_methods = ("post_convertion", "pack_document",
+                        "pack_item", "pack_reference")
+
+
+def _read_lines(fp):
+    for line in fp:
+        if line.strip():
+            yield line
+
+
+def _read_chunks(fp):
+    while True:
+        chunk = fp.read(LOAD_BUFFER_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+class _InstanceItems(object):
+    """Stands for the snapshot dictionary of an instance given
+    with its type name, the instance data is not copied."""
+
+    __slots__ = ("data", )
+
+    def __init__(self, data):
+        self.data = data
+
+
+class _Restored(object):
+    """Stands for a value restored while the data containing
+    it was still being read."""
+
+    __slots__ = ("value", )
+
+
+# States of the _Reader
+_VALUE, _FIRST_VALUE, _KEY, _FIRST_KEY, _COLON, _NEXT, _DONE = range(7)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_CHARS = re.compile(r"[-+.eE0-9]*")
+_CONSTANTS = {u"t": (u"true", True),
+              u"f": (u"false", False),
+              u"n": (u"null", None),
+              u"N": (u"NaN", float("nan")),
+              u"I": (u"Infinity", float("inf"))}
+_NEGATIVE_INFINITY = (u"-Infinity", float("-inf"))
+
+
+class _Reader(object):
+    """Incremental JSON parser, the text can be fed in chunks split
+    anywhere. Every list and object is handed over to a function
+    as soon as it is complete with the list or object containing it
+    and the number of lists and objects still being read, and is
+    replaced by whatever this function returns."""
+
+    def __init__(self, complete):
+        self._complete = complete  # FUNCTION(DATA, PARENT, DEPTH) -> VALUE
+        self._stack = []  # Lists and objects being read
+        self._keys = []  # Current key of the objects being read
+        self._state = _VALUE
+        self._buffer = u""  # Text not yet parsed
+        self._pending = None  # Chunks following a string cut by a chunk
+        self._backslashes = 0  # Backslashes ending the cut string
+        self._root = None
+        self._memo = {}  # Share the keys like json.loads() does
+
+    def feed(self, text):
+        if self._pending is not None:
+            # Only scan a string cut by the end of a chunk again
+            # once its closing quote has been received
+            self._pending.append(text)
+            if not self._closes_string(text):
+                return
+            text = u"".join(self._pending)
+            self._pending = None
+        self._buffer += text
+        self._parse(False)
+
+    def close(self):
+        if self._pending is not None:
+            self._buffer += u"".join(self._pending)
+            self._pending = None
+        self._parse(True)
+        if self._state != _DONE:
+            raise ValueError("Unexpected end of JSON document")
+        return self._root
+
+    ### private ###
+
+    def _parse(self, final):
+        buf, pos, end = self._buffer, 0, len(self._buffer)
+        stack, keys, state = self._stack, self._keys, self._state
+        cut = False
+
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos == end:
+                break
+            char = buf[pos]
+
+            if state == _NEXT or (char in u"]}"
+                                  and state in (_FIRST_VALUE, _FIRST_KEY)):
+                if char == u",":
+                    pos += 1
+                    state = _VALUE if type(stack[-1]) is list else _KEY
+                    continue
+                if char != (u"]" if type(stack[-1]) is list else u"}"):
+                    raise self._error("Expecting ',' delimiter", buf, pos)
+                pos += 1
+                data = stack.pop()
+                keys.pop()
+                if not stack:
+                    self._root = data
+                    state = _DONE
+                    continue
+                value = self._complete(data, stack[-1], len(stack))
+
+            elif state == _KEY or state == _FIRST_KEY:
+                if char != u'"':
+                    raise self._error("Expecting property name enclosed "
+                                      "in double quotes", buf, pos)
+                try:
+                    key, pos = json.decoder.scanstring(buf, pos + 1)
+                except ValueError as e:
+                    if final or not self._truncated(e, end):
+                        raise
+                    cut = True
+                    break
+                keys[-1] = self._memo.setdefault(key, key)
+                state = _COLON
+                continue
+
+            elif state == _COLON:
+                if char != u":":
+                    raise self._error("Expecting ':' delimiter", buf, pos)
+                pos += 1
+                state = _VALUE
+                continue
+
+            elif state == _DONE:
+                raise self._error("Extra data", buf, pos)
+
+            elif char == u"[":
+                pos += 1
+                stack.append([])
+                keys.append(None)
+                state = _FIRST_VALUE
+                continue
+
+            elif char == u"{":
+                pos += 1
+                stack.append({})
+                keys.append(None)
+                state = _FIRST_KEY
+                continue
+
+            elif char == u'"':
+                try:
+                    value, pos = json.decoder.scanstring(buf, pos + 1)
+                except ValueError as e:
+                    if final or not self._truncated(e, end):
+                        raise
+                    cut = True
+                    break
+
+            else:
+                if char == u"-" and buf.startswith(u"-I", pos):
+                    constant = _NEGATIVE_INFINITY
+                else:
+                    constant = _CONSTANTS.get(char)
+                if constant is not None:
+                    name, value = constant
+                    if not buf.startswith(name, pos):
+                        if not final and name.startswith(buf[pos:]):
+                            break
+                        raise self._error("Expecting value", buf, pos)
+                    pos += len(name)
+                else:
+                    stop = _NUMBER_CHARS.match(buf, pos).end()
+                    if stop == end and not final:
+                        break
+                    match = json.scanner.NUMBER_RE.match(buf, pos)
+                    if match is None or match.end() != stop:
+                        raise self._error("Expecting value", buf, pos)
+                    integer, fraction, exponent = match.groups()
+                    if fraction or exponent:
+                        value = float(integer + (fraction or u"")
+                                      + (exponent or u""))
+                    else:
+                        value = int(integer)
+                    pos = stop
+
+            # A value has been read
+            if not stack:
+                self._root = value
+                state = _DONE
+            else:
+                container = stack[-1]
+                if type(container) is list:
+                    container.append(value)
+                else:
+                    container[keys[-1]] = value
+                state = _NEXT
+
+        self._buffer = buf[pos:]
+        self._state = state
+        if cut:
+            self._pending = []
+            self._backslashes = end - len(buf.rstrip(u"\\"))
+
+    def _truncated(self, error, end):
+        # Tells if a string may only be cut by the end of the chunk
+        return (error.msg.startswith("Unterminated string")
+                or error.pos >= end - 6)
+
+    def _closes_string(self, text):
+        # Tells if the text holds the closing quote of the cut string,
+        # the backslashes ending the text are kept for the next chunk
+        index = text.find(u'"')
+        while index >= 0:
+            start = index
+            while start and text[start - 1] == u"\\":
+                start -= 1
+            count = index - start
+            if not start:
+                count += self._backslashes
+            if not count % 2:
+                return True
+            index = text.find(u'"', index + 1)
+        stripped = text.rstrip(u"\\")
+        count = len(text) - len(stripped)
+        self._backslashes = count if stripped else self._backslashes + count
+        return False
+
+    def _error(self, message, buf, pos):
+        return json.JSONDecodeError(message, buf, pos)
+
+
+class LinesWriter(object):
+    """Writes values to a file-like object as JSON Lines. The lines
+    are buffered and written by blocks of DUMP_BUFFER_SIZE characters,
+    they are only guaranteed to be written after a call to flush().
+    Can be used as a context manager flushing when exiting."""
+
+    def __init__(self, fp, serializer=None, buffer_size=None):
+        serializer = serializer or Serializer()
+        if serializer._indent is not None:
+            raise ValueError("JSON Lines cannot be indented")
+        self._fp = fp
+        self._serializer = serializer
+        self._buffer_size = buffer_size or DUMP_BUFFER_SIZE
+        self._lines = []
+        self._size = 0
+
+    def write(self, value):
+        """Serializes the value in a line of its own."""
+        self.write_line(self._serializer.convert(value))
+
+    def write_many(self, values):
+        """Serializes the values in a line each."""
+        for line in self._serializer.convert_many(values):
+            self.write_line(line)
+
+    def write_line(self, line):
+        """Writes an already serialized document as a line."""
+        self._lines.append(line)
+        self._size += len(line) + 1
+        if self._size >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self._lines.append(u"")
+            self._fp.write(u"\n".join(self._lines))
+            del self._lines[:]
+            self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+def _list_values(data):
+    # Skip the leading atom
+    return itertools.islice(data, 1, None)
+
+
+def _reference_values(data):
+    _, refid, value = data
+    return refid, value
 
 
 class Unserializer(base.Unserializer):
@@ -204,27 +1242,76 @@ class Unserializer(base.Unserializer):
                               float, bool, type(None)])
 
     def __init__(self, encoding=None, registry=None, externalizer=None,
-                 source_ver=None, target_ver=None):
+                 source_ver=None, target_ver=None, iterative=False,
+                 backend=None, type_table=False):
         base.Unserializer.__init__(self, converter_caps=JSON_CONVERTER_CAPS,
                                    registry=registry,
                                    externalizer=externalizer,
                                    source_ver=source_ver,
-                                   target_ver=target_ver)
+                                   target_ver=target_ver,
+                                   iterative=iterative)
         self._encoding = encoding
+        self._backend = get_backend(backend, encoding=encoding)
+        # Documents are only read as [".types", [TYPE_NAME, ...], VALUE]
+        # if written by a serializer using a type table too, otherwise
+        # lists looking like it are values like any others
+        self._type_table = type_table
+        # Formatable instances are restored by functions specialized
+        # for there class, when they would be restored the same way
+        self._specialized = not iterative and _inherited(
+            type(self), Unserializer, self._specialized_methods)
+
+    ### Public Methods ###
+
+    def convert_chunks(self, chunks):
+        """Unserializes a JSON document given as an iterable of chunks
+        of text or bytes split anywhere. The values are restored while
+        the document is being parsed, as soon as their data is complete,
+        so neither the whole text nor the whole parsed data are needed
+        at once."""
+        if not self._lock.acquire(False):
+            # Already converting in another thread or from a recover()
+            return self._new_context().convert_chunks(chunks)
+        try:
+            return self._convert_chunks(chunks)
+        finally:
+            # Reset the state to cleanup all references
+            self.reset()
+            self._lock.release()
+
+    def load(self, fp):
+        """Unserializes a JSON document read from the file-like
+        object fp chunk by chunk, see convert_chunks()."""
+        return self.convert_chunks(_read_chunks(fp))
+
+    def load_lines(self, fp):
+        """Returns a generator unserializing the JSON Lines read from
+        the file-like object fp one by one, only the current line is
+        kept in memory. Each line has its own references like
+        if unserialized separately, blank lines are skipped."""
+        return self.convert_many(_read_lines(fp))
 
     ### Overridden Methods ###
 
+    def reset(self):
+        base.Unserializer.reset(self)
+        self._set_type_names(None)
+
     def pre_convertion(self, data):
-        if isinstance(data, bytes):
-            if self._encoding is None:
-                return json.loads(data.decode(DEFAULT_ENCODING))
-            return json.loads(data, encoding=self._encoding)
-        return json.loads(data)
+        return self._unpack_document(self._backend.decode(data))
 
     def analyse_data(self, data):
         if isinstance(data, dict):
             if INSTANCE_TYPE_ATOM in data:
-                return data[INSTANCE_TYPE_ATOM], Unserializer.unpack_instance
+                type_name = data[INSTANCE_TYPE_ATOM]
+                if type(type_name) is int:
+                    type_name = self._type_names[type_name]
+                if self._specialized and INSTANCE_STATE_ATOM not in data:
+                    restorator = self._registry.lookup(type_name)
+                    unpacker = _formatable_unpacker(restorator)
+                    if unpacker is not None:
+                        return type_name, unpacker
+                return type_name, Unserializer.unpack_instance
             return dict, Unserializer.unpack_dict
 
         if isinstance(data, list):
@@ -238,17 +1325,96 @@ class Unserializer(base.Unserializer):
             # Just a list
             return default
 
+        if type(data) is _Restored:
+            return None, Unserializer.unpack_restored
+
+        if type(data) is _InstanceItems:
+            return dict, Unserializer.unpack_instance_items
+
     ### Private Methods ###
 
+    def _convert_chunks(self, chunks):
+        encoding = self._encoding or DEFAULT_ENCODING
+        decoder = codecs.getincrementaldecoder(encoding)()
+        reader = _Reader(self._restore_ahead)
+        self._set_type_names(None)
+        # Dereferences could come before the end of the reference value
+        self._delayed += 1
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, bytes):
+                    chunk = decoder.decode(chunk)
+                reader.feed(chunk)
+            reader.feed(decoder.decode(b"", True))
+            data = reader.close()
+        finally:
+            self._delayed -= 1
+        data = self._unpack_document(data)
+        return self._finish_data(self._unpack_data(data, None, None))
+
+    def _unpack_document(self, data):
+        # Returns the value of the document, setting up its type table
+        if (self._type_table and type(data) is list and len(data) == 3
+                and data[0] == TYPES_ATOM):
+            if data[1] is not self._type_names:
+                self._set_type_names(data[1])
+            return data[2]
+        self._set_type_names(None)
+        return data
+
+    def _set_type_names(self, names):
+        self._type_names = names  # [TYPE_NAME] of the document type table
+        self._types = {}  # {INDEX: TYPE} of the types already restored
+
+    def _restore_type_index(self, index):
+        value = self._types.get(index)
+        if value is None:
+            value = self.restore_type(self._type_names[index])
+            self._types[index] = value
+        return value
+
+    def _restore_ahead(self, data, parent, depth):
+        # Restore the data as soon as it has been read, the values
+        # composing it already have been. If it depends on references
+        # not yet restored it will be unpacked with its parent.
+        refid = None
+        if type(parent) is list and parent:
+            if len(parent) == 2 and parent[0] == REFERENCE_ATOM:
+                refid = parent[1]
+            elif (depth == 1 and self._type_table and len(parent) == 1
+                  and parent[0] == TYPES_ATOM):
+                # The type table of the document, only the root one,
+                # is needed by the values following it
+                self._set_type_names(data)
+                return data
+        restored = _Restored()
+        mark = len(self._instances)
+        try:
+            restored.value = self._unpack_data(data, refid, restored)
+        except base.DelayPacking:
+            self._discard(mark)
+            return data
+        return restored
+
+    def unpack_restored(self, data):
+        return data.value
+
     def unpack_instance(self, data, *args):
-        data = dict(data)
-        type_name = data.pop(INSTANCE_TYPE_ATOM)
+        type_name = data[INSTANCE_TYPE_ATOM]
+        if type(type_name) is int:
+            type_name = self._type_names[type_name]
         if INSTANCE_STATE_ATOM in data:
-            snapshot = data.pop(INSTANCE_STATE_ATOM)
+            snapshot = data[INSTANCE_STATE_ATOM]
         else:
-            snapshot = data
+            # The data is left as it is, unpacking may be retried
+            snapshot = _InstanceItems(data)
         return self.restore_instance(type_name, snapshot, *args)
 
+    def unpack_instance_items(self, container, data):
+        # Cheaper than filtering the items, the type name is never delayed
+        self.unpack_dict(container, data.data)
+        del container[INSTANCE_TYPE_ATOM]
+
     def unpack_external(self, data):
         _, identifier = data
         return self.restore_external(identifier)
@@ -262,6 +1428,9 @@ class Unserializer(base.Unserializer):
         return self.restore_dereference(refid)
 
     def unpack_enum(self, data):
+        if len(data) == 3:
+            _, index, name = data
+            return self._restore_type_index(index)[name]
         _, full_name = data
         parts = full_name.split('.')
         type_name = ".".join(parts[:-1])
@@ -270,6 +1439,8 @@ class Unserializer(base.Unserializer):
 
     def unpack_type(self, data):
         _, type_name = data
+        if type(type_name) is int:
+            return self._restore_type_index(type_name)
         return self.restore_type(type_name)
 
     def unpack_encoded(self, data):
@@ -279,31 +1450,48 @@ class Unserializer(base.Unserializer):
         return bytes.encode(codec)
 
     def unpack_bytes(self, data):
-        _, _bytes = data
-        value = base64.b64decode(_bytes)
-        return value
+        # The encoding is only given when not the default one
+        encoding = data[2] if len(data) > 2 else BYTES_ENCODING
+        decoder = self._bytes_decoders.get(encoding)
+        if decoder is None:
+            raise ValueError("Unsupported bytes encoding: %r" % (encoding, ))
+        return decoder(data[1])
+
+    def unpack_buffer(self, data):
+        _, index = data
+        return self.restore_buffer(index)
 
     def unpack_tuple(self, data):
         return tuple([self.unpack_data(d) for d in data[1:]])
 
     def unpack_list(self, container, data):
-        container.extend([self.unpack_data(d) for d in data])
+        self.extend_unpacked(container, data)
 
     def unpack_set(self, container, data):
-        container.update(self.unpack_unordered_values(data[1:]))
+        self.add_unpacked(container, data[1:])
 
     def unpack_dict(self, container, data):
         if PY3:
             items = data.items()
         else:
             items = [(k.encode(DEFAULT_ENCODING), v)for k, v in data.items()]
-        container.update(self.unpack_unordered_pairs(items))
+        self.update_unpacked(container, items)
 
     def unpack_function(self, data):
         return reflect.named_object(data[1])
 
+    # Methods Formatable instances are restored with
+    _specialized_methods = ("unpack_instance", "restore_instance",
+                            "prepare_instance", "unpack_dict")
+
+    _bytes_decoders = {BYTES_BASE64: binascii.a2b_base64,
+                       BYTES_HEX: binascii.unhexlify}
+    if PY3:
+        _bytes_decoders[BYTES_BASE85] = base64.b85decode
+
     _list_unpackers = {BYTES_ATOM: (None, unpack_bytes),
                        ENCODED_ATOM: (None, unpack_encoded),
+                       BUFFER_ATOM: (None, unpack_buffer),
                        ENUM_ATOM: (None, unpack_enum),
                        TYPE_ATOM: (None, unpack_type),
                        TUPLE_ATOM: (None, unpack_tuple),
@@ -312,3 +1500,145 @@ class Unserializer(base.Unserializer):
                        REFERENCE_ATOM: (None, unpack_reference),
                        DEREFERENCE_ATOM: (None, unpack_dereference),
                        FUNCTION_ATOM: (None, unpack_function)}
+
+    _children_lookup = {unpack_tuple: _list_values,
+                        unpack_list: iter,
+                        unpack_set: _list_values,
+                        unpack_dict: dict.values,
+                        unpack_instance: dict.values,
+                        unpack_external: _list_values}
+
+    _reference_lookup = {unpack_reference: _reference_values}
+
+
+def _inherited(cls, base_cls, names):
+    # Tells if the class uses the methods of the base class
+    return all(getattr(cls, n) == getattr(base_cls, n) for n in names)
+
+
+def _plain_formatable(vtype):
+    # Tells if the instances are snapshot and recovered field by field
+    if not isinstance(vtype, type):
+        return False
+    if not issubclass(vtype, formatable.Formatable):
+        return False
+    if (IVersionAdapter.implementedBy(vtype)
+            or not ISerializable.implementedBy(vtype)):
+        return False
+    return _inherited(vtype, formatable.Formatable, ("snapshot", "recover"))
+
+
+def _formatable_fields(vtype):
+    # Returns [(ATTRIBUTE, KEY, DEFAULT)] for the fields of the class
+    fields = []
+    for field in vtype._fields:
+        key = field.serialize_as
+        if isinstance(key, bytes):
+            key = key.decode(DEFAULT_ENCODING)
+        fields.append((field.name, key, field.default))
+    return fields
+
+
+def _formatable_flattener(vtype):
+    # Returns the flattener specialized for the class or None
+    if vtype in _formatable_flatteners:
+        return _formatable_flatteners[vtype]
+    flattener = None
+    if _plain_formatable(vtype):
+        flattener = _make_formatable_flattener(vtype)
+    _formatable_flatteners[vtype] = flattener
+    return flattener
+
+
+def _formatable_unpacker(vtype):
+    # Returns the unpacker specialized for the class or None
+    if vtype in _formatable_unpackers:
+        return _formatable_unpackers[vtype]
+    unpacker = None
+    if _plain_formatable(vtype):
+        unpacker = _make_formatable_unpacker(vtype)
+    _formatable_unpackers[vtype] = unpacker
+    return unpacker
+
+
+def _make_formatable_flattener(vtype):
+    # The instance is flattened like its snapshot would have been,
+    # with the type name item pack_instance() would have added.
+    fields = [(name, key, default is not None)
+              for name, key, default in _formatable_fields(vtype)]
+    type_name = vtype.type_name
+    instance_values = Capabilities.instance_values
+
+    def flatten_formatable(self, value, caps, freezing):
+        if self._externalizer is not None:
+            extid = self._externalizer.identify(value)
+            if extid is not None:
+                return self.flatten_external(extid, caps, freezing)
+
+        self.check_capabilities(instance_values, value, caps, freezing)
+
+        referenceable = getattr(value, "referenceable", True)
+        if referenceable:
+            deref = self._prepare(value)
+            if deref is not None:
+                return deref
+
+        plain = self._plain_types[freezing]
+        table = self._value_tables[freezing]
+        key_packer = self.pack_unicode
+        item_packer = self.pack_item
+        items = []
+        for name, key, keep_none in fields:
+            data = getattr(value, name)
+            if data is None and not keep_none:
+                continue
+            vtype = type(data)
+            if vtype in plain:
+                node = None, data
+            else:
+                flattener = table.get(vtype)
+                if flattener is None:
+                    node = self.flatten_value(data, caps, freezing)
+                else:
+                    node = flattener(self, data, caps, freezing)
+            items.append((item_packer, [(key_packer, key), node]))
+        items.append((item_packer, [(None, INSTANCE_TYPE_ATOM),
+                                    (self.pack_type_name, type_name)]))
+
+        if referenceable:
+            return self._preserve(value, self.pack_dict, items)
+        return self.pack_dict, items
+
+    return flatten_formatable
+
+
+def _make_formatable_unpacker(vtype):
+    # The fields are set right away instead of recovering the instance
+    # from its snapshot at the end, only restored() is left to call.
+    fields = _formatable_fields(vtype)
+
+    def unpack_formatable(self, data, refid=None, restorator=None,
+                          instance=None):
+        if instance is None:
+            # Immutable instance, restored from its snapshot
+            return Unserializer.unpack_instance(self, data, refid,
+                                                restorator, instance)
+        unpack = self.unpack_data
+        passing = self._pass_through_lookup
+        for name, key, default in fields:
+            if key in data:
+                value = data[key]
+                if not passing.get(type(value)):
+                    value = unpack(value)
+            else:
+                # lazy coping of default value, like Formatable.recover()
+                value = copy.copy(default)
+            setattr(instance, name, value)
+        self._instances.append((None, instance, None, refid))
+        return instance
+
+    return unpack_formatable
+
+
+_formatable_flatteners = {}  # {TYPE: FUNCTION or None}
+_formatable_unpackers = {}  # {RESTORATOR: FUNCTION or None}
@@ -0,0 +1,480 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+
+"""Binary converters using the MessagePack format, see https://msgpack.org.
+
+The documents can be read by any MessagePack implementation. Values
+without MessagePack counterpart are extension types whose data is the
+MessagePack document of their content, only integers too big for
+64 bits have the bytes of their two's complement as data:
+
+    tuple        EXT_TUPLE        [VALUE, ...]
+    set          EXT_SET          [VALUE, ...]
+    instance     EXT_INSTANCE     [TYPE_NAME, SNAPSHOT]
+    reference    EXT_REFERENCE    [REFID, VALUE]
+    dereference  EXT_DEREFERENCE  REFID
+    enum         EXT_ENUM         "module.Enum.NAME"
+    type         EXT_TYPE         "module.Type"
+    external     EXT_EXTERNAL     IDENTIFIER
+    function     EXT_FUNCTION     "module.function"
+    big integer  EXT_BIGINT       BYTES
+    buffer       EXT_BUFFER       INDEX
+
+Dictionaries are maps, their keys can be any of the values above.
+"""
+
+from __future__ import absolute_import
+
+import binascii
+import struct
+
+from past.types import unicode, long
+
+from serialization import tagged
+
+
+EXT_TUPLE = 1
+EXT_SET = 2
+EXT_INSTANCE = 3
+EXT_REFERENCE = 4
+EXT_DEREFERENCE = 5
+EXT_ENUM = 6
+EXT_TYPE = 7
+EXT_EXTERNAL = 8
+EXT_FUNCTION = 9
+EXT_BIGINT = 10
+EXT_BUFFER = 11
+
+MSGPACK_CONVERTER_CAPS = tagged.TAGGED_CONVERTER_CAPS
+
+MSGPACK_FREEZER_CAPS = tagged.TAGGED_FREEZER_CAPS
+
+Map = tagged.Map
+
+
+class ExtType(tagged.Tagged):
+    """MessagePack extension type, the data is the packed value
+    of its content."""
+
+    __slots__ = ()
+
+    @property
+    def code(self):
+        return self.tag
+
+    @property
+    def data(self):
+        return self.value
+
+
+def encode(data):
+    """Returns the MessagePack document of a value made of basic types,
+    Map and ExtType instances."""
+    buf = bytearray()
+    _write(buf, data)
+    return bytes(buf)
+
+
+def decode(data):
+    """Returns the value of a MessagePack document, made of basic types,
+    Map and ExtType instances."""
+    data = bytes(data)
+    value, pos = _read(data, 0)
+    if pos != len(data):
+        raise ValueError("Extra data after the MessagePack document "
+                         "at offset %d" % pos)
+    return value
+
+
+class Serializer(tagged.Serializer):
+    """Serializes to MessagePack documents given as bytes."""
+
+    tagged_class = ExtType
+    tuple_tag = EXT_TUPLE
+    set_tag = EXT_SET
+    instance_tag = EXT_INSTANCE
+    reference_tag = EXT_REFERENCE
+    dereference_tag = EXT_DEREFERENCE
+    enum_tag = EXT_ENUM
+    type_tag = EXT_TYPE
+    external_tag = EXT_EXTERNAL
+    function_tag = EXT_FUNCTION
+    buffer_tag = EXT_BUFFER
+
+    ### Overridden Methods ###
+
+    def post_convertion(self, data):
+        return encode(data)
+
+
+class Unserializer(tagged.Unserializer):
+    """Unserializes MessagePack documents given as bytes."""
+
+    tagged_class = ExtType
+    instance_tag = EXT_INSTANCE
+
+    ### Overridden Methods ###
+
+    def pre_convertion(self, data):
+        return decode(data)
+
+    ### lookup tables ###
+
+    _tag_unpackers = tagged.tag_unpackers(tuple=EXT_TUPLE,
+                                          set=EXT_SET,
+                                          reference=EXT_REFERENCE,
+                                          dereference=EXT_DEREFERENCE,
+                                          enum=EXT_ENUM,
+                                          type=EXT_TYPE,
+                                          external=EXT_EXTERNAL,
+                                          function=EXT_FUNCTION,
+                                          buffer=EXT_BUFFER)
+
+
+### encoding ###
+
+_UINT8 = struct.Struct(">BB").pack
+_UINT16 = struct.Struct(">BH").pack
+_UINT32 = struct.Struct(">BI").pack
+_UINT64 = struct.Struct(">BQ").pack
+_INT8 = struct.Struct(">Bb").pack
+_INT16 = struct.Struct(">Bh").pack
+_INT32 = struct.Struct(">Bi").pack
+_INT64 = struct.Struct(">Bq").pack
+_FLOAT64 = struct.Struct(">Bd").pack
+_FIXEXT = struct.Struct(">Bb").pack
+_EXT8 = struct.Struct(">BBb").pack
+_EXT16 = struct.Struct(">BHb").pack
+_EXT32 = struct.Struct(">BIb")
+_EXT32_PLACEHOLDER = b"\xc9\x00\x00\x00\x00\x00"
+
+# Codes of the fixed size extension types by data size
+_FIXEXT_CODES = {1: 0xd4, 2: 0xd5, 4: 0xd6, 8: 0xd7, 16: 0xd8}
+
+
+def _write(buf, value):
+    try:
+        writer = _writers[type(value)]
+    except KeyError:
+        raise TypeError("Object of type %s is not MessagePack serializable"
+                        % type(value).__name__)
+    writer(buf, value)
+
+
+def _write_none(buf, value):
+    buf.append(0xc0)
+
+
+def _write_bool(buf, value):
+    buf.append(0xc3 if value else 0xc2)
+
+
+def _write_int(buf, value):
+    if value >= 0:
+        if value < 0x80:
+            buf.append(value)
+        elif value < 0x100:
+            buf += _UINT8(0xcc, value)
+        elif value < 0x10000:
+            buf += _UINT16(0xcd, value)
+        elif value < 0x100000000:
+            buf += _UINT32(0xce, value)
+        elif value < 0x10000000000000000:
+            buf += _UINT64(0xcf, value)
+        else:
+            _write_bigint(buf, value)
+    elif value >= -0x20:
+        buf.append(value & 0xff)
+    elif value >= -0x80:
+        buf += _INT8(0xd0, value)
+    elif value >= -0x8000:
+        buf += _INT16(0xd1, value)
+    elif value >= -0x80000000:
+        buf += _INT32(0xd2, value)
+    elif value >= -0x8000000000000000:
+        buf += _INT64(0xd3, value)
+    else:
+        _write_bigint(buf, value)
+
+
+def _write_bigint(buf, value):
+    # Big endian two's complement with the sign bit
+    size = (value.bit_length() + 8) // 8
+    if value < 0:
+        value += 1 << (size * 8)
+    _write_ext_data(buf, EXT_BIGINT,
+                    binascii.unhexlify("%0*x" % (size * 2, value)))
+
+
+def _write_float(buf, value):
+    buf += _FLOAT64(0xcb, value)
+
+
+def _write_unicode(buf, value):
+    data = value.encode("utf-8")
+    size = len(data)
+    if size < 0x20:
+        buf.append(0xa0 | size)
+    elif size < 0x100:
+        buf += _UINT8(0xd9, size)
+    elif size < 0x10000:
+        buf += _UINT16(0xda, size)
+    else:
+        buf += _UINT32(0xdb, size)
+    buf += data
+
+
+def _write_bytes(buf, value):
+    size = len(value)
+    if size < 0x100:
+        buf += _UINT8(0xc4, size)
+    elif size < 0x10000:
+        buf += _UINT16(0xc5, size)
+    else:
+        buf += _UINT32(0xc6, size)
+    buf += value
+
+
+def _write_memoryview(buf, value):
+    # The size is given in bytes whatever the format of the items,
+    # only contiguous views can be cast to bytes
+    if not value.c_contiguous:
+        _write_bytes(buf, value.tobytes())
+    else:
+        _write_bytes(buf, value.cast("B"))
+
+
+def _write_list(buf, value):
+    size = len(value)
+    if size < 0x10:
+        buf.append(0x90 | size)
+    elif size < 0x10000:
+        buf += _UINT16(0xdc, size)
+    else:
+        buf += _UINT32(0xdd, size)
+    for item in value:
+        _write(buf, item)
+
+
+def _write_map(buf, value):
+    pairs = value.pairs
+    size = len(pairs)
+    if size < 0x10:
+        buf.append(0x80 | size)
+    elif size < 0x10000:
+        buf += _UINT16(0xde, size)
+    else:
+        buf += _UINT32(0xdf, size)
+    for key, item in pairs:
+        _write(buf, key)
+        _write(buf, item)
+
+
+def _write_ext(buf, value):
+    # The data is written first and the header fixed when its size
+    # is known, moving at most 64KiB of data to shrink the header.
+    start = len(buf)
+    buf += _EXT32_PLACEHOLDER
+    _write(buf, value.value)
+    size = len(buf) - start - 6
+    code = value.tag
+    fixext = _FIXEXT_CODES.get(size)
+    if fixext is not None:
+        buf[start:start + 6] = _FIXEXT(fixext, code)
+    elif size < 0x100:
+        buf[start:start + 6] = _EXT8(0xc7, size, code)
+    elif size < 0x10000:
+        buf[start:start + 6] = _EXT16(0xc8, size, code)
+    else:
+        _EXT32.pack_into(buf, start, 0xc9, size, code)
+
+
+def _write_ext_data(buf, code, data):
+    size = len(data)
+    fixext = _FIXEXT_CODES.get(size)
+    if fixext is not None:
+        buf += _FIXEXT(fixext, code)
+    elif size < 0x100:
+        buf += _EXT8(0xc7, size, code)
+    elif size < 0x10000:
+        buf += _EXT16(0xc8, size, code)
+    else:
+        buf += _EXT32.pack(0xc9, size, code)
+    buf += data
+
+
+_writers = {type(None): _write_none,
+            bool: _write_bool,
+            int: _write_int,
+            long: _write_int,
+            float: _write_float,
+            unicode: _write_unicode,
+            bytes: _write_bytes,
+            bytearray: _write_bytes,
+            memoryview: _write_memoryview,
+            list: _write_list,
+            tuple: _write_list,
+            Map: _write_map,
+            ExtType: _write_ext}
+
+
+### decoding ###
+
+_UNPACK_UINT16 = struct.Struct(">H").unpack_from
+_UNPACK_UINT32 = struct.Struct(">I").unpack_from
+_UNPACK_UINT64 = struct.Struct(">Q").unpack_from
+_UNPACK_INT8 = struct.Struct(">b").unpack_from
+_UNPACK_INT16 = struct.Struct(">h").unpack_from
+_UNPACK_INT32 = struct.Struct(">i").unpack_from
+_UNPACK_INT64 = struct.Struct(">q").unpack_from
+_UNPACK_FLOAT32 = struct.Struct(">f").unpack_from
+_UNPACK_FLOAT64 = struct.Struct(">d").unpack_from
+
+
+def _read(data, pos):
+    try:
+        code = data[pos]
+    except IndexError:
+        raise ValueError("Unexpected end of MessagePack document")
+    if not isinstance(code, int):
+        code = ord(code)
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if code < 0x90:
+        return _read_map(data, pos, code & 0x0f)
+    if code < 0xa0:
+        return _read_list(data, pos, code & 0x0f)
+    if code < 0xc0:
+        return _read_unicode(data, pos, code & 0x1f)
+    reader = _readers.get(code)
+    if reader is None:
+        raise ValueError("Invalid MessagePack type 0x%02x at offset %d"
+                         % (code, pos - 1))
+    return reader(data, pos)
+
+
+def _read_list(data, pos, size):
+    result = []
+    append = result.append
+    for _ in range(size):
+        value, pos = _read(data, pos)
+        append(value)
+    return result, pos
+
+
+def _read_map(data, pos, size):
+    pairs = []
+    append = pairs.append
+    for _ in range(size):
+        key, pos = _read(data, pos)
+        value, pos = _read(data, pos)
+        append((key, value))
+    return Map(pairs), pos
+
+
+def _read_unicode(data, pos, size):
+    end = pos + size
+    if end > len(data):
+        raise ValueError("Unexpected end of MessagePack document")
+    return data[pos:end].decode("utf-8"), end
+
+
+def _read_bytes(data, pos, size):
+    end = pos + size
+    if end > len(data):
+        raise ValueError("Unexpected end of MessagePack document")
+    return data[pos:end], end
+
+
+def _read_ext(data, pos, size):
+    code, = _UNPACK_INT8(data, pos)
+    pos += 1
+    end = pos + size
+    if end > len(data):
+        raise ValueError("Unexpected end of MessagePack document")
+    if code == EXT_BIGINT:
+        value = int(binascii.hexlify(data[pos:end]), 16) if size else 0
+        if size and bytearray(data[pos:pos + 1])[0] & 0x80:
+            value -= 1 << (size * 8)
+        return value, end
+    if code not in _EXT_CODES:
+        raise ValueError("Unknown MessagePack extension type %d" % code)
+    value, pos = _read(data, pos)
+    if pos != end:
+        raise ValueError("Invalid size of MessagePack extension type %d"
+                         % code)
+    return ExtType(code, value), end
+
+
+def _reader(unpack, size, read=None):
+    # Returns a reader of a value or of the size of a value
+    if read is None:
+        return lambda data, pos: (unpack(data, pos)[0], pos + size)
+    return lambda data, pos: read(data, pos + size, unpack(data, pos)[0])
+
+
+def _fixext_reader(size):
+    return lambda data, pos: _read_ext(data, pos, size)
+
+
+def _unpack_uint8(data, pos):
+    return bytearray(data[pos:pos + 1])
+
+
+_EXT_CODES = set([EXT_TUPLE, EXT_SET, EXT_INSTANCE, EXT_REFERENCE,
+                  EXT_DEREFERENCE, EXT_ENUM, EXT_TYPE, EXT_EXTERNAL,
+                  EXT_FUNCTION, EXT_BUFFER])
+
+_readers = {0xc0: lambda data, pos: (None, pos),
+            0xc2: lambda data, pos: (False, pos),
+            0xc3: lambda data, pos: (True, pos),
+            0xc4: _reader(_unpack_uint8, 1, _read_bytes),
+            0xc5: _reader(_UNPACK_UINT16, 2, _read_bytes),
+            0xc6: _reader(_UNPACK_UINT32, 4, _read_bytes),
+            0xc7: _reader(_unpack_uint8, 1, _read_ext),
+            0xc8: _reader(_UNPACK_UINT16, 2, _read_ext),
+            0xc9: _reader(_UNPACK_UINT32, 4, _read_ext),
+            0xca: _reader(_UNPACK_FLOAT32, 4),
+            0xcb: _reader(_UNPACK_FLOAT64, 8),
+            0xcc: _reader(_unpack_uint8, 1),
+            0xcd: _reader(_UNPACK_UINT16, 2),
+            0xce: _reader(_UNPACK_UINT32, 4),
+            0xcf: _reader(_UNPACK_UINT64, 8),
+            0xd0: _reader(_UNPACK_INT8, 1),
+            0xd1: _reader(_UNPACK_INT16, 2),
+            0xd2: _reader(_UNPACK_INT32, 4),
+            0xd3: _reader(_UNPACK_INT64, 8),
+            0xd4: _fixext_reader(1),
+            0xd5: _fixext_reader(2),
+            0xd6: _fixext_reader(4),
+            0xd7: _fixext_reader(8),
+            0xd8: _fixext_reader(16),
+            0xd9: _reader(_unpack_uint8, 1, _read_unicode),
+            0xda: _reader(_UNPACK_UINT16, 2, _read_unicode),
+            0xdb: _reader(_UNPACK_UINT32, 4, _read_unicode),
+            0xdc: _reader(_UNPACK_UINT16, 2, _read_list),
+            0xdd: _reader(_UNPACK_UINT32, 4, _read_list),
+            0xde: _reader(_UNPACK_UINT16, 2, _read_map),
+            0xdf: _reader(_UNPACK_UINT32, 4, _read_map)}
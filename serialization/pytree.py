@@ -189,11 +189,17 @@ class Serializer(base.Serializer):
     pack_external = External._build
 
     def __init__(self, post_converter=None, externalizer=None,
-                 source_ver=None, target_ver=None):
+                 source_ver=None, target_ver=None,
+                 single_pass=False, iterative=False, tree=False,
+                 check_cycles=False):
         base.Serializer.__init__(self, post_converter=post_converter,
                                  externalizer=externalizer,
                                  source_ver=source_ver,
-                                 target_ver=target_ver)
+                                 target_ver=target_ver,
+                                 single_pass=single_pass,
+                                 iterative=iterative,
+                                 tree=tree,
+                                 check_cycles=check_cycles)
 
     def pack_frozen_external(self, value):
         identifier, = value
@@ -210,6 +216,24 @@ class Serializer(base.Serializer):
     pack_frozen_builtin = pack_frozen_function
 
 
+def _item_values(data):
+    for key, value in data.items():
+        yield key
+        yield value
+
+
+def _instance_values(data):
+    return [data.snapshot]
+
+
+def _external_values(data):
+    return [data.identifier]
+
+
+def _reference_values(data):
+    return data.refid, data.value
+
+
 class Unserializer(base.Unserializer):
     '''Unserialize a structure serialized with L{pytree.Serializer}.
     The complexity in unserializing from python object tree is that
@@ -222,12 +246,13 @@ class Unserializer(base.Unserializer):
                               type(None), type, InterfaceClass, enum.Enum])
 
     def __init__(self, pre_converter=None, registry=None, externalizer=None,
-                 source_ver=None, target_ver=None):
+                 source_ver=None, target_ver=None, iterative=False):
         base.Unserializer.__init__(self, pre_converter=pre_converter,
                                    registry=registry,
                                    externalizer=externalizer,
                                    source_ver=source_ver,
-                                   target_ver=target_ver)
+                                   target_ver=target_ver,
+                                   iterative=iterative)
 
     ### Overridden Methods ###
 
@@ -272,15 +297,24 @@ class Unserializer(base.Unserializer):
         return tuple([self.unpack_data(d) for d in data])
 
     def unpack_list(self, container, data):
-        container.extend([self.unpack_data(d) for d in data])
+        self.extend_unpacked(container, data)
 
     def unpack_set(self, container, data):
-        container.update(self.unpack_unordered_values(data))
+        self.add_unpacked(container, data)
 
     def unpack_dict(self, container, data):
-        container.update(self.unpack_unordered_pairs(data.items()))
+        self.update_unpacked(container, data.items())
 
     _unpackers = {tuple: (None, unpack_tuple),
                   list: (list, unpack_list),
                   set: (set, unpack_set),
                   dict: (dict, unpack_dict)}
+
+    _children_lookup = {unpack_tuple: iter,
+                        unpack_list: iter,
+                        unpack_set: iter,
+                        unpack_dict: _item_values,
+                        unpack_instance: _instance_values,
+                        unpack_external: _external_values}
+
+    _reference_lookup = {unpack_reference: _reference_values}
@@ -22,6 +22,8 @@
 
 from __future__ import absolute_import
 
+import itertools
+
 from past.types import long
 from builtins import bytes
 
@@ -45,6 +47,7 @@ DICT_ATOM = "dictionary"
 CLASS_ATOM = "class"
 ENUM_ATOM = "enum"
 EXTERNAL_ATOM = "external"
+BUFFER_ATOM = "buffer"
 
 REFERENCE_ATOM = "reference"
 DEREFERENCE_ATOM = "dereference"
@@ -56,13 +59,19 @@ class Serializer(base.Serializer):
 
     def __init__(self, post_converter=None, externalizer=None,
                  converter_caps=None, freezer_caps=None,
-                 source_ver=None, target_ver=None):
+                 source_ver=None, target_ver=None,
+                 single_pass=False, iterative=False, tree=False,
+                 check_cycles=False):
         base.Serializer.__init__(self, post_converter=post_converter,
                                  externalizer=externalizer,
                                  converter_caps=converter_caps,
                                  freezer_caps=freezer_caps,
                                  source_ver=source_ver,
-                                 target_ver=target_ver)
+                                 target_ver=target_ver,
+                                 single_pass=single_pass,
+                                 iterative=iterative,
+                                 tree=tree,
+                                 check_cycles=check_cycles)
 
     def pack_unicode(self, value):
         return [UNICODE_ATOM, value.encode(UNICODE_FORMAT_ATOM)]
@@ -94,6 +103,9 @@ class Serializer(base.Serializer):
     def pack_dereference(self, value):
         return [DEREFERENCE_ATOM, value]
 
+    def pack_buffer(self, value):
+        return [BUFFER_ATOM, value]
+
     def pack_type(self, value):
         return [CLASS_ATOM, reflect.canonical_name(value)]
 
@@ -115,6 +127,22 @@ class Serializer(base.Serializer):
     pack_frozen_builtin = pack_frozen_function
 
 
+def _list_values(data):
+    # Skip the leading atom
+    return itertools.islice(data, 1, None)
+
+
+def _item_values(data):
+    for key, value in itertools.islice(data, 1, None):
+        yield key
+        yield value
+
+
+def _reference_values(data):
+    _, refid, value = data
+    return refid, value
+
+
 class Unserializer(base.Unserializer):
     '''Unserialize a structure serialized with L{sexp.Serializer}.'''
 
@@ -122,13 +150,14 @@ class Unserializer(base.Unserializer):
 
     def __init__(self, pre_converter=None, registry=None, externalizer=None,
                  converter_caps=None,
-                 source_ver=None, target_ver=None):
+                 source_ver=None, target_ver=None, iterative=False):
         base.Unserializer.__init__(self, pre_converter=pre_converter,
                                    registry=registry,
                                    externalizer=externalizer,
                                    converter_caps=converter_caps,
                                    source_ver=source_ver,
-                                   target_ver=target_ver)
+                                   target_ver=target_ver,
+                                   iterative=iterative)
 
     ### Overridden Methods ###
 
@@ -151,10 +180,13 @@ class Unserializer(base.Unserializer):
 
     def unpack_unicode(self, data):
         _, value = data
-        if not isinstance(value, (bytes, str)):
-            raise TypeError("Invalid %s value type: %r"
-                            % (UNICODE_ATOM, value))
-        return value.decode(UNICODE_FORMAT_ATOM)
+        if isinstance(value, bytes):
+            return value.decode(UNICODE_FORMAT_ATOM)
+        if isinstance(value, str):
+            # Already decoded by the pre-converter
+            return value
+        raise TypeError("Invalid %s value type: %r"
+                        % (UNICODE_ATOM, value))
 
     def unpack_bool(self, data):
         _, value = data
@@ -189,18 +221,21 @@ class Unserializer(base.Unserializer):
         _, refid = data
         return self.restore_dereference(refid)
 
+    def unpack_buffer(self, data):
+        _, index = data
+        return self.restore_buffer(index)
+
     def unpack_tuple(self, data):
         return tuple([self.unpack_data(d) for d in data[1:]])
 
     def unpack_list(self, container, data):
-        container.extend([self.unpack_data(d) for d in data[1:]])
+        self.extend_unpacked(container, data[1:])
 
     def unpack_set(self, container, data):
-        container.update([self.unpack_data(d) for d in data[1:]])
+        self.add_unpacked(container, data[1:])
 
     def unpack_dict(self, container, data):
-        container.update([(self.unpack_data(k), self.unpack_data(v))
-                          for k, v in data[1:]])
+        self.update_unpacked(container, data[1:])
 
     _unpackers = {UNICODE_ATOM: (None, unpack_unicode),
                   BOOL_ATOM: (None, unpack_bool),
@@ -211,6 +246,16 @@ class Unserializer(base.Unserializer):
                   EXTERNAL_ATOM: (None, unpack_external),
                   REFERENCE_ATOM: (None, unpack_reference),
                   DEREFERENCE_ATOM: (None, unpack_dereference),
+                  BUFFER_ATOM: (None, unpack_buffer),
                   LIST_ATOM: (list, unpack_list),
                   SET_ATOM: (set, unpack_set),
                   DICT_ATOM: (dict, unpack_dict)}
+
+    _children_lookup = {unpack_tuple: _list_values,
+                        unpack_list: _list_values,
+                        unpack_set: _list_values,
+                        unpack_dict: _item_values,
+                        unpack_instance: _list_values,
+                        unpack_external: _list_values}
+
+    _reference_lookup = {unpack_reference: _reference_values}
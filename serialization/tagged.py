@@ -0,0 +1,349 @@
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+
+# Headers in this file shall remain intact.
+
+"""Base converters of the binary formats wrapping the values without
+counterpart in the format in tagged values, see msgpack_ and cbor.
+
+The sub-classes only give the class of their tagged values and the tag
+of each kind of value, the packing and unpacking is shared:
+
+    tuple        tuple_tag        [VALUE, ...]
+    set          set_tag          [VALUE, ...]
+    instance     instance_tag     [TYPE_NAME, SNAPSHOT]
+    reference    reference_tag    [REFID, VALUE]
+    dereference  dereference_tag  REFID
+    enum         enum_tag         "module.Enum.NAME"
+    type         type_tag         "module.Type"
+    external     external_tag     IDENTIFIER
+    function     function_tag     "module.function"
+    buffer       buffer_tag       INDEX
+
+Dictionaries are Map instances, their keys can be any of the values above.
+"""
+
+from __future__ import absolute_import
+
+from past.types import unicode, long
+
+from serialization import reflect
+from serialization.interface import Capabilities
+from serialization import base
+
+
+TAGGED_CONVERTER_CAPS = set([Capabilities.int_values,
+                             Capabilities.long_values,
+                             Capabilities.enum_values,
+                             Capabilities.float_values,
+                             Capabilities.bytes_values,
+                             Capabilities.unicode_values,
+                             Capabilities.bool_values,
+                             Capabilities.none_values,
+                             Capabilities.tuple_values,
+                             Capabilities.list_values,
+                             Capabilities.set_values,
+                             Capabilities.dict_values,
+                             Capabilities.type_values,
+                             Capabilities.instance_values,
+                             Capabilities.external_values,
+                             Capabilities.int_keys,
+                             Capabilities.enum_keys,
+                             Capabilities.long_keys,
+                             Capabilities.float_keys,
+                             Capabilities.str_keys,
+                             Capabilities.unicode_keys,
+                             Capabilities.bool_keys,
+                             Capabilities.none_keys,
+                             Capabilities.type_keys,
+                             Capabilities.tuple_keys,
+                             Capabilities.circular_references,
+                             Capabilities.new_style_types,
+                             Capabilities.meta_types,
+                             Capabilities.function_values])
+
+TAGGED_FREEZER_CAPS = TAGGED_CONVERTER_CAPS \
+    | set([Capabilities.builtin_values,
+           Capabilities.method_values])
+
+
+class Tagged(object):
+    """Value wrapped with the tag giving its meaning."""
+
+    __slots__ = ("tag", "value")
+
+    def __init__(self, tag, value):
+        self.tag = tag
+        self.value = value
+
+    def __repr__(self):
+        return "<%s %d: %r>" % (type(self).__name__, self.tag, self.value)
+
+    def __eq__(self, other):
+        if not isinstance(other, type(self)):
+            return NotImplemented
+        return self.tag == other.tag and self.value == other.value
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return not eq if eq is not NotImplemented else eq
+
+
+class Map(object):
+    """Map of a binary format, the pairs are kept in order without
+    requiring the keys to be hashable."""
+
+    __slots__ = ("pairs", )
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def __repr__(self):
+        return "<Map %r>" % (self.pairs, )
+
+    def __eq__(self, other):
+        if not isinstance(other, Map):
+            return NotImplemented
+        return ([tuple(p) for p in self.pairs]
+                == [tuple(p) for p in other.pairs])
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return not eq if eq is not NotImplemented else eq
+
+
+class Serializer(base.Serializer):
+    """Packs the values without counterpart in the format in instances
+    of the tagged class with the tag of their kind."""
+
+    pack_dict = Map
+    # bytearray and memoryview are written like bytes
+    buffers_in_band = True
+
+    tagged_class = Tagged
+    tuple_tag = None
+    set_tag = None
+    instance_tag = None
+    reference_tag = None
+    dereference_tag = None
+    enum_tag = None
+    type_tag = None
+    external_tag = None
+    function_tag = None
+    buffer_tag = None
+
+    def __init__(self, externalizer=None, source_ver=None, target_ver=None,
+                 single_pass=False, iterative=False, tree=False,
+                 check_cycles=False):
+        base.Serializer.__init__(self, converter_caps=TAGGED_CONVERTER_CAPS,
+                                 freezer_caps=TAGGED_FREEZER_CAPS,
+                                 externalizer=externalizer,
+                                 source_ver=source_ver,
+                                 target_ver=target_ver,
+                                 single_pass=single_pass,
+                                 iterative=iterative,
+                                 tree=tree,
+                                 check_cycles=check_cycles)
+
+    ### Overridden Methods ###
+
+    def pack_tuple(self, data):
+        return self.tagged_class(self.tuple_tag, data)
+
+    def pack_set(self, data):
+        return self.tagged_class(self.set_tag, data)
+
+    def pack_enum(self, data):
+        name = reflect.canonical_name(data) + "." + data.name
+        return self.tagged_class(self.enum_tag, name)
+
+    def pack_type(self, data):
+        return self.tagged_class(self.type_tag,
+                                 reflect.canonical_name(data))
+
+    def pack_external(self, data):
+        identifier, = data
+        return self.tagged_class(self.external_tag, identifier)
+
+    def pack_instance(self, data):
+        return self.tagged_class(self.instance_tag, data)
+
+    def pack_reference(self, data):
+        return self.tagged_class(self.reference_tag, data)
+
+    def pack_dereference(self, data):
+        return self.tagged_class(self.dereference_tag, data)
+
+    def pack_function(self, data):
+        return self.tagged_class(self.function_tag,
+                                 reflect.canonical_name(data))
+
+    def pack_buffer(self, data):
+        return self.tagged_class(self.buffer_tag, data)
+
+    def pack_frozen_external(self, data):
+        snapshot, = data
+        return snapshot
+
+    def pack_frozen_instance(self, data):
+        snapshot, = data
+        return snapshot
+
+    def pack_frozen_function(self, data):
+        return reflect.canonical_name(data)
+
+    pack_frozen_builtin = pack_frozen_function
+    pack_frozen_method = pack_frozen_function
+
+
+def _tagged_values(data):
+    return iter(data.value)
+
+
+def _tagged_value(data):
+    return [data.value]
+
+
+def _instance_values(data):
+    return [data.value[1]]
+
+
+def _item_values(data):
+    for key, value in data.pairs:
+        yield key
+        yield value
+
+
+def _reference_values(data):
+    refid, value = data.value
+    return refid, value
+
+
+class Unserializer(base.Unserializer):
+    """Unpacks the values packed by L{Serializer}, sub-classes give
+    the tagged class and the unpackers of their tags created with
+    tag_unpackers()."""
+
+    pass_through_types = set([bytes, unicode, int, long,
+                              float, bool, type(None)])
+
+    tagged_class = Tagged
+    instance_tag = None
+
+    def __init__(self, registry=None, externalizer=None,
+                 source_ver=None, target_ver=None, iterative=False):
+        base.Unserializer.__init__(self,
+                                   converter_caps=TAGGED_CONVERTER_CAPS,
+                                   registry=registry,
+                                   externalizer=externalizer,
+                                   source_ver=source_ver,
+                                   target_ver=target_ver,
+                                   iterative=iterative)
+
+    ### Overridden Methods ###
+
+    def analyse_data(self, data):
+        analysis = self._unpackers.get(type(data))
+        if analysis is not None:
+            return analysis
+        if type(data) is self.tagged_class:
+            if data.tag == self.instance_tag:
+                return data.value[0], Unserializer.unpack_instance
+            return self._tag_unpackers.get(data.tag)
+
+    ### Private Methods ###
+
+    def unpack_list(self, container, data):
+        self.extend_unpacked(container, data)
+
+    def unpack_dict(self, container, data):
+        self.update_unpacked(container, data.pairs)
+
+    def unpack_tuple(self, data):
+        return tuple([self.unpack_data(d) for d in data.value])
+
+    def unpack_set(self, container, data):
+        self.add_unpacked(container, data.value)
+
+    def unpack_instance(self, data, *args):
+        type_name, snapshot = data.value
+        return self.restore_instance(type_name, snapshot, *args)
+
+    def unpack_reference(self, data):
+        refid, value = data.value
+        return self.restore_reference(refid, value)
+
+    def unpack_dereference(self, data):
+        return self.restore_dereference(data.value)
+
+    def unpack_enum(self, data):
+        parts = data.value.split('.')
+        enum = self.restore_type(".".join(parts[:-1]))
+        return enum[parts[-1]]
+
+    def unpack_type(self, data):
+        return self.restore_type(data.value)
+
+    def unpack_external(self, data):
+        return self.restore_external(data.value)
+
+    def unpack_function(self, data):
+        return reflect.named_object(data.value)
+
+    def unpack_buffer(self, data):
+        return self.restore_buffer(data.value)
+
+    ### lookup tables ###
+
+    _unpackers = {list: (list, unpack_list),
+                  Map: (dict, unpack_dict)}
+
+    _tag_unpackers = {}  # {TAG: (CONSTRUCTOR, UNPACKER)}
+
+    # Unpackers by kind of value, see tag_unpackers()
+    _kind_unpackers = {"tuple": (None, unpack_tuple),
+                       "set": (set, unpack_set),
+                       "reference": (None, unpack_reference),
+                       "dereference": (None, unpack_dereference),
+                       "enum": (None, unpack_enum),
+                       "type": (None, unpack_type),
+                       "external": (None, unpack_external),
+                       "function": (None, unpack_function),
+                       "buffer": (None, unpack_buffer)}
+
+    _children_lookup = {unpack_list: iter,
+                        unpack_dict: _item_values,
+                        unpack_tuple: _tagged_values,
+                        unpack_set: _tagged_values,
+                        unpack_instance: _instance_values,
+                        unpack_external: _tagged_value}
+
+    _reference_lookup = {unpack_reference: _reference_values}
+
+
+def tag_unpackers(**tags):
+    """Returns the unpackers of an L{Unserializer} sub-class
+    by tag from the tag of each kind of value, for example
+    tag_unpackers(tuple=TUPLE_TAG, set=SET_TAG, ...)."""
+    kinds = Unserializer._kind_unpackers
+    if set(tags) != set(kinds):
+        raise TypeError("Expected the tags of %s"
+                        % ", ".join(sorted(kinds)))
+    return dict((tag, kinds[kind]) for kind, tag in tags.items())
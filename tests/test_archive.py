@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+
+from __future__ import absolute_import
+
+import os
+
+import pytest
+
+import serialization
+from serialization import archive, compression, json_, msgpack_
+
+
+@serialization.register
+class DummyUser(serialization.Serializable):
+
+    def __init__(self, name=None, friends=None):
+        self.name = name
+        self.friends = friends or []
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "archive.dat")
+
+
+class TestArchive(object):
+
+    def test_put_get(self, path):
+        with archive.Archive(path) as store:
+            store.put(u"a", [1, 2.5, u"spam"])
+            store.put_many([(u"b", {u"x": None}), (u"c", (1, 2))])
+            assert len(store) == 3
+            assert store[u"a"] == [1, 2.5, u"spam"]
+            assert store.get(u"b") == {u"x": None}
+            assert store.get(u"missing", 42) == 42
+            assert u"c" in store
+            with pytest.raises(KeyError):
+                store[u"missing"]
+        with archive.Archive(path, readonly=True) as store:
+            assert sorted(store) == [u"a", u"b", u"c"]
+            assert store[u"c"] == (1, 2)
+            assert list(store.items()) == [(u"a", [1, 2.5, u"spam"]),
+                                           (u"b", {u"x": None}),
+                                           (u"c", (1, 2))]
+            with pytest.raises(ValueError):
+                store.put(u"d", 1)
+
+    def test_instances(self, path):
+        alice = DummyUser(u"alice")
+        bob = DummyUser(u"bob", [alice])
+        alice.friends.append(bob)
+        with archive.Archive(path) as store:
+            store.put_many([(u"alice", alice), (u"bob", bob)])
+            restored = store[u"bob"]
+            assert restored.name == u"bob"
+            assert restored.friends[0].friends[0] is restored
+
+    def test_replace_delete_compact(self, path):
+        store = archive.Archive(path)
+        store.put_many((u"%d" % i, [i] * 10) for i in range(100))
+        store.put_many((u"%d" % i, i) for i in range(0, 100, 2))
+        for i in range(1, 100, 4):
+            store.delete(u"%d" % i)
+        with pytest.raises(KeyError):
+            store.delete(u"1")
+        expected = dict((k, store[k]) for k in store)
+        assert len(expected) == 75
+        size = store.size()
+        store.compact()
+        assert store.size() < size
+        assert dict((k, store[k]) for k in store) == expected
+        store.put(u"new", u"value")
+        store.close()
+        with archive.Archive(path) as store:
+            expected[u"new"] = u"value"
+            assert dict(store.items()) == expected
+        assert not os.path.exists(path + ".compact")
+
+    def test_converters(self, path):
+        value = {u"text": u"spam " * 100, u"values": list(range(50))}
+        for serializer, unserializer in [
+                (msgpack_.Serializer(), msgpack_.Unserializer()),
+                (compression.Compressor(converter=json_.Serializer()),
+                 compression.Decompressor(converter=json_.Unserializer()))]:
+            with archive.Archive(path, serializer, unserializer) as store:
+                store.put(u"value", value)
+                assert store[u"value"] == value
+            os.remove(path)
+            os.remove(path + archive.INDEX_SUFFIX)
+
+    def test_partial_index_record(self, path):
+        with archive.Archive(path) as store:
+            store.put_many([(u"a", 1), (u"b", 2)])
+        with open(path + archive.INDEX_SUFFIX, "ab") as index:
+            index.write(b"\x00\x00\x00")
+        with archive.Archive(path) as store:
+            assert dict(store.items()) == {u"a": 1, u"b": 2}
+            store.put(u"c", 3)
+        with archive.Archive(path) as store:
+            assert store[u"c"] == 3
+
+    def test_invalid(self, path):
+        store = archive.Archive(path)
+        store.put(u"a", 1)
+        with pytest.raises(TypeError):
+            store.put(42, u"value")
+        with pytest.raises(TypeError):
+            archive.Archive(path + "2", json_.PreSerializer()).put(u"a", 1)
+        store.close()
+        with pytest.raises(ValueError):
+            store.put(u"a", 1)
+        with pytest.raises(ValueError):
+            store.get(u"a")
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+
+from __future__ import absolute_import
+
+import io
+import struct
+
+from future.utils import PY3
+
+import pytest
+
+from serialization import banana, sexp
+
+try:
+    from twisted.spread import banana as twisted_banana
+except ImportError:
+    twisted_banana = None
+
+
+EXPRESSIONS = [
+    (0, b"\x00\x81"),
+    (1234, b"\x52\x09\x81"),
+    (2 ** 31 - 1, b"\x7f\x7f\x7f\x7f\x07\x81"),
+    (2 ** 31, b"\x00\x00\x00\x00\x08\x85"),
+    (-1234, b"\x52\x09\x83"),
+    (-2 ** 31, b"\x00\x00\x00\x00\x08\x83"),
+    (-2 ** 31 - 1, b"\x01\x00\x00\x00\x08\x86"),
+    (2 ** 70, b"\x00" * 10 + b"\x01\x85"),
+    (1.5, b"\x84" + struct.pack("!d", 1.5)),
+    (b"", b"\x00\x82"),
+    (b"hello", b"\x05\x82hello"),
+    (b"x" * 200, b"\x48\x01\x82" + b"x" * 200),
+    ([], b"\x00\x80"),
+    ([1, [b"a", []], -2], b"\x03\x80\x01\x81\x02\x80\x01\x82a\x00\x80"
+                          b"\x02\x83")]
+
+
+class TestBanana(object):
+
+    @pytest.mark.parametrize("value, encoded", EXPRESSIONS)
+    def test_encoding(self, value, encoded):
+        assert banana.encode(value) == encoded
+        assert banana.decode(encoded) == value
+
+    @pytest.mark.parametrize("value, encoded", EXPRESSIONS)
+    def test_incremental_decoding(self, value, encoded):
+        decoder = banana.Decoder()
+        data = encoded * 3
+        results = []
+        for index in range(len(data)):
+            results.extend(decoder.feed(data[index:index + 1]))
+        assert results == [value] * 3
+        assert not decoder.pending
+
+    def test_chunks(self):
+        decoder = banana.Decoder()
+        encoded = banana.encode([b"spam", 42])
+        assert decoder.feed(encoded + encoded[:3]) == [[b"spam", 42]]
+        assert decoder.pending
+        assert decoder.feed(memoryview(encoded)[3:]) == [[b"spam", 42]]
+        assert not decoder.pending
+
+    def test_encode_into(self):
+        buf = bytearray(b"\xff")
+        assert banana.encode([1], buf) is buf
+        assert buf == bytearray(b"\xff\x01\x80\x01\x81")
+
+    def test_text(self):
+        encoded = banana.encode([u"list", u"\xe1"])
+        assert encoded == b"\x02\x80\x04\x82list\x02\x82\xc3\xa1"
+        assert banana.decode(encoded) == [b"list", b"\xc3\xa1"]
+        assert banana.decode(encoded, native_strings=True) == [u"list",
+                                                               u"\xe1"]
+
+    def test_vocabulary(self):
+        encoded = banana.encode([b"list", b"spam"], vocabulary=True)
+        assert encoded == b"\x02\x80\x08\x87\x04\x82spam"
+        assert banana.decode(encoded) == [b"list", b"spam"]
+
+    @pytest.mark.parametrize("value", [None, {}, object(), 2 ** 448])
+    def test_invalid_values(self, value):
+        with pytest.raises((TypeError, ValueError)):
+            banana.encode(value)
+
+    @pytest.mark.parametrize("encoded", [
+        b"", b"\x01\x80", b"\x05\x82abc", b"\x00\x88", b"\x7f\x87",
+        b"\x00\x81\x00\x81", b"\x01" * 65 + b"\x81",
+        b"\x00\x00\x00\x01\x82", b"\x00\x00\x00\x01\x80"])
+    def test_invalid_data(self, encoded):
+        with pytest.raises(ValueError):
+            banana.decode(encoded)
+
+    def test_sexp_converters(self):
+        serializer = sexp.Serializer(post_converter=banana.Encoder())
+        unserializer = sexp.Unserializer(
+            pre_converter=banana.Decoder(native_strings=PY3))
+        value = [u"spam", (1, 2.5), {u"a": None}, set([True]), -2 ** 40]
+        value.append(value)
+        encoded = serializer.convert(value)
+        assert isinstance(encoded, bytes)
+        result = unserializer.convert(encoded)
+        assert result[:5] == value[:5]
+        assert result[5] is result
+
+    @pytest.mark.skipif(twisted_banana is None,
+                        reason="twisted.spread is not available")
+    @pytest.mark.parametrize("value, encoded", EXPRESSIONS)
+    def test_twisted_compatibility(self, value, encoded):
+        encoder = twisted_banana.Banana()
+        encoder.currentDialect = b"none"
+        stream = io.BytesIO()
+        encoder._encode(value, stream.write)
+        assert stream.getvalue() == encoded
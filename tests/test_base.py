@@ -25,8 +25,20 @@
 
 from __future__ import absolute_import
 
+import functools
+import json
+import sys
+import threading
+
+from future.utils import PY3
+
+import pytest
+from zope.interface import alsoProvides, classImplements, implementedBy
+
 import serialization
-from serialization import base
+from serialization import adapter, base, json_, pytree, reflect, sexp
+from serialization import banana, cbor, msgpack_
+from serialization.interface import Capabilities, ISerializable
 
 
 class A(serialization.Serializable):
@@ -298,3 +310,514 @@ class TestVersionAdapter(object):
 
         self.check_combinations(DummyVerAdapter2, range(1, 10), expected)
         self.check_combinations(DummyVerAdapter2(), range(1, 10), expected)
+
+
+def shared_values():
+    a = [1]
+    b = (a, "spam")
+    c = {"x": b, "y": [a, b]}
+    yield [c, a, [b], c]
+
+    values = []
+    values.append(values)
+    yield [values, [[values]], {"l": values}]
+
+    t = (1, 2)
+    yield [set([t, (3, t)]), [t], (t, [t])]
+
+    x = A(None)
+    y = A(x)
+    x.x = [y, x]
+    yield [[[y]], x, [x.x]]
+
+    z = [2]
+    yield [[[[z]]], [[[z]]], {"z": [[z]]}]
+
+
+def deep_value(depth):
+    shared = [42]
+    value = shared
+    for index in range(depth):
+        value = [(value, index)]
+    return [shared, value]
+
+
+def check_deep_value(value, depth):
+    shared, value = value
+    for index in reversed(range(depth)):
+        assert len(value) == 1
+        value, value_index = value[0]
+        assert value_index == index
+    assert value is shared
+    assert shared == [42]
+
+
+@pytest.fixture(params=[json_.Serializer, pytree.Serializer, sexp.Serializer])
+def serializer_factory(request):
+    return request.param
+
+
+class TestSinglePass(object):
+
+    def test_same_output(self, serializer_factory):
+        two_pass = serializer_factory()
+        single_pass = serializer_factory(single_pass=True)
+        for value in shared_values():
+            assert single_pass.convert(value) == two_pass.convert(value)
+            assert single_pass.freeze(value) == two_pass.freeze(value)
+
+    def test_state_cleanup(self, serializer_factory):
+        serializer = serializer_factory(single_pass=True)
+        for value in shared_values():
+            serializer.convert(value)
+            assert serializer._frames == {}
+            assert serializer._path == []
+
+
+class TestIterative(object):
+
+    def test_same_output(self, serializer_factory):
+        recursive = serializer_factory()
+        iterative = serializer_factory(iterative=True)
+        for value in shared_values():
+            assert iterative.convert(value) == recursive.convert(value)
+            assert iterative.freeze(value) == recursive.freeze(value)
+
+    @pytest.mark.parametrize("module", [pytree, sexp])
+    def test_deep_values(self, module):
+        depth = sys.getrecursionlimit() * 10
+        serializer = module.Serializer(iterative=True)
+        unserializer = module.Unserializer(iterative=True)
+        data = serializer.convert(deep_value(depth))
+        check_deep_value(unserializer.convert(data), depth)
+
+
+class Plain(object):
+
+    def __init__(self, value):
+        self.value = value
+
+
+class PlainAdapter(serialization.Serializable):
+
+    def __init__(self, plain):
+        self.plain = plain
+
+    def snapshot(self):
+        return self.plain.value
+
+
+class Adapted(Plain):
+    type_name = "adapted"
+
+    def snapshot(self):
+        return u"own %s" % (self.value, )
+
+
+adapter.register_adapter(adapter.registry, PlainAdapter,
+                         Adapted, ISerializable)
+
+
+class LateAdapted(Adapted):
+    pass
+
+
+class Unregistered(object):
+
+    def __init__(self, value):
+        self.value = value
+
+
+class TestUnknownLookup(object):
+
+    def test_cached_by_type(self):
+        serializer = pytree.Serializer()
+        serializer.convert([A(1), A(2), base.Serializable])
+        lookup = base._unknown_lookups[pytree.Serializer][1]
+        assert lookup[(A, False)] == (None, adapter._itself)
+        assert lookup[(type(base.Serializable), False)] == \
+            (pytree.Serializer.flatten_type_value, None)
+
+    def test_adapter_registration(self):
+        serializer = pytree.Serializer()
+        with pytest.raises(TypeError):
+            serializer.convert(Plain(42))
+        adapter.register_adapter(adapter.registry, PlainAdapter,
+                                 Plain, ISerializable)
+        data = serializer.convert([Plain(42), Plain(18)])
+        assert [i.snapshot for i in data] == [42, 18]
+
+    def test_adapter_unregistration(self):
+        serializer = pytree.Serializer()
+        adapter.register_adapter(adapter.registry, PlainAdapter,
+                                 Unregistered, ISerializable)
+        assert serializer.convert(Unregistered(42)).snapshot == 42
+        adapter.registry.unregister([implementedBy(Unregistered)],
+                                    ISerializable, '', PlainAdapter)
+        with pytest.raises(TypeError):
+            serializer.convert(Unregistered(42))
+
+    def test_provided_by_instance(self):
+        serializer = pytree.Serializer()
+        value = Adapted(42)
+        alsoProvides(value, ISerializable)
+        data = serializer.convert([Adapted(18), value, Adapted(1)])
+        assert [i.snapshot for i in data] == [18, u"own 42", 1]
+
+    def test_implemented_later(self):
+        serializer = pytree.Serializer()
+        assert serializer.convert(LateAdapted(42)).snapshot == 42
+        classImplements(LateAdapted, ISerializable)
+        assert serializer.convert(LateAdapted(42)).snapshot == u"own 42"
+
+
+class TestCapabilities(object):
+
+    def test_unsupported_types(self):
+        caps = base.DEFAULT_CONVERTER_CAPS \
+            - set([Capabilities.list_values, Capabilities.none_keys])
+        serializer = sexp.Serializer(converter_caps=caps)
+        name = reflect.canonical_name(serializer)
+        with pytest.raises(ValueError) as exc:
+            serializer.convert((1, [2]))
+        assert str(exc.value) == \
+            "Serializer %s do not support list_values: [2]" % name
+        with pytest.raises(ValueError) as exc:
+            serializer.convert({None: 2})
+        assert str(exc.value) == \
+            "Serializer %s do not support none_keys: None" % name
+        # Freezer capabilities are compiled separately
+        assert serializer.freeze({None: [2]}) == \
+            ['dictionary', [['None'], ['list', 2]]]
+
+    def test_unsupported_iteratively(self):
+        caps = base.DEFAULT_CONVERTER_CAPS - set([Capabilities.set_values])
+        serializer = sexp.Serializer(converter_caps=caps, iterative=True)
+        name = reflect.canonical_name(serializer)
+        with pytest.raises(ValueError) as exc:
+            serializer.convert([set([1])])
+        assert str(exc.value) == \
+            "Serializer %s do not support set_values: {1}" % name
+
+
+def tree_values():
+    yield [1, (2, "spam"), {"x": [3, (4, )], "y": set([5])}]
+    yield [A([1, 2]), B(A(None), {"z": (1, 2)})]
+    yield [[[[[]]]], (((), ), ), {"a": {"b": {}}}]
+
+
+@pytest.fixture(params=[{}, {"single_pass": True}, {"iterative": True}])
+def mode(request):
+    return request.param
+
+
+class TestTree(object):
+
+    def test_same_output(self, serializer_factory, mode):
+        default = serializer_factory(**mode)
+        tree = serializer_factory(tree=True, **mode)
+        checked = serializer_factory(tree=True, check_cycles=True, **mode)
+        for value in tree_values():
+            assert tree.convert(value) == default.convert(value)
+            assert tree.freeze(value) == default.freeze(value)
+            assert checked.convert(value) == default.convert(value)
+
+    def test_shared_values(self, mode):
+        serializer = pytree.Serializer(tree=True, check_cycles=True, **mode)
+        a = [1, 2]
+        b = A(a)
+        # Shared values are just serialized multiple times
+        assert serializer.freeze([a, (a, b), b]) == \
+            [[1, 2], ([1, 2], {"x": [1, 2]}), {"x": [1, 2]}]
+        assert serializer.convert([b, b]) == \
+            pytree.Serializer().convert([A([1, 2]), A([1, 2])])
+
+    def test_cycles(self, serializer_factory, mode):
+        serializer = serializer_factory(tree=True, check_cycles=True, **mode)
+        a = []
+        a.append([a])
+        b = A(None)
+        b.x = {"b": [b]}
+        for value in ([1, a], (b, )):
+            with pytest.raises(ValueError):
+                serializer.convert(value)
+            with pytest.raises(ValueError):
+                serializer.freeze(value)
+            assert serializer._ancestors == {}
+
+
+class Nested(serialization.Serializable):
+
+    serializer = None
+
+    def __init__(self, value):
+        self.value = value
+
+    def snapshot(self):
+        # Serialize from inside a serialization
+        return {"value": self.serializer.convert(self.value)}
+
+
+class TestReentrancy(object):
+
+    def test_reentrant_serializer(self, mode):
+        serializer = json_.Serializer(**mode)
+        Nested.serializer = serializer
+        a = [1, 2]
+        data = json.loads(serializer.convert([a, Nested([a, a]), a]))
+        assert data == [
+            [".ref", 1, [1, 2]],
+            {".type": Nested.type_name,
+             "value": '[[".ref", 1, [1, 2]], [".deref", 1]]'},
+            [".deref", 1]]
+
+    def test_shared_between_threads(self, serializer_factory):
+        serializer = serializer_factory()
+        values = list(shared_values())
+        expected = [serializer.convert(v) for v in values]
+        errors = []
+
+        def run():
+            try:
+                for _ in range(50):
+                    for value, data in zip(values, expected):
+                        assert serializer.convert(value) == data
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+
+    def test_unserializer_shared_between_threads(self):
+        serializer = json_.Serializer()
+        unserializer = json_.Unserializer()
+        value = [{"a": [1, 2]}, (3, 4)]
+        value[0]["b"] = value[0]["a"]
+        data = serializer.convert(value)
+        results = []
+
+        def run():
+            for _ in range(100):
+                results.append(unserializer.convert(data))
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(results) == 800
+        for result in results:
+            assert result == value
+            assert result[0]["a"] is result[0]["b"]
+
+
+class TestPool(object):
+
+    def test_reuse(self):
+        created = []
+
+        def factory():
+            created.append(pytree.Serializer())
+            return created[-1]
+
+        pool = serialization.Pool(factory, size=1)
+        assert pool.convert([1, 2]) == [1, 2]
+        assert pool.freeze((1, 2)) == (1, 2)
+        assert len(created) == 1
+        first, second = pool.acquire(), pool.acquire()
+        assert first is created[0]
+        assert second is created[1]
+        pool.release(first)
+        pool.release(second)
+        assert pool.acquire() is first
+        assert pool.acquire() is created[2]
+
+    def test_factory_arguments(self):
+        pool = serialization.Pool(functools.partial(json_.Serializer,
+                                                    sort_keys=True))
+        assert pool.convert({"b": 1, "a": 2}) == '{"a": 2, "b": 1}'
+
+
+class TestBatch(object):
+
+    def test_convert_many(self, serializer_factory, mode):
+        serializer = serializer_factory(**mode)
+        values = list(shared_values()) * 2
+        expected = [serializer.convert(v) for v in values]
+        assert list(serializer.convert_many(values)) == expected
+        expected = [serializer.freeze(v) for v in values]
+        assert list(serializer.freeze_many(iter(values))) == expected
+
+    def test_convert_many_failure(self):
+        serializer = pytree.Serializer()
+        a = [1]
+        converted = serializer.convert_many([[a, a], [object(), a], [a]])
+        assert next(converted) == [pytree.Reference(1, [1]),
+                                   pytree.Dereference(1)]
+        # The generator is done after a failure, the serializer is reset
+        with pytest.raises(TypeError):
+            next(converted)
+        assert list(converted) == []
+        assert serializer.convert([a, a]) == [pytree.Reference(1, [1]),
+                                              pytree.Dereference(1)]
+
+    def test_unserializer_convert_many(self):
+        serializer = json_.Serializer()
+        unserializer = json_.Unserializer()
+        a = [1]
+        values = [[a, a], {"a": a, "b": (a, )}, [a, [a]]]
+        results = list(unserializer.convert_many(
+            serializer.convert_many(values)))
+        assert results == values
+        assert results[0][0] is results[0][1]
+        assert results[1]["a"] is results[1]["b"][0]
+        assert results[2][0] is results[2][1][0]
+        assert results[0][0] is not results[2][0]
+
+
+@pytest.fixture(params=[json_, sexp, msgpack_, cbor])
+def module(request):
+    return request.param
+
+
+class TestBuffers(object):
+
+    def test_symmetry(self, module, mode):
+        serializer = module.Serializer(**mode)
+        unserializer = module.Unserializer(
+            iterative=mode.get("iterative", False))
+        blob = b"\x00\xff" * 100
+        array = bytearray(b"spam" * 100)
+        value = [blob, {u"k": (array, 2)}, memoryview(blob)[:50], blob]
+        converted, buffers = serializer.convert_buffers(value)
+        assert len(buffers) == 3
+        assert all(isinstance(b, memoryview) for b in buffers)
+        assert buffers[0].obj is blob
+        assert buffers[1].obj is array
+        assert len(converted) < 100
+        result = unserializer.convert_buffers(converted, buffers)
+        assert result == [buffers[0], {u"k": (buffers[1], 2)}, buffers[2],
+                          buffers[0]]
+        assert result[0] is buffers[0]
+        assert result[3] is buffers[0]
+        assert result[1][u"k"][0] is buffers[1]
+
+    def test_threshold(self, module):
+        if module is sexp and PY3:
+            pytest.skip("sexp only restores bytes values on Python 2")
+        serializer = module.Serializer()
+        unserializer = module.Unserializer()
+        value = [b"a" * 10, b"b" * 20]
+        converted, buffers = serializer.convert_buffers(value, threshold=15)
+        assert buffers == [memoryview(value[1])]
+        assert unserializer.convert_buffers(converted, buffers) == value
+        # Buffers are not used by the default conversion
+        converted = serializer.convert(value)
+        assert unserializer.convert(converted) == value
+
+    def test_strided_views(self, module, mode):
+        serializer = module.Serializer(**mode)
+        unserializer = module.Unserializer(
+            iterative=mode.get("iterative", False))
+        blob = b"\x00\xff" * 100
+        view = memoryview(blob)[::2]
+        converted, buffers = serializer.convert_buffers([view, view])
+        # Non-contiguous views are copied to be written aside
+        assert len(buffers) == 1
+        assert buffers[0].c_contiguous
+        assert buffers[0] == b"\x00" * 100
+        result = unserializer.convert_buffers(converted, buffers)
+        assert result == [buffers[0], buffers[0]]
+        assert result[0] is result[1]
+
+    def test_missing_buffers(self, module):
+        serializer = module.Serializer()
+        converted, buffers = serializer.convert_buffers([b"spam"])
+        with pytest.raises(ValueError):
+            module.Unserializer().convert(converted)
+        with pytest.raises(ValueError):
+            module.Unserializer().convert_buffers(converted, [])
+
+    def test_unsupported(self):
+        with pytest.raises(TypeError):
+            pytree.Serializer().convert_buffers([b"spam"])
+
+    @pytest.mark.parametrize("value", [bytearray(b"spam"),
+                                       memoryview(b"spam"),
+                                       memoryview(b"s-p-a-m-")[::2]])
+    def test_in_band(self, value):
+        for module in (json_, msgpack_, cbor):
+            converted = module.Serializer().convert([value])
+            assert module.Unserializer().convert(converted) == [b"spam"]
+        # The other formats cannot restore them in band
+        for module in (sexp, pytree):
+            with pytest.raises(TypeError):
+                module.Serializer().convert([value])
+        with pytest.raises(TypeError):
+            banana.encode(sexp.Serializer().convert([value]))
+        # But they can keep them out of band
+        converted, buffers = sexp.Serializer().convert_buffers([value])
+        result = sexp.Unserializer().convert_buffers(converted, buffers)
+        assert result == [buffers[0]]
+
+
+class Text(str):
+    pass
+
+
+class TestPassThrough(object):
+
+    def test_cached_by_type(self):
+        unserializer = pytree.Unserializer()
+        values = [Text("spam"), 42, Capabilities.int_values, A, None]
+        result = unserializer.convert(values)
+        assert result == values
+        assert result[0] is values[0]
+        lookup = unserializer._pass_through_lookup
+        assert lookup[Text] is True
+        assert lookup[Capabilities] is True
+        assert lookup[type(A)] is True
+        assert lookup[list] is False
+
+
+@pytest.fixture(params=[False, True])
+def iterative(request):
+    return request.param
+
+
+class TestScheduler(object):
+
+    def test_forward_chain(self, iterative):
+        # Every value refers to the next one, in reversed unpacking order
+        data = dict((i, pytree.Reference(i, (pytree.Dereference(i + 1), )))
+                    for i in range(50))
+        data[50] = pytree.Reference(50, ())
+        unserializer = pytree.Unserializer(iterative=iterative)
+        result = unserializer.convert(data)
+        assert result[50] == ()
+        for i in range(50):
+            assert result[i][0] is result[i + 1]
+        assert not unserializer._waiting
+        assert not unserializer._ready
+
+    def test_partial_list(self, iterative):
+        data = [pytree.Reference(1, [0, (pytree.Dereference(2), ), 3]),
+                pytree.Reference(2, (pytree.Dereference(1), ))]
+        unserializer = pytree.Unserializer(iterative=iterative)
+        result = unserializer.convert(data)
+        first, second = result
+        assert first[0] == 0
+        assert first[1][0] is second
+        assert first[2] == 3
+        assert second[0] is first
+
+    def test_unknown_reference(self, iterative):
+        unserializer = pytree.Unserializer(iterative=iterative)
+        with pytest.raises(ValueError):
+            unserializer.convert({1: (pytree.Dereference(2), )})
+        # The unserializer is still usable
+        assert unserializer.convert({1: (2, )}) == {1: (2, )}
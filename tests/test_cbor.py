@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+
+from __future__ import absolute_import
+
+import binascii
+
+import pytest
+
+from serialization import cbor
+
+import serialization
+
+
+@serialization.register
+class DummyClass(serialization.Serializable):
+
+    def dummy_method(self):
+        pass
+
+
+def dummy_function():
+    pass
+
+
+# Examples of RFC 8949 appendix A that are written the same way
+ENCODING_EXAMPLES = [
+    (0, "00"), (23, "17"), (24, "1818"), (100, "1864"), (1000, "1903e8"),
+    (1000000, "1a000f4240"), (1000000000000, "1b000000e8d4a51000"),
+    (18446744073709551615, "1bffffffffffffffff"),
+    (18446744073709551616, "c249010000000000000000"),
+    (-18446744073709551616, "3bffffffffffffffff"),
+    (-18446744073709551617, "c349010000000000000000"),
+    (-1, "20"), (-10, "29"), (-100, "3863"), (-1000, "3903e7"),
+    (1.1, "fb3ff199999999999a"), (-4.1, "fbc010666666666666"),
+    (False, "f4"), (True, "f5"), (None, "f6"),
+    (b"", "40"), (b"\x01\x02\x03\x04", "4401020304"),
+    (u"", "60"), (u"a", "6161"), (u"IETF", "6449455446"),
+    (u"ü", "62c3bc"), (u"水", "63e6b0b4"),
+    ([], "80"), ([1, 2, 3], "83010203"),
+    ([1, [2, 3], [4, 5]], "8301820203820405"),
+    (list(range(1, 26)), "98190102030405060708090a0b0c0d0e0f101112131415"
+                         "161718181819"),
+    ({}, "a0"), ({1: 2, 3: 4}, "a201020304")]
+
+# Examples of RFC 8949 appendix A that are only read
+DECODING_EXAMPLES = [
+    (0.0, "f90000"), (-0.0, "f98000"), (1.0, "f93c00"), (1.5, "f93e00"),
+    (65504.0, "f97bff"), (100000.0, "fa47c35000"),
+    (3.4028234663852886e+38, "fa7f7fffff"),
+    (None, "f7"),
+    (b"\x01\x02\x03\x04\x05", "5f42010243030405ff"),
+    (u"streaming", "7f657374726561646d696e67ff"),
+    ([], "9fff"), ([1, [2, 3], [4, 5]], "9f018202039f0405ffff"),
+    ([1, [2, 3], [4, 5]], "83018202039f0405ff"),
+    ({u"a": 1, u"b": [2, 3]}, "bf61610161629f0203ffff"),
+    ({u"Fun": True, u"Amt": -2}, "bf6346756ef563416d7421ff")]
+
+
+class TestCBORConverters(object):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return cbor.Serializer(externalizer=helper.externalizer)
+
+    @pytest.fixture
+    def unserializer(self, helper):
+        return cbor.Unserializer(externalizer=helper.externalizer)
+
+    def test_symmetry(self, helper, serializer, unserializer):
+        helper.check_symmetry(serializer, unserializer)
+
+    @pytest.mark.parametrize("value, document", ENCODING_EXAMPLES)
+    def test_encoding(self, serializer, unserializer, value, document):
+        document = binascii.unhexlify(document)
+        assert serializer.convert(value) == document
+        assert unserializer.convert(document) == value
+
+    @pytest.mark.parametrize("value, document", DECODING_EXAMPLES)
+    def test_decoding(self, unserializer, value, document):
+        result = unserializer.convert(binascii.unhexlify(document))
+        assert result == value
+        assert type(result) is type(value)
+
+    @pytest.mark.parametrize("value, document", [
+        ((), "d9f3a080"),
+        ((1, 2), "d9f3a0820102"),
+        (set([1]), "d9010281" "01"),
+        (DummyClass, "d9f3a2781a" + binascii.hexlify(
+            b"tests.test_cbor.DummyClass").decode("ascii")),
+        ({(1, ): None}, "a1d9f3a08101f6")])
+    def test_tags(self, serializer, unserializer, value, document):
+        document = binascii.unhexlify(document)
+        assert serializer.convert(value) == document
+        assert unserializer.convert(document) == value
+
+    def test_shared_values(self, serializer, unserializer):
+        shared = [1]
+        document = serializer.convert([[2], shared, shared])
+        assert document == binascii.unhexlify("8381" "02" "d81c8101" "d81d00")
+        result = unserializer.convert(document)
+        assert result == [[2], [1], [1]]
+        assert result[1] is result[2]
+
+    def test_shared_values_order(self, serializer, unserializer):
+        # Identifiers are given by the serializer on first dereference,
+        # the documents must use the order of the shared values instead.
+        first, second = [1], [2]
+        value = {u"a": first, u"b": second, u"c": second, u"d": first}
+        document = serializer.convert(value)
+        decoded = cbor.decode(document)
+        assert [v.value for _, v in decoded.pairs][2:] == [1, 0]
+        result = unserializer.convert(document)
+        assert result[u"a"] is result[u"d"]
+        assert result[u"b"] is result[u"c"]
+
+    def test_circular_references(self, serializer, unserializer):
+        value = {u"list": []}
+        value[u"self"] = value
+        value[u"list"].append(value[u"list"])
+        result = unserializer.convert(serializer.convert(value))
+        assert result[u"self"] is result
+        assert result[u"list"][0] is result[u"list"]
+
+    def test_instances(self, serializer, unserializer):
+        instance = DummyClass()
+        instance.value = [instance, u"spam"]
+        document = serializer.convert(instance)
+        assert document.startswith(binascii.unhexlify("d81cd81b82"))
+        result = unserializer.convert(document)
+        assert isinstance(result, DummyClass)
+        assert result.value[0] is result
+        assert result.value[1] == u"spam"
+
+    def test_freezing(self, serializer):
+        instance = DummyClass()
+        instance.value = 42
+        frozen = cbor.decode(serializer.freeze(
+            [instance, DummyClass.dummy_method, dummy_function]))
+        assert frozen[0] == cbor.Map([(u"value", 42)])
+        assert frozen[1] == u"tests.test_cbor.DummyClass.dummy_method"
+        assert frozen[2] == u"tests.test_cbor.dummy_function"
+
+    def test_memoryview(self, serializer, unserializer):
+        value = [u"spam", b"\x00\xff", {u"a": 1.5}]
+        document = b"\x00\x00" + serializer.convert(value) + b"\x00"
+        view = memoryview(document)[2:-1]
+        assert unserializer.convert(view) == value
+        assert unserializer.convert(bytearray(view)) == value
+
+    def test_encode_into(self):
+        buf = bytearray(b"\xff")
+        assert cbor.encode([1, u"a"], buf) is buf
+        assert buf == bytearray(b"\xff\x82\x01\x61a")
+
+    @pytest.mark.parametrize("document", [
+        "", "82" "01", "8101" "02", "1c", "f8" "20", "63" "6162", "c1" "00",
+        "d81d" "00", "5f" "6161" "ff", "9f" "01", "ff", "c2" "01"])
+    def test_invalid_documents(self, unserializer, document):
+        with pytest.raises(ValueError):
+            unserializer.convert(binascii.unhexlify(document))
+
+
+class TestCBORSinglePassConverters(TestCBORConverters):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return cbor.Serializer(externalizer=helper.externalizer,
+                               single_pass=True)
+
+
+class TestCBORIterativeConverters(TestCBORConverters):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return cbor.Serializer(externalizer=helper.externalizer,
+                               iterative=True)
+
+    @pytest.fixture
+    def unserializer(self, helper):
+        return cbor.Unserializer(externalizer=helper.externalizer,
+                                 iterative=True)
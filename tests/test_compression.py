@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+
+from __future__ import absolute_import
+
+import io
+
+import pytest
+
+from serialization import banana, compression, json_, sexp
+
+CODECS = [compression.ZLIB, compression.LZMA, compression.ZSTD]
+
+
+@pytest.fixture(params=CODECS)
+def codec(request):
+    if request.param not in compression.available_codecs():
+        pytest.skip("%s is not installed" % request.param)
+    return request.param
+
+
+def documents(count):
+    serializer = json_.Serializer()
+    return [serializer.convert({u"id": i, u"name": u"item %d" % i,
+                                u"tags": [u"new", u"sale"], u"price": 1.5})
+            for i in range(count)]
+
+
+class TestCompression(object):
+
+    def test_converters(self, codec):
+        value = {u"spam": [1, 2.5, None, u"bacon" * 100], u"eggs": (1, 2)}
+        serializer = compression.Compressor(
+            codec, level=1, converter=json_.Serializer())
+        unserializer = compression.Decompressor(
+            codec, converter=json_.Unserializer())
+        compressed = serializer.convert(value)
+        assert isinstance(compressed, bytes)
+        assert len(compressed) < len(json_.Serializer().convert(value))
+        assert unserializer.convert(compressed) == value
+
+    def test_chained_converters(self, codec):
+        value = [u"spam", (1, 2.5), {u"a": -2 ** 40}]
+        serializer = sexp.Serializer(post_converter=compression.Compressor(
+            codec, converter=banana.Encoder()))
+        unserializer = sexp.Unserializer(
+            pre_converter=compression.Decompressor(
+                codec, converter=banana.Decoder(native_strings=True)))
+        assert unserializer.convert(serializer.convert(value)) == value
+
+    def test_streaming(self, codec):
+        value = [{u"index": i, u"text": u"value %d" % i} for i in range(5000)]
+        stream = io.BytesIO()
+        with compression.Writer(stream, codec) as writer:
+            json_.Serializer().dump(value, writer)
+        stream.seek(0)
+        reader = compression.Reader(stream, codec)
+        assert json_.Unserializer().load(reader) == value
+        assert reader.read() == b""
+
+    def test_flush(self, codec):
+        stream = io.BytesIO()
+        writer = compression.Writer(stream, codec)
+        writer.write(u"spam")
+        writer.flush()
+        if codec != compression.LZMA:
+            decompressor = compression.get_codec(codec).decompressor()
+            assert decompressor.decompress(stream.getvalue()) == b"spam"
+        writer.write(b"eggs")
+        writer.close()
+        with pytest.raises(ValueError):
+            writer.write(b"bacon")
+        assert compression.get_codec(codec).decompress(
+            stream.getvalue()) == b"spameggs"
+
+    def test_reader_sizes(self, codec):
+        data = bytes(bytearray(range(256))) * 1000
+        stream = io.BytesIO(compression.get_codec(codec).compress(data))
+        reader = compression.Reader(stream, codec)
+        chunks = []
+        while True:
+            chunk = reader.read(1000)
+            if not chunk:
+                break
+            assert len(chunk) <= 1000
+            chunks.append(chunk)
+        assert b"".join(chunks) == data
+
+    def test_truncated(self, codec):
+        compressed = compression.get_codec(codec).compress(b"spam" * 1000)
+        with pytest.raises(ValueError):
+            compression.Decompressor(codec).convert(compressed[:-4])
+        reader = compression.Reader(io.BytesIO(compressed[:-4]), codec)
+        with pytest.raises(ValueError):
+            reader.read()
+
+    def test_trailing_data(self, codec):
+        compressed = compression.get_codec(codec).compress(b"spam" * 1000)
+        for data in (compressed + b"\x00", compressed * 2):
+            with pytest.raises(ValueError):
+                compression.Decompressor(codec).convert(data)
+            reader = compression.Reader(io.BytesIO(data), codec)
+            with pytest.raises(ValueError):
+                reader.read()
+
+    def test_unknown_codec(self):
+        with pytest.raises(ValueError):
+            compression.Compressor("spam")
+
+
+class TestDictionary(object):
+
+    @pytest.mark.parametrize("name", [compression.ZLIB, compression.ZSTD])
+    def test_small_documents(self, name):
+        if name not in compression.available_codecs():
+            pytest.skip("%s is not installed" % name)
+        samples = documents(200)
+        dictionary = compression.train_dictionary(samples[:100], name,
+                                                  size=4096)
+        assert 0 < len(dictionary) <= 4096
+        plain = compression.Compressor(name)
+        trained = compression.Compressor(name, dictionary=dictionary)
+        decompressor = compression.Decompressor(name, dictionary=dictionary)
+        plain_size = sum(len(plain.convert(d)) for d in samples[100:])
+        trained_size = sum(len(trained.convert(d)) for d in samples[100:])
+        assert trained_size < plain_size * 0.75
+        for document in samples[100:]:
+            restored = decompressor.convert(trained.convert(document))
+            assert restored.decode("utf-8") == document
+
+    def test_size(self):
+        dictionary = compression.train_dictionary(
+            [b"%d spam bacon eggs %d" % (i, i * 7) for i in range(1000)],
+            size=100)
+        assert 0 < len(dictionary) <= 100
+        assert b"spam bacon eggs" in dictionary
+
+    def test_missing_dictionary(self):
+        samples = documents(20)
+        dictionary = compression.train_dictionary(samples)
+        compressed = compression.Compressor(
+            dictionary=dictionary).convert(samples[0])
+        with pytest.raises(Exception):
+            compression.Decompressor().convert(compressed)
+
+    def test_lzma(self):
+        with pytest.raises(ValueError):
+            compression.Compressor(compression.LZMA, dictionary=b"spam")
+        with pytest.raises(ValueError):
+            compression.train_dictionary(documents(2), compression.LZMA)
@@ -27,6 +27,7 @@
 
 from __future__ import absolute_import
 
+import io
 import types
 from itertools import permutations
 
@@ -37,7 +38,7 @@ import pytest
 from zope.interface import Interface
 from zope.interface.interface import InterfaceClass
 
-from serialization import reflect
+from serialization import formatable, reflect
 
 import serialization
 from serialization import json_ as json
@@ -60,6 +61,23 @@ class DummyInterface(Interface):
     pass
 
 
+@serialization.register
+class DummyModel(formatable.Formatable):
+
+    formatable.field("name", None)
+    formatable.field("size", 3, "custom_size")
+    formatable.field("items", [])
+    formatable.field("parent", None)
+
+
+@serialization.register
+class DummyVersionedModel(formatable.VersionedFormatable):
+
+    version = 2
+
+    formatable.field("name", None)
+
+
 class TestJSONConverters(object):
 
     @pytest.fixture
@@ -329,3 +347,511 @@ class TestJSONConverters(object):
                 yield (Klass, [c], str, [('[".ref", 1, {".type": "%s", "ref": '
                                           '[".deref", 1]}]') % (name, )], True)
         return convertion_table
+
+
+class TestJSONSinglePassConverters(TestJSONConverters):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return json.Serializer(
+            externalizer=helper.externalizer, sort_keys=True,
+            single_pass=True)
+
+
+class TestJSONIterativeConverters(TestJSONConverters):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return json.Serializer(
+            externalizer=helper.externalizer, sort_keys=True,
+            iterative=True)
+
+    @pytest.fixture
+    def unserializer(self, helper):
+        return json.Unserializer(externalizer=helper.externalizer,
+                                 iterative=True)
+
+
+class TestJSONDump(object):
+
+    @pytest.mark.parametrize("options", [
+        {},
+        {"sort_keys": True},
+        {"indent": 2, "separators": (",", ": "), "sort_keys": True},
+        {"single_pass": True},
+        {"iterative": True}])
+    def test_same_document(self, helper, options):
+        serializer = json.Serializer(externalizer=helper.externalizer,
+                                     **options)
+        caps = serializer.converter_capabilities
+        for _, value, _ in helper.symmetry_table(caps):
+            fp = io.StringIO()
+            serializer.dump(value, fp)
+            assert fp.getvalue() == serializer.convert(value)
+
+    @pytest.mark.parametrize("options", [{}, {"type_table": True},
+                                         {"single_pass": True}])
+    def test_chunked_writes(self, monkeypatch, options):
+        monkeypatch.setattr(json, "DUMP_BUFFER_SIZE", 16)
+        monkeypatch.setattr(json, "_EMITTER_BLOCK_SIZE", 16)
+        shared = [u"spam"]
+        value = [{u"a": shared, u"b": (shared, 42)}] * 10
+        serializer = json.Serializer(**options)
+
+        class File(object):
+            chunks = []
+
+            def write(self, text):
+                self.chunks.append(text)
+
+        fp = File()
+        serializer.dump(value, fp)
+        assert len(fp.chunks) > 1
+        assert u"".join(fp.chunks) == serializer.convert(value)
+
+    def test_emitted(self, monkeypatch):
+        # In two-pass mode the value is not packed before being written
+        serializer = json.Serializer(indent=2)
+        value = [{u"a": (1, 2.5), u"b": None}, set([u"spam"])]
+        expected = serializer.convert(value)
+
+        def fail(*args):
+            raise AssertionError("Packed tree encoded")
+
+        monkeypatch.setattr(serializer, "pack_value", fail)
+        monkeypatch.setattr(serializer._backend, "iterencode", fail)
+        fp = io.StringIO()
+        serializer.dump(value, fp)
+        assert fp.getvalue() == expected
+
+
+class TestJSONChunks(object):
+
+    @pytest.mark.parametrize("options", [{}, {"sort_keys": True},
+                                         {"indent": 4},
+                                         {"type_table": True}])
+    def test_symmetry(self, helper, options):
+        serializer = json.Serializer(externalizer=helper.externalizer,
+                                     **options)
+        unserializer = json.Unserializer(
+            externalizer=helper.externalizer,
+            type_table=options.get("type_table", False))
+
+        def convert_chunks(text):
+            # Split the multi-bytes characters too
+            data = text.encode("utf8")
+            return unserializer.convert_chunks(
+                data[i:i + 3] for i in range(0, len(data), 3))
+
+        caps = (serializer.converter_capabilities
+                & unserializer.converter_capabilities)
+        helper._check_symmetry(serializer.convert, convert_chunks,
+                               capabilities=caps)
+
+    def test_load_references(self):
+        a = [1]
+        a.append(a)
+        b = {u"list": a, u"tuple": (a, 2.5)}
+        b[u"self"] = b
+        text = json.Serializer(sort_keys=True).convert([b, a, b])
+        result = json.Unserializer().load(io.StringIO(text))
+        assert result[0] is result[2]
+        assert result[1][1] is result[1]
+        assert result[0][u"self"] is result[0]
+        assert result[0][u"list"] is result[1]
+        assert result[0][u"tuple"] == (result[1], 2.5)
+
+    @pytest.mark.parametrize("size", [1, 2, 3, 7])
+    def test_cut_strings(self, size):
+        value = {u'\\"k\\': [u'a\\\\"b', u"\\", u'"\\\\\\"', u"\u20ac\n"]}
+        text = json.Serializer().convert(value)
+        result = json.Unserializer().convert_chunks(
+            text[i:i + size] for i in range(0, len(text), size))
+        assert result == value
+
+    def test_long_string(self, monkeypatch):
+        scanned = []
+        scanstring = json.json.decoder.scanstring
+
+        def counting(text, end, *args):
+            scanned.append(len(text) - end)
+            return scanstring(text, end, *args)
+
+        monkeypatch.setattr(json.json.decoder, "scanstring", counting)
+        text = u'["%s", "x"]' % (u"\\u20ac" * 10000)
+        result = json.Unserializer().convert_chunks(
+            text[i:i + 100] for i in range(0, len(text), 100))
+        assert result == [u"\u20ac" * 10000, u"x"]
+        # The cut string is only scanned again once complete
+        assert sum(scanned) < 2 * len(text)
+
+    @pytest.mark.parametrize("text", [u"", u"[1, 2", u"[1, 2]]", u"[1 2]",
+                                      u'{"a" 1}', u"[tru]", u'["spam]',
+                                      u"[1.e5]", u'[".deref", 1]'])
+    def test_invalid_documents(self, text):
+        with pytest.raises(ValueError):
+            json.Unserializer().convert_chunks([text])
+
+
+class TestJSONBackends(object):
+
+    @pytest.mark.parametrize("name", json.available_backends())
+    @pytest.mark.parametrize("sort_keys", [False, True])
+    def test_symmetry(self, helper, name, sort_keys):
+        serializer = json.Serializer(externalizer=helper.externalizer,
+                                     sort_keys=sort_keys, backend=name)
+        unserializer = json.Unserializer(externalizer=helper.externalizer,
+                                         backend=name)
+        helper.check_symmetry(serializer, unserializer)
+
+    def test_fallback(self, monkeypatch):
+
+        class Missing(json.Backend):
+            name = "missing"
+
+            def __init__(self, **options):
+                raise ImportError("missing")
+
+        monkeypatch.setitem(json._backends, Missing.name, Missing)
+        assert "missing" not in json.available_backends()
+        backend = json.get_backend(["missing"], sort_keys=True)
+        assert isinstance(backend, json.StdlibBackend)
+        serializer = json.Serializer(sort_keys=True, backend="missing")
+        assert serializer.convert({"b": 1, "a": (2, )}) == \
+            '{"a": [".tuple", 2], "b": 1}'
+        with pytest.raises(ValueError):
+            json.get_backend("unknown")
+
+    def test_orjson(self):
+        pytest.importorskip("orjson")
+        backend = json.get_backend(json.FAST_BACKENDS)
+        assert isinstance(backend, json.OrjsonBackend)
+        # Unsupported options
+        backend = json.get_backend("orjson", indent=4)
+        assert isinstance(backend, json.StdlibBackend)
+        backend = json.get_backend("orjson", separators=(", ", ": "))
+        assert isinstance(backend, json.StdlibBackend)
+        # Documents orjson cannot handle
+        serializer = json.Serializer(backend="orjson")
+        unserializer = json.Unserializer(backend="orjson")
+        value = [2 ** 70, -2 ** 70, u"\xe9"]
+        assert serializer.convert(value) == '[1180591620717411303424,' \
+            ' -1180591620717411303424, "\\u00e9"]'
+        assert unserializer.convert(serializer.convert(value)) == value
+        assert unserializer.convert('[NaN]')[0] != 0
+        assert serializer.convert([1, {"a": None}]) == '[1,{"a":null}]'
+
+
+@pytest.mark.parametrize("name", ["orjson", "ujson", "rapidjson"])
+class TestJSONBackendEquivalence(object):
+
+    def check(self, name, value, **options):
+        pytest.importorskip(name)
+        reference = json.Serializer(**options)
+        serializer = json.Serializer(backend=name, **options)
+        unserializer = json.Unserializer(backend=name)
+        document = serializer.convert(value)
+        expected = json.Unserializer().convert(reference.convert(value))
+        # Documents are read the same by both and restored the same
+        assert repr(unserializer.convert(document)) == repr(expected)
+        assert repr(json.Unserializer().convert(document)) == repr(expected)
+        assert repr(unserializer.convert(reference.convert(value))) == \
+            repr(expected)
+        return expected
+
+    def test_non_finite_floats(self, name):
+        value = [float("nan"), float("inf"), -float("inf"), None, 1.5]
+        result = self.check(name, value)
+        assert result[0] != result[0]
+        assert result[1:] == [float("inf"), -float("inf"), None, 1.5]
+        self.check(name, {u"a": [{u"b": float("nan")}]}, sort_keys=True)
+
+    def test_bytes_keys(self, name):
+        value = {b"spam": 1, u"bacon": b"eggs", b"\xc3\xa9": [b"", u"\xe9"]}
+        assert self.check(name, value, sort_keys=True) == \
+            {u"spam": 1, u"bacon": b"eggs", u"\xe9": [b"", u"\xe9"]}
+
+    def test_large_ints(self, name):
+        value = [2 ** 63 - 1, -2 ** 63, 2 ** 63, 2 ** 64, -2 ** 63 - 1,
+                 2 ** 70, -2 ** 70, 10 ** 30]
+        assert self.check(name, value) == value
+
+
+class PackingSerializer(json.Serializer):
+    """Encodes the packed values instead of emitting the document."""
+
+    def post_convertion(self, data):
+        return json.Serializer.post_convertion(self, data)
+
+
+class TestJSONEmitter(object):
+
+    @pytest.mark.parametrize("options", [
+        {},
+        {"sort_keys": True},
+        {"separators": (",", ":")},
+        {"indent": 2},
+        {"indent": "\t", "separators": (";", "="), "sort_keys": True},
+        {"force_unicode": True},
+        {"type_table": True},
+        {"type_table": True, "indent": 2, "sort_keys": True}])
+    def test_same_document(self, helper, options):
+        serializer = json.Serializer(externalizer=helper.externalizer,
+                                     **options)
+        reference = PackingSerializer(externalizer=helper.externalizer,
+                                      **options)
+        assert serializer._emitter is not None
+        assert reference._emitter is None
+        values = []
+        for _, examples, _ in helper.symmetry_table(json.JSON_FREEZER_CAPS):
+            values.extend(examples)
+        a = [1]
+        a.append(a)
+        values.append([a, {u"a": a, u"nan": float("nan")}, a])
+        for value in values + [values]:
+            assert serializer.convert(value) == reference.convert(value)
+            assert serializer.freeze(value) == reference.freeze(value)
+
+    def test_overridden_packer(self):
+
+        class Custom(json.Serializer):
+
+            def pack_tuple(self, data):
+                return [u".pair"] + data
+
+        assert Custom().convert([(1, 2)]) == '[[".pair", 1, 2]]'
+
+    def test_overridden_hooks(self):
+
+        class Custom(json.Serializer):
+
+            def pack_item(self, data):
+                key, value = data
+                return key.upper(), value
+
+            def pack_reference(self, data):
+                return [u".shared"] + data
+
+        serializer = Custom()
+        assert serializer._emitter is None
+        shared = [1]
+        assert serializer.convert({u"a": shared, u"b": shared}) == \
+            '{"A": [".shared", 1, [1]], "B": [".deref", 1]}'
+        fp = io.StringIO()
+        serializer.dump({u"a": 1}, fp)
+        assert fp.getvalue() == '{"A": 1}'
+
+
+class TestJSONLines(object):
+
+    def test_symmetry(self):
+        a = [u"shared"]
+        values = [[a, a], {u"a": a, u"b": (a, u"multi\nline")}, 42, a]
+        fp = io.StringIO()
+        json.Serializer().dump_lines(values, fp)
+        text = fp.getvalue()
+        assert text.count(u"\n") == len(values)
+        # Every line has its own references
+        assert text.splitlines()[3] == u'["shared"]'
+        fp.seek(0)
+        results = list(json.Unserializer().load_lines(fp))
+        assert results == values
+        assert results[0][0] is results[0][1]
+        assert results[1][u"a"] is results[1][u"b"][0]
+        assert results[0][0] is not results[1][u"a"]
+
+    def test_lazy_reading(self):
+        lines = iter([b'[1, 2]\n', b'\n', b'{"a": [".tuple", 3]}\n'])
+        results = json.Unserializer().load_lines(lines)
+        assert next(results) == [1, 2]
+        assert next(lines) == b'\n'
+        assert list(results) == [{u"a": (3, )}]
+
+    def test_writer(self):
+        fp = io.StringIO()
+        with json.LinesWriter(fp, buffer_size=20) as writer:
+            writer.write([1, 2])
+            assert fp.getvalue() == u""
+            writer.write_many([u"spam" * 5, None])
+            assert fp.getvalue() == u'[1, 2]\n"%s"\n' % (u"spam" * 5, )
+        assert fp.getvalue().splitlines()[-1] == u"null"
+        with pytest.raises(ValueError):
+            json.LinesWriter(fp, json.Serializer(indent=2))
+
+
+class TestJSONBytesEncoding(object):
+
+    @pytest.mark.parametrize("encoding, expected", [
+        (json.BYTES_UTF8, '[[".enc", "UTF8", "spam"], [".bytes", "/w=="]]'),
+        (json.BYTES_BASE64, '[[".bytes", "c3BhbQ=="], [".bytes", "/w=="]]'),
+        (json.BYTES_HEX, '[[".bytes", "7370616d", "HEX"], '
+                         '[".bytes", "ff", "HEX"]]')])
+    def test_encodings(self, encoding, expected):
+        serializer = json.Serializer(bytes_encoding=encoding)
+        assert serializer.convert([b"spam", b"\xff"]) == expected
+        unserializer = json.Unserializer()
+        assert unserializer.convert(expected) == [b"spam", b"\xff"]
+
+    @pytest.mark.skipif(not PY3, reason="base85 requires python 3")
+    def test_base85(self):
+        data = bytes(bytearray(range(256)))
+        serializer = json.Serializer(bytes_encoding=json.BYTES_BASE85)
+        result = serializer.convert(data)
+        assert result.endswith('"BASE85"]')
+        assert json.Unserializer().convert(result) == data
+
+    @pytest.mark.parametrize("options", [
+        {}, {"single_pass": True}, {"bytes_encoding": json.BYTES_HEX}])
+    def test_buffers(self, options):
+        serializer = json.Serializer(**options)
+        data = b"\x00\xffspam"
+        blob = bytearray(data)
+        view = memoryview(blob)[2:]
+        result = serializer.convert([blob, view, data])
+        assert json.Unserializer().convert(result) == [data, data[2:], data]
+
+    @pytest.mark.parametrize("encoding", sorted(
+        json.PreSerializer._bytes_encoders))
+    def test_strided_views(self, encoding):
+        serializer = json.Serializer(bytes_encoding=encoding)
+        view = memoryview(b"abcdef\xff\xfe")[::2]
+        result = serializer.convert([view, view])
+        assert json.Unserializer().convert(result) == [b"ace\xff"] * 2
+
+    def test_unsupported(self):
+        with pytest.raises(ValueError):
+            json.Serializer(bytes_encoding="ROT13")
+        with pytest.raises(ValueError):
+            json.Unserializer().convert('[".bytes", "spam", "ROT13"]')
+
+
+class TestJSONTypeTable(object):
+
+    @pytest.mark.parametrize("options", [
+        {}, {"single_pass": True}, {"iterative": True}])
+    def test_symmetry(self, helper, options):
+        serializer = json.Serializer(externalizer=helper.externalizer,
+                                     type_table=True, **options)
+        unserializer = json.Unserializer(externalizer=helper.externalizer,
+                                         iterative="iterative" in options,
+                                         type_table=True)
+        caps = (serializer.converter_capabilities
+                & unserializer.converter_capabilities)
+        helper._check_symmetry(serializer.convert, unserializer.convert,
+                               capabilities=caps)
+
+    def test_document(self):
+        serializer = json.Serializer(type_table=True)
+        values = [DummyClass(), DummyClass, DummyInterface, DummyClass()]
+        text = serializer.convert(values)
+        name = reflect.canonical_name(DummyClass)
+        assert text.count(name) == 1
+        assert text.startswith('[".types", ["%s", ' % name)
+        assert '{".type": 0}' in text
+        assert '[".type", 0]' in text
+        result = json.Unserializer(type_table=True).convert(text)
+        assert isinstance(result[0], DummyClass)
+        assert result[1] is DummyClass
+        assert result[2] is DummyInterface
+        assert isinstance(result[3], DummyClass)
+
+    def test_many_documents(self):
+        serializer = json.Serializer(type_table=True)
+        texts = list(serializer.convert_many([DummyClass, [1, int]]))
+        assert texts[0] == ('[".types", ["%s"], [".type", 0]]'
+                            % reflect.canonical_name(DummyClass))
+        assert texts[1] == '[".types", ["builtins.int"], [1, [".type", 0]]]'
+        unserializer = json.Unserializer(type_table=True)
+        assert list(unserializer.convert_many(texts)) == [DummyClass,
+                                                          [1, int]]
+
+    def test_nested_lookalike(self):
+        name = reflect.canonical_name(DummyClass)
+        text = ('[".types", ["%s"], [[".types", ["bogus"]], '
+                '{".type": 0}]]' % name)
+        unserializer = json.Unserializer(type_table=True)
+        expected = unserializer.convert(text)
+        assert expected[0] == [json.TYPES_ATOM, [u"bogus"]]
+        assert isinstance(expected[1], DummyClass)
+        result = unserializer.convert_chunks(
+            text[i:i + 5] for i in range(0, len(text), 5))
+        assert result[0] == expected[0]
+        assert isinstance(result[1], DummyClass)
+
+    def test_lookalike_values(self):
+        value = [json.TYPES_ATOM, [u"a"], 3]
+        text = json.Serializer().convert(value)
+        assert json.Unserializer().convert(text) == value
+        assert json.Unserializer().convert_chunks([text]) == value
+        # Serializers with a type table always write it
+        serializer = json.Serializer(type_table=True)
+        text = serializer.convert(value)
+        assert text == '[".types", [], [".types", ["a"], 3]]'
+        unserializer = json.Unserializer(type_table=True)
+        assert unserializer.convert(text) == value
+        assert unserializer.convert_chunks([text]) == value
+
+
+class TestJSONFormatable(object):
+
+    def generic(self, serializer):
+        serializer._specialized = False
+        return serializer
+
+    def models(self):
+        root = DummyModel(name=u"root", items=[(1, 2.5), None])
+        child = DummyModel(size=None, parent=root)
+        root.items.append(child)
+        return [root, child, DummyModel(), DummyVersionedModel(name=u"v")]
+
+    @pytest.mark.parametrize("options", [
+        {}, {"sort_keys": True}, {"indent": 2}, {"type_table": True}])
+    def test_same_document(self, options):
+        serializer = json.Serializer(**options)
+        generic = self.generic(json.Serializer(**options))
+        reference = self.generic(PackingSerializer(**options))
+        assert serializer._specialized
+        values = self.models()
+        text = serializer.convert(values)
+        assert text == generic.convert(values)
+        assert text == reference.convert(values)
+        assert json.Serializer(single_pass=True, **options).convert(
+            values) == text
+
+    @pytest.mark.parametrize("sort_keys", [False, True])
+    def test_symmetry(self, sort_keys):
+        text = json.Serializer(sort_keys=sort_keys).convert(self.models())
+        unserializer = json.Unserializer()
+        assert unserializer._specialized
+        result = unserializer.convert(text)
+        root, child, default, versioned = result
+        assert root.name == u"root"
+        assert root.size == 3
+        assert root.items[:2] == [(1, 2.5), None]
+        assert root.items[2] is child
+        assert child.parent is root
+        assert child.size is None
+        assert default == DummyModel()
+        assert default.items is not DummyModel().items
+        assert versioned.name == u"v"
+
+    def test_missing_fields(self):
+        text = '{".type": "%s", "custom_size": 7}' % (
+            reflect.canonical_name(DummyModel), )
+        result = json.Unserializer().convert(text)
+        assert result == DummyModel(size=7)
+
+    def test_not_specialized(self):
+        assert json._formatable_flattener(DummyModel) is not None
+        assert json._formatable_flattener(DummyVersionedModel) is None
+        assert json._formatable_unpacker(DummyVersionedModel) is None
+        assert json._formatable_flattener(DummyClass) is None
+
+        class Custom(json.Serializer):
+
+            def pack_instance(self, data):
+                return json.Serializer.pack_instance(self, data)
+
+        assert not Custom()._specialized
+        assert not json.Serializer(single_pass=True)._specialized
+        assert not json.Unserializer(iterative=True)._specialized
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# F3AT - Flumotion Asynchronous Autonomous Agent Toolkit
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# See "LICENSE.GPL" in the source distribution for more information.
+# Headers in this file shall remain intact.
+
+from __future__ import absolute_import
+
+import struct
+
+import pytest
+
+from serialization import msgpack_ as msgpack
+
+import serialization
+
+
+@serialization.register
+class DummyClass(serialization.Serializable):
+
+    def dummy_method(self):
+        pass
+
+
+def dummy_function():
+    pass
+
+
+class TestMsgPackConverters(object):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return msgpack.Serializer(externalizer=helper.externalizer)
+
+    @pytest.fixture
+    def unserializer(self, helper):
+        return msgpack.Unserializer(externalizer=helper.externalizer)
+
+    def test_symmetry(self, helper, serializer, unserializer):
+        helper.check_symmetry(serializer, unserializer)
+
+    @pytest.mark.parametrize("value, document", [
+        (None, b"\xc0"),
+        (True, b"\xc3"),
+        (False, b"\xc2"),
+        (0, b"\x00"),
+        (127, b"\x7f"),
+        (128, b"\xcc\x80"),
+        (-1, b"\xff"),
+        (-32, b"\xe0"),
+        (-33, b"\xd0\xdf"),
+        (65536, b"\xce\x00\x01\x00\x00"),
+        (2 ** 64 - 1, b"\xcf" + b"\xff" * 8),
+        (-2 ** 63, b"\xd3\x80" + b"\x00" * 7),
+        (2 ** 64, b"\xc7\x09\x0a\x01" + b"\x00" * 8),
+        (-2 ** 64 - 1, b"\xc7\x09\x0a\xfe" + b"\xff" * 8),
+        (1.5, b"\xcb" + struct.pack(">d", 1.5)),
+        (u"", b"\xa0"),
+        (u"\xe1", b"\xa2\xc3\xa1"),
+        (u"x" * 32, b"\xd9\x20" + b"x" * 32),
+        (b"\xff", b"\xc4\x01\xff"),
+        ([], b"\x90"),
+        ([1, [2]], b"\x92\x01\x91\x02"),
+        ({}, b"\x80"),
+        ({1: u"a"}, b"\x81\x01\xa1a"),
+        ((), b"\xd4\x01\x90"),
+        ((1, 2), b"\xc7\x03\x01\x92\x01\x02"),
+        (set([1]), b"\xd5\x02\x91\x01"),
+        (tuple(range(20)),
+         b"\xc7\x17\x01\xdc\x00\x14" + bytes(bytearray(range(20)))),
+        (DummyClass, b"\xc7\x1e\x07\xbdtests.test_msgpack.DummyClass"),
+        (dummy_function,
+         b"\xc7\x23\x09\xd9\x21tests.test_msgpack.dummy_function")])
+    def test_documents(self, serializer, unserializer, value, document):
+        assert serializer.convert(value) == document
+        assert unserializer.convert(document) == value
+
+    def test_long_ext(self, serializer, unserializer):
+        value = (u"x" * 70000, )
+        document = serializer.convert(value)
+        assert document[:6] == b"\xc9\x00\x01\x11\x76\x01"
+        assert unserializer.convert(document) == value
+        value = (u"x" * 300, )
+        document = serializer.convert(value)
+        assert document[:4] == b"\xc8\x01\x30\x01"
+        assert unserializer.convert(document) == value
+
+    def test_non_string_keys(self, helper, serializer, unserializer):
+        value = {(1, u"a"): [None], 2.5: DummyClass, None: {}, True: 1}
+        result = unserializer.convert(serializer.convert(value))
+        assert result == value
+
+    def test_references(self, serializer, unserializer):
+        shared = [1, 2]
+        value = {u"a": shared, u"b": shared}
+        value[u"c"] = value
+        document = serializer.convert(value)
+        result = unserializer.convert(document)
+        assert result[u"a"] is result[u"b"]
+        assert result[u"c"] is result
+        assert result[u"a"] == [1, 2]
+
+    def test_instances(self, serializer, unserializer):
+        instance = DummyClass()
+        instance.value = [instance, u"spam"]
+        result = unserializer.convert(serializer.convert(instance))
+        assert isinstance(result, DummyClass)
+        assert result.value[0] is result
+        assert result.value[1] == u"spam"
+
+    def test_freezing(self, serializer):
+        instance = DummyClass()
+        instance.value = 42
+        frozen = msgpack.decode(serializer.freeze(
+            [instance, DummyClass.dummy_method, dummy_function]))
+        assert frozen[0] == msgpack.Map([(u"value", 42)])
+        assert frozen[1] == u"tests.test_msgpack.DummyClass.dummy_method"
+        assert frozen[2] == u"tests.test_msgpack.dummy_function"
+
+    @pytest.mark.parametrize("document", [
+        b"", b"\x92\x01", b"\x91\x01\x02", b"\xc1", b"\xa3ab",
+        b"\xd4\x7f\x00", b"\xc7\x02\x01\x90", b"\xc4\x05ab"])
+    def test_invalid_documents(self, unserializer, document):
+        with pytest.raises(ValueError):
+            unserializer.convert(document)
+
+    def test_encode_decode(self):
+        value = [None, True, 1, -1, 2 ** 40, 0.5, u"€", b"\x00",
+                 msgpack.Map([([1], u"list key")]),
+                 msgpack.ExtType(msgpack.EXT_TUPLE, [1, u"a"])]
+        assert msgpack.decode(msgpack.encode(value)) == value
+        with pytest.raises(TypeError):
+            msgpack.encode(object())
+
+
+class TestMsgPackSinglePassConverters(TestMsgPackConverters):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return msgpack.Serializer(externalizer=helper.externalizer,
+                                  single_pass=True)
+
+
+class TestMsgPackIterativeConverters(TestMsgPackConverters):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return msgpack.Serializer(externalizer=helper.externalizer,
+                                  iterative=True)
+
+    @pytest.fixture
+    def unserializer(self, helper):
+        return msgpack.Unserializer(externalizer=helper.externalizer,
+                                    iterative=True)
@@ -817,3 +817,24 @@ class TestPyTreeConverters(object):
                      (Deref(1), (Deref(1), (Deref(1), ))))], True)
 
         return convertion_table
+
+
+class TestPyTreeSinglePassConverters(TestPyTreeConverters):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return pytree.Serializer(externalizer=helper.externalizer,
+                                 single_pass=True)
+
+
+class TestPyTreeIterativeConverters(TestPyTreeConverters):
+
+    @pytest.fixture
+    def serializer(self, helper):
+        return pytree.Serializer(externalizer=helper.externalizer,
+                                 iterative=True)
+
+    @pytest.fixture
+    def unserializer(self, helper):
+        return pytree.Unserializer(externalizer=helper.externalizer,
+                                   iterative=True)
@@ -191,8 +191,7 @@ class ConverterTestHelper(object):
             self, serializer, unserializer, convertion_table):
 
         def inverter(gen):
-            while True:
-                record = next(gen)
+            for record in gen:
                 if len(record) == 5:
                     t1, v1, t2, v2, c = record
                     yield t2, v2, t1, v1, c